@@ -4,10 +4,17 @@ from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from database.models import Database, init_db, ACCOUNTS_FILE, GROUPS_FILE, POSTS_FILE, SETTINGS_FILE
+from aiogram.fsm.storage.redis import RedisStorage
+from database.models import Database, init_db
 from utils.session_manager import SessionManager
-from utils.posting_manager import PostingManager, PostingPool
-from config import BOT_TOKEN, MAX_THREADS, DEFAULT_DELAY, MAX_RETRIES, SESSIONS_DIR
+from utils.posting_manager import PostingManager, PostingPool, FanOut
+from utils.scheduler import PostScheduler
+from utils.automation import AutomationEngine
+from utils.rate_limiter import rate_limiter
+from utils.cooldowns import cooldowns
+from utils.peer_cache import peer_cache
+from utils.membership import membership
+from config import BOT_TOKEN, MAX_THREADS, DEFAULT_DELAY, MAX_RETRIES, SESSIONS_DIR, REDIS_URL
 import logging
 from loguru import logger
 import sys
@@ -17,7 +24,7 @@ from telethon.tl.functions.messages import ImportChatInviteRequest
 from telethon.errors import UserNotParticipantError, InviteHashInvalidError, InviteHashExpiredError, ChannelPrivateError, UserAlreadyParticipantError
 from telethon.tl.types import PeerChannel
 import time
-from typing import Optional
+from typing import Optional, Set
 import os
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import re
@@ -45,7 +52,11 @@ logger.add(
 
 # Инициализация бота
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+if REDIS_URL:
+    # Состояния диалогов в Redis переживают перезапуск и общие для нескольких процессов бота
+    storage = RedisStorage.from_url(REDIS_URL)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
 # Состояния FSM
@@ -82,6 +93,9 @@ class GroupStates(StatesGroup):
 session_manager = SessionManager()
 posting_pool = PostingPool(max_threads=MAX_THREADS)
 
+# Интервал обновления сообщения с прогрессом рассылки в секундах
+PROGRESS_INTERVAL = 2
+
 def get_main_keyboard() -> types.ReplyKeyboardMarkup:
     """Создание основной клавиатуры"""
     keyboard = [
@@ -263,8 +277,7 @@ async def process_2fa(message: types.Message, state: FSMContext):
 @dp.message(lambda m: m.text == "📊 Статус аккаунтов")
 async def show_accounts_status(message: types.Message):
     try:
-        data = await Database._read_json(ACCOUNTS_FILE)
-        accounts = data.get("accounts", [])
+        accounts = await Database.get_accounts()
         
         if not accounts:
             await message.answer(
@@ -366,15 +379,7 @@ async def freeze_account(callback: types.CallbackQuery):
         phone = callback.data.replace('account_freeze_', '')
         
         # Получаем данные аккаунта
-        data = await Database._read_json(ACCOUNTS_FILE)
-        accounts = data.get("accounts", [])
-        account = None
-        
-        # Ищем аккаунт
-        for acc in accounts:
-            if acc["phone"] == phone:
-                account = acc
-                break
+        account = await Database.get_account_by_phone(phone)
         
         if not account:
             await callback.message.edit_text("❌ Аккаунт не найден")
@@ -396,15 +401,7 @@ async def unfreeze_account(callback: types.CallbackQuery):
         phone = callback.data.replace('account_unfreeze_', '')
         
         # Получаем данные аккаунта
-        data = await Database._read_json(ACCOUNTS_FILE)
-        accounts = data.get("accounts", [])
-        account = None
-        
-        # Ищем аккаунт
-        for acc in accounts:
-            if acc["phone"] == phone:
-                account = acc
-                break
+        account = await Database.get_account_by_phone(phone)
         
         if not account:
             await callback.message.edit_text("❌ Аккаунт не найден")
@@ -689,18 +686,17 @@ async def select_bulk_group_for_post(callback: types.CallbackQuery, state: FSMCo
         data = await state.get_data()
         selected_groups = data.get('selected_groups', [])
         
-        # Получаем ID групп из оптомгруппы
-        bulk_group_ids = [g['id'] for g in bulk_group['groups']]
+        # Множество ID групп оптомгруппы
+        bulk_group_ids = bulk_group['group_ids']
         
         # Проверяем, выбрана ли эта оптомгруппа
-        is_selected = all(g_id in selected_groups for g_id in bulk_group_ids)
+        is_selected = bulk_group_ids <= set(selected_groups)
         
         # Удаляем все группы из других оптомгрупп
         bulk_groups = await Database.get_bulk_groups()
-        other_bulk_group_ids = []
-        for bg in bulk_groups:
-            if bg['id'] != bulk_group_id:
-                other_bulk_group_ids.extend(g['id'] for g in bg['groups'])
+        other_bulk_group_ids = set().union(
+            *(bg['group_ids'] for bg in bulk_groups if bg['id'] != bulk_group_id)
+        )
                 
         # Очищаем выбранные группы от групп из других оптомгрупп
         selected_groups = [g for g in selected_groups if g not in other_bulk_group_ids]
@@ -710,11 +706,10 @@ async def select_bulk_group_for_post(callback: types.CallbackQuery, state: FSMCo
             selected_groups = [g for g in selected_groups if g not in bulk_group_ids]
         else:
             # Если не выбрана - добавляем её группы
-            for g_id in bulk_group_ids:
-                if g_id not in selected_groups:
-                    selected_groups.append(g_id)
+            selected_groups.extend(sorted(bulk_group_ids.difference(selected_groups)))
             
         await state.update_data(selected_groups=selected_groups)
+        selected_set = set(selected_groups)
         
         # Обновляем клавиатуру
         groups = await Database.get_active_groups()
@@ -726,7 +721,7 @@ async def select_bulk_group_for_post(callback: types.CallbackQuery, state: FSMCo
             keyboard.extend([
                 [
                     types.InlineKeyboardButton(
-                        text=f"{'✅' if all(g['id'] in selected_groups for g in bg['groups']) else '📦'} "
+                        text=f"{'✅' if bg['group_ids'] <= selected_set else '📦'} "
                              f"{bg['name']} ({len(bg['groups'])} групп)",
                         callback_data=f"select_bulk_group_post_{bg['id']}"
                     )
@@ -787,6 +782,7 @@ async def select_group(callback: types.CallbackQuery, state: FSMContext):
             selected_groups.append(group_id)
             
         await state.update_data(selected_groups=selected_groups)
+        selected_set = set(selected_groups)
         
         # Обновляем клавиатуру
         groups = await Database.get_active_groups()
@@ -799,7 +795,7 @@ async def select_group(callback: types.CallbackQuery, state: FSMContext):
             keyboard.extend([
                 [
                     types.InlineKeyboardButton(
-                        text=f"{'✅' if set([g['id'] for g in bg['groups']]).issubset(set(selected_groups)) else '📦'} "
+                        text=f"{'✅' if bg['group_ids'] <= selected_set else '📦'} "
                              f"{bg['name']} ({len(bg['groups'])} групп)",
                         callback_data=f"select_bulk_group_post_{bg['id']}"
                     )
@@ -974,73 +970,56 @@ async def confirm_accounts(callback: types.CallbackQuery, state: FSMContext):
             "Пожалуйста, подождите."
         )
 
-        success_count = 0
-        error_count = 0
-        account_index = 0
-        total_accounts = len(selected_accounts)
         total_groups = len(selected_groups)
-        processed = 0
         start_time = time.time()
 
-        # Получаем информацию о группах
-        groups_info = []
-        for group_id in selected_groups:
-            group = await Database.get_group_by_id(group_id)
-            if group:
-                groups_info.append({
-                    'id': group['group_id'],
-                    'title': group['title']
-                })
-
-        # Распределяем группы между аккаунтами
-        for group_info in groups_info:
-            # Получаем следующий аккаунт
-            account = await Database.get_account_by_id(selected_accounts[account_index])
-            if not account:
-                continue
+        # Получаем информацию о группах и аккаунтах одним запросом
+        groups, missing_groups = await Database.get_groups_by_ids(selected_groups)
+        accounts, missing_accounts = await Database.get_accounts_by_ids(selected_accounts)
+        if missing_groups:
+            logger.warning(f"Группы не найдены в базе: {missing_groups}")
+        if missing_accounts:
+            logger.warning(f"Аккаунты не найдены в базе: {missing_accounts}")
 
-            account_phone = account['phone']
-            group_id = group_info['id']
-            group_title = group_info['title']
+        if not accounts:
+            await callback.message.edit_text("❌ Выбранные аккаунты не найдены")
+            await state.clear()
+            return
 
-            try:
-                # Обновляем статус
-                processed += 1
-                progress = int((processed / total_groups) * 100)
-                current_time = time.time() - start_time
-                await callback.message.edit_text(
-                    f"🔄 Отправка... {progress}%\n"
-                    f"📱 Аккаунт: {account_phone}\n"
-                    f"📢 Группа: {group_title}\n\n"
-                    f"✅ Успешно: {success_count}\n"
-                    f"❌ Ошибок: {error_count}\n"
-                    f"⏱ Прошло времени: {current_time:.1f} сек"
-                )
+        results = {"success": 0, "error": 0}
 
-                # Создаем клиент для аккаунта
-                client = await session_manager.get_client(account['session_file'])
-                posting_manager = PostingManager(client, Database, bot)
-                
-                logger.info(f"Создана задача отправки в группу {group_title} через аккаунт {account_phone}")
-                
-                # Отправляем сообщение
-                success, message = await posting_manager.send_post(group_id, message_data)
-                
-                # Закрываем клиент
-                await client.disconnect()
+        async def on_result(account: dict, group: dict, success: bool, message: str):
+            if success:
+                logger.info(f"✅ Успешно отправлено в группу {group['title']} через аккаунт {account['phone']}")
+                results["success"] += 1
+            else:
+                logger.error(f"❌ Ошибка при отправке в группу {group['title']} через аккаунт {account['phone']}: {message}")
+                results["error"] += 1
+
+        async def report_progress():
+            # Прогресс обновляется по таймеру, а не перед каждой отправкой
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                processed = results["success"] + results["error"]
+                try:
+                    await callback.message.edit_text(
+                        f"🔄 Отправка... {int(processed / total_groups * 100)}%\n"
+                        f"📱 Аккаунтов: {len(accounts)}\n"
+                        f"📢 Групп: {processed} из {total_groups}\n\n"
+                        f"✅ Успешно: {results['success']}\n"
+                        f"❌ Ошибок: {results['error']}\n"
+                        f"⏱ Прошло времени: {time.time() - start_time:.1f} сек"
+                    )
+                except Exception as e:
+                    logger.debug(f"Не удалось обновить прогресс отправки: {str(e)}")
 
-                if success:
-                    logger.info(f"✅ Успешно отправлено в группу {group_title} через аккаунт {account_phone}")
-                    success_count += 1
-                else:
-                    logger.error(f"❌ Ошибка при отправке в группу {group_title} через аккаунт {account_phone}: {message}")
-                    error_count += 1
-            except Exception as e:
-                logger.error(f"❌ Ошибка при отправке в группу {group_title} через аккаунт {account_phone}: {str(e)}")
-                error_count += 1
-            
-            # Переходим к следующему аккаунту
-            account_index = (account_index + 1) % total_accounts
+        progress_task = asyncio.create_task(report_progress())
+        try:
+            success_count, error_count = await FanOut(session_manager, Database, bot, posting_pool).run(
+                accounts, groups, message_data, kind="instant", run=int(start_time), on_result=on_result
+            )
+        finally:
+            progress_task.cancel()
 
         # Отправляем финальные результаты
         total_time = time.time() - start_time
@@ -1124,6 +1103,7 @@ async def process_schedule(message: types.Message, state: FSMContext):
             accounts=selected_accounts,
             schedule_time=int(schedule_time.timestamp())
         )
+        post_scheduler.schedule(post_id, int(schedule_time.timestamp()))
         
         # Очищаем состояние
         await state.clear()
@@ -1162,6 +1142,7 @@ async def process_delay(message: types.Message, state: FSMContext):
             accounts=data['selected_accounts'],
             schedule_time=schedule_time
         )
+        post_scheduler.schedule(post_id, schedule_time)
         
         # Очищаем состояние
         await state.clear()
@@ -1206,7 +1187,8 @@ async def settings_menu(message: types.Message):
             f"⚙️ Текущие настройки:\n\n"
             f"⏱ Интервал между постами: {format_time(delay)}\n"
             f"🔄 Количество потоков: {threads}\n"
-            f"🔁 Количество попыток: {retries}"
+            f"🔁 Количество попыток: {retries}\n\n"
+            f"📤 Отправок сейчас: {posting_pool.in_flight}, в очереди: {posting_pool.queue_depth}"
         )
         
         await message.answer(current_settings, reply_markup=keyboard)
@@ -1308,7 +1290,7 @@ async def process_threads(message: types.Message, state: FSMContext):
             await message.answer("⚠️ Большое количество потоков может привести к блокировке!")
         
         await Database.update_setting('max_threads', threads)
-        posting_pool.max_threads = threads  # Обновляем текущий пул
+        await posting_pool.resize(threads)  # Ожидающие отправки сразу займут новые потоки
         await state.clear()
         await message.answer(f"✅ Количество потоков установлено: {threads}")
         
@@ -1655,8 +1637,8 @@ async def edit_bulk_group(callback: types.CallbackQuery, state: FSMContext):
         # Устанавливаем состояние перед сохранением данных
         await state.set_state(GroupStates.waiting_for_bulk_group_selection)
         
-        # Получаем ID групп из массива groups
-        selected_groups = [group['id'] for group in bulk_group['groups']]
+        # Получаем ID групп оптомгруппы
+        selected_groups = sorted(bulk_group['group_ids'])
         
         # Сохраняем данные в состояние
         await state.update_data(
@@ -1942,8 +1924,8 @@ async def post_menu(callback: types.CallbackQuery):
             return
             
         schedule_time = datetime.fromtimestamp(post['schedule_time'])
-        groups = [await Database.get_group_by_id(str(g)) for g in post['groups']]
-        accounts = [await Database.get_account_by_id(a) for a in post['accounts']]
+        groups, _ = await Database.get_groups_by_ids(post['groups'])
+        accounts, _ = await Database.get_accounts_by_ids(post['accounts'])
         
         status_text = (
             f"📝 Пост #{post['id']}\n"
@@ -1985,46 +1967,26 @@ async def post_menu(callback: types.CallbackQuery):
 async def send_post_now(callback: types.CallbackQuery):
     try:
         post_id = int(callback.data.split('_')[2])
-        post = await Database.get_post_by_id(post_id)
         
-        if not post:
-            await callback.message.edit_text("❌ Пост не найден")
+        # Пост уже отправляет таймер или предыдущее нажатие кнопки
+        if post_id in sending_posts:
+            await callback.message.edit_text(f"⏳ Пост #{post_id} уже отправляется")
             return
-
-        # Показываем начальный статус
-        await callback.message.edit_text(
-            f"🔄 Подготовка к отправке поста #{post_id}...\n"
-            "Пожалуйста, подождите..."
-        )
-
-        # Получаем информацию о группах и аккаунтах для отображения
-        groups = [await Database.get_group_by_id(str(g)) for g in post['groups']]
-        accounts = [await Database.get_account_by_id(a) for a in post['accounts']]
-        
-        groups_text = "\n".join([f"• {g['title']}" for g in groups if g])
-        accounts_text = "\n".join([f"• {a['phone']}" for a in accounts if a])
-
-        # Обновляем сообщение с деталями
-        await callback.message.edit_text(
-            f"🚀 Начинаем отправку поста #{post_id}\n\n"
-            f"📢 Группы для отправки:\n{groups_text}\n\n"
-            f"👤 Используемые аккаунты:\n{accounts_text}\n\n"
-            "⏳ Идёт отправка..."
-        )
+        sending_posts.add(post_id)
+        try:
+            post = await Database.get_post_by_id(post_id)
+            if not post:
+                await callback.message.edit_text("❌ Пост не найден")
+                return
+            if post.get('status') != 'pending':
+                await callback.message.edit_text(f"ℹ️ Пост #{post_id} уже отправлен или отменён")
+                return
             
-        # Отправляем пост немедленно
-        await process_scheduled_post(post)
-        
-        # Обновляем статус поста в базе
-        await Database.update_post_status(post_id, "sent")
-        
-        # Показываем финальное сообщение
-        await callback.message.edit_text(
-            f"✅ Пост #{post_id} успешно отправлен!\n\n"
-            f"📢 Отправлено в {len(groups)} групп\n"
-            f"👤 Использовано {len(accounts)} аккаунтов\n\n"
-            "Детальный отчёт будет отправлен отдельным сообщением."
-        )
+            # Снимаем пост с таймера, чтобы не отправить его дважды
+            post_scheduler.cancel(post_id)
+            await send_scheduled_post_now(callback, post)
+        finally:
+            sending_posts.discard(post_id)
         
     except Exception as e:
         logger.exception(f"Ошибка при немедленной отправке поста: {str(e)}")
@@ -2034,6 +1996,45 @@ async def send_post_now(callback: types.CallbackQuery):
             "Проверьте доступность групп и статус аккаунтов."
         )
 
+async def send_scheduled_post_now(callback: types.CallbackQuery, post: dict):
+    """Немедленная отправка отложенного поста с отчётом в сообщении кнопки"""
+    post_id = post['id']
+    
+    # Показываем начальный статус
+    await callback.message.edit_text(
+        f"🔄 Подготовка к отправке поста #{post_id}...\n"
+        "Пожалуйста, подождите..."
+    )
+
+    # Получаем информацию о группах и аккаунтах для отображения
+    groups, _ = await Database.get_groups_by_ids(post['groups'])
+    accounts, _ = await Database.get_accounts_by_ids(post['accounts'])
+    
+    groups_text = "\n".join([f"• {g['title']}" for g in groups if g])
+    accounts_text = "\n".join([f"• {a['phone']}" for a in accounts if a])
+
+    # Обновляем сообщение с деталями
+    await callback.message.edit_text(
+        f"🚀 Начинаем отправку поста #{post_id}\n\n"
+        f"📢 Группы для отправки:\n{groups_text}\n\n"
+        f"👤 Используемые аккаунты:\n{accounts_text}\n\n"
+        "⏳ Идёт отправка..."
+    )
+        
+    # Отправляем пост немедленно
+    await process_scheduled_post(post)
+    
+    # Обновляем статус поста в базе
+    await Database.update_post_status(post_id, "sent")
+    
+    # Показываем финальное сообщение
+    await callback.message.edit_text(
+        f"✅ Пост #{post_id} успешно отправлен!\n\n"
+        f"📢 Отправлено в {len(groups)} групп\n"
+        f"👤 Использовано {len(accounts)} аккаунтов\n\n"
+        "Детальный отчёт будет отправлен отдельным сообщением."
+    )
+
 @dp.callback_query(lambda c: c.data.startswith('cancel_post_'))
 async def cancel_scheduled_post(callback: types.CallbackQuery):
     try:
@@ -2091,6 +2092,7 @@ async def confirm_cancel_post(callback: types.CallbackQuery):
             
         # Отменяем пост
         await Database.update_post_status(post_id, "cancelled")
+        post_scheduler.cancel(post_id)
         
         # Показываем подтверждение
         await callback.message.edit_text(
@@ -2108,96 +2110,146 @@ async def confirm_cancel_post(callback: types.CallbackQuery):
 async def back_to_posts_list(callback: types.CallbackQuery):
     await list_scheduled_posts(callback.message)
 
-async def process_scheduled_post(post: dict):
-    """Обработка отложенного поста"""
+async def spare_send_account(job: dict) -> Optional[dict]:
+    """Активный аккаунт того же запуска без паузы, которому можно передать задание"""
+    jobs = await Database.get_send_jobs(job['kind'], job['post_id'], job['run'])
+    account_ids = sorted({j['account_id'] for j in jobs} - {job['account_id']})
+    accounts, _ = await Database.get_accounts_by_ids(account_ids)
+    return next((
+        account for account in accounts
+        if account['status'] == 'active' and cooldowns.remaining(account['id']) == 0
+    ), None)
+
+async def execute_send_job(job: dict, message_data: dict):
+    """Выполнение одного задания отправки: подтверждение или перевод в dead-letter"""
     try:
-        # Получаем аккаунты
-        accounts = []
-        for account_id in post['accounts']:
-            account = await Database.get_account_by_id(account_id)
-            if account and account['status'] == 'active':
-                accounts.append(account)
+        account = await Database.get_account_by_id(job['account_id'])
+        group = await Database.get_group_by_id(job['group_id'])
+        if not account or account['status'] != 'active':
+            await Database.fail_send_job(job['id'], f"Аккаунт {job['account_id']} недоступен")
+            return
+        if not group:
+            await Database.fail_send_job(job['id'], f"Группа {job['group_id']} не найдена в базе")
+            return
         
-        if not accounts:
-            logger.error(f"Нет доступных аккаунтов для отправки поста #{post['id']}")
+        # Задание могло простоять в пуле дольше аренды: продлеваем её перед отправкой,
+        # а если задание уже перехватил другой процесс - не отправляем повторно
+        if not await Database.renew_send_job(job['id'], job['attempts']):
+            logger.warning(f"Аренда задания #{job['id']} перехвачена, отправка пропущена")
             return
-            
-        # Получаем группы
-        groups = []
-        for group_id in post['groups']:
-            group = await Database.get_group_by_id(str(group_id))
-            if group:
-                groups.append(group)
         
-        if not groups:
-            logger.error(f"Нет доступных групп для отправки поста #{post['id']}")
+        async with session_manager.client(account['session_file']) as client:
+            posting_manager = PostingManager(client, Database, bot, account['id'])
+        
+            # Проверяем статус аккаунта
+            can_send, phone = await posting_manager.check_account_status()
+            if not can_send:
+                logger.warning(f"Аккаунт {account['phone']} заморожен, пропускаем")
+                await Database.fail_send_job(job['id'], f"Аккаунт {account['phone']} заморожен")
+                return
+        
+            success, message = await posting_manager.send_post(
+                str(group['group_id']),
+                message_data,
+                post_id=job['post_id'],
+                kind=job['kind'],
+                run=job['run']
+            )
+            if success:
+                logger.info(f"✅ Успешно отправлено в группу {group['title']} через аккаунт {account['phone']}")
+                await Database.ack_send_job(job['id'])
+            elif rate_limiter.blocked_for(job['account_id']) > 0:
+                # FloodWait не тратит попытку: задание переходит к свободному аккаунту запуска,
+                # а если такого нет - ждёт конца паузы своего аккаунта вне пула
+                spare = await spare_send_account(job)
+                if spare:
+                    logger.warning(f"⏳ Аккаунт {account['phone']} в FloodWait, задание #{job['id']} передано аккаунту {spare['phone']}")
+                else:
+                    logger.warning(f"⏳ Аккаунт {account['phone']} в FloodWait, задание #{job['id']} отложено до конца паузы")
+                await Database.defer_send_job(job['id'], message, spare['id'] if spare else None)
+            else:
+                # send_post уже исчерпал свои повторы - повторная отправка задания ничего не даст
+                logger.error(f"❌ Ошибка при отправке в группу {group['title']} через аккаунт {account['phone']}: {message}")
+                await Database.fail_send_job(job['id'], message)
+    except Exception as e:
+        logger.error(f"❌ Ошибка при выполнении задания отправки #{job['id']}: {str(e)}")
+        await Database.fail_send_job(job['id'], str(e), retry=True)
+
+async def run_send_jobs(kind: str, post_id: int, run: int, message_data: dict):
+    """Выполнение заданий запуска до пустой очереди (задания с чужой арендой дожидаются её истечения)"""
+    while True:
+        # Берём задания порциями по размеру пула, чтобы аренда не истекала у ждущих очереди
+        jobs = await Database.claim_send_jobs(kind, post_id, run, limit=posting_pool.max_threads)
+        if jobs:
+            await asyncio.gather(*(
+                posting_pool.submit(job['account_id'], execute_send_job(job, message_data))
+                for job in jobs
+            ))
+            continue
+        
+        leased = await Database.get_send_jobs(kind, post_id, run, status="claimed")
+        if not leased and not await Database.get_send_jobs(kind, post_id, run, status="pending"):
             return
-            
-        # Создаем список задач для отправки
-        tasks = []
-        message_data = post['message']
+        # Задания взяты до перезапуска или другим процессом - ждём окончания аренды
+        wait = min((job['lease_until'] for job in leased), default=time.time() + 1) - time.time()
+        logger.info(f"Задания поста #{post_id} заняты, ожидание {max(wait, 1):.0f} сек")
+        await asyncio.sleep(max(wait, 1))
+
+async def process_scheduled_post(post: dict):
+    """Обработка отложенного поста через очередь заданий отправки"""
+    try:
+        run = post.get('schedule_time') or post['created_at']
         
-        # Распределяем группы между аккаунтами равномерно
-        account_index = 0
-        for group in groups:
-            # Перебираем аккаунты по кругу
-            account = accounts[account_index]
-            account_index = (account_index + 1) % len(accounts)  # Следующий аккаунт
+        if await Database.get_send_jobs("scheduled", post['id'], run):
+            # Задания уже в очереди - продолжаем с места остановки
+            logger.info(f"Продолжение отправки поста #{post['id']} из очереди заданий")
+        else:
+            # Получаем аккаунты
+            accounts, missing_accounts = await Database.get_accounts_by_ids(post['accounts'])
+            if missing_accounts:
+                logger.warning(f"Аккаунты {missing_accounts} поста #{post['id']} не найдены в базе")
+            accounts = [account for account in accounts if account['status'] == 'active']
             
-            try:
-                client = await session_manager.get_client(account['session_file'])
-                posting_manager = PostingManager(client, Database, bot)
+            if not accounts:
+                logger.error(f"Нет доступных аккаунтов для отправки поста #{post['id']}")
+                return
                 
-                # Проверяем статус аккаунта
-                can_send, phone = await posting_manager.check_account_status()
-                if can_send:
-                    # Создаем задачу для отправки
-                    task = asyncio.create_task(
-                        posting_manager.send_post(
-                            str(group['group_id']),
-                            message_data
-                        )
-                    )
-                    tasks.append((task, group['title'], account['phone']))
-                    logger.info(f"Создана задача отправки в группу {group['title']} через аккаунт {account['phone']}")
-                else:
-                    logger.warning(f"Аккаунт {account['phone']} заморожен, пропускаем")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при подготовке отправки в группу {group['title']}: {str(e)}")
-        
-        # Ждем завершения всех задач
-        if tasks:
-            success_count = 0
-            error_count = 0
+            # Получаем группы
+            groups, missing_groups = await Database.get_groups_by_ids(post['groups'])
+            if missing_groups:
+                logger.warning(f"Группы {missing_groups} поста #{post['id']} не найдены в базе")
             
-            for task, group_title, account_phone in tasks:
-                try:
-                    success, message = await task
-                    if success:
-                        logger.info(f"✅ Успешно отправлено в группу {group_title} через аккаунт {account_phone}")
-                        success_count += 1
-                    else:
-                        logger.error(f"❌ Ошибка при отправке в группу {group_title} через аккаунт {account_phone}: {message}")
-                        error_count += 1
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при отправке в группу {group_title} через аккаунт {account_phone}: {str(e)}")
-                    error_count += 1
+            if not groups:
+                logger.error(f"Нет доступных групп для отправки поста #{post['id']}")
+                return
             
-            # Отправляем результаты через бота
-            try:
-                user_id = post.get('user_id')  # ID пользователя, создавшего пост
-                if user_id:
-                    await bot.send_message(
-                        user_id,
-                        f"📊 Результаты отправки поста #{post['id']}:\n"
-                        f"✅ Успешно: {success_count}\n"
-                        f"❌ Ошибок: {error_count}"
-                    )
-                else:
-                    logger.error("Не удалось отправить результаты пользователю")
-            except Exception as e:
-                logger.error(f"Не удалось отправить результаты пользователю: {str(e)}")
+            # Распределяем группы между аккаунтами равномерно (аккаунты по кругу),
+            # пропуская аккаунты на паузе после FloodWait
+            accounts = cooldowns.available(accounts)
+            assignments = [
+                (group['id'], accounts[i % len(accounts)]['id'])
+                for i, group in enumerate(groups)
+            ]
+            added = await Database.enqueue_send_jobs("scheduled", post['id'], run, assignments)
+            logger.info(f"В очередь поставлено заданий отправки поста #{post['id']}: {added}")
+        
+        await run_send_jobs("scheduled", post['id'], run, post['message'])
+        counts = await Database.finish_send_jobs("scheduled", post['id'], run)
+        
+        # Отправляем результаты через бота
+        try:
+            user_id = post.get('user_id')  # ID пользователя, создавшего пост
+            if user_id:
+                await bot.send_message(
+                    user_id,
+                    f"📊 Результаты отправки поста #{post['id']}:\n"
+                    f"✅ Успешно: {counts['done']}\n"
+                    f"❌ Ошибок: {counts['dead']}"
+                )
+            else:
+                logger.error("Не удалось отправить результаты пользователю")
+        except Exception as e:
+            logger.error(f"Не удалось отправить результаты пользователю: {str(e)}")
         
         # Обновляем статус поста
         await Database.update_post_status(post['id'], "sent")
@@ -2206,23 +2258,47 @@ async def process_scheduled_post(post: dict):
     except Exception as e:
         logger.exception(f"Ошибка при обработке отложенного поста: {str(e)}")
 
+# Отложенные посты, которые сейчас отправляются таймером или кнопкой "Отправить сейчас"
+sending_posts: Set[int] = set()
+
+async def dispatch_scheduled_post(post_id: int, schedule_time: int):
+    """Отправка наступившего отложенного поста (вызывается планировщиком)"""
+    if post_id in sending_posts:
+        logger.warning(f"Пост #{post_id} уже отправляется, повторный запуск пропущен")
+        return
+    sending_posts.add(post_id)
+    try:
+        post = await Database.get_post_by_id(post_id)
+        if not post or post.get('status') != 'pending':
+            return
+        
+        logger.info(f"Отправка отложенного поста #{post['id']}")
+        await process_scheduled_post(post)
+    finally:
+        sending_posts.discard(post_id)
+    
+    # Переносим отправленные и отменённые посты в архив
+    archived = await Database.archive_finished_posts()
+    if archived:
+        logger.info(f"В архив перенесено постов: {archived}")
+
+# Планировщик отложенных постов: просыпается точно ко времени отправки
+post_scheduler = PostScheduler(dispatch_scheduled_post)
+
 async def check_scheduled_posts():
-    """Проверка и отправка отложенных постов"""
-    while True:
-        try:
-            current_time = int(time.time())
-            posts = await Database.get_pending_posts()
-            
-            for post in posts:
-                if post['schedule_time'] <= current_time:
-                    logger.info(f"Отправка отложенного поста #{post['id']}")
-                    await process_scheduled_post(post)
-            
-            await asyncio.sleep(60)  # Проверяем каждую минуту
-            
-        except Exception as e:
-            logger.exception(f"Ошибка при проверке отложенных постов: {str(e)}")
-            await asyncio.sleep(60)
+    """Загрузка ожидающих постов в планировщик и запуск его цикла"""
+    try:
+        archived = await Database.archive_finished_posts()
+        if archived:
+            logger.info(f"В архив перенесено постов: {archived}")
+        
+        for post in await Database.get_pending_posts():
+            post_scheduler.schedule(post['id'], post['schedule_time'])
+        logger.info(f"В планировщик загружено отложенных постов: {post_scheduler.pending_count}")
+    except Exception as e:
+        logger.exception(f"Ошибка при загрузке отложенных постов: {str(e)}")
+    
+    await post_scheduler.run()
 
 def format_time(seconds: int) -> str:
     """Форматирует время в минуты и часы"""
@@ -2272,7 +2348,7 @@ async def process_group_input(message: types.Message, state: FSMContext):
                 return
                 
             session_file = accounts[0]["session_file"]
-            client = await session_manager.get_client(session_file)
+            client = await session_manager.acquire(session_file)
             
             try:
                 # Сначала пробуем присоединиться к группе
@@ -2369,6 +2445,8 @@ async def process_group_input(message: types.Message, state: FSMContext):
                 logger.error(f"Ошибка при получении информации о группе: {str(e)}")
                 await message.answer("❌ Не удалось получить информацию о группе по ссылке.")
                 return
+            finally:
+                await session_manager.release(session_file)
 
         # Если это не ссылка, проверяем стандартные форматы
         if input_text.startswith('@'):
@@ -2380,7 +2458,7 @@ async def process_group_input(message: types.Message, state: FSMContext):
                 return
                 
             session_file = accounts[0]["session_file"]
-            client = await session_manager.get_client(session_file)
+            client = await session_manager.acquire(session_file)
             
             try:
                 # Получаем информацию о группе по username
@@ -2408,6 +2486,8 @@ async def process_group_input(message: types.Message, state: FSMContext):
                 logger.error(f"Ошибка при получении информации о группе: {str(e)}")
                 await message.answer("❌ Не удалось получить информацию о группе.")
                 return
+            finally:
+                await session_manager.release(session_file)
                 
         elif input_text.startswith('-100'):
             group_id = input_text.replace('-100', '')
@@ -2422,7 +2502,7 @@ async def process_group_input(message: types.Message, state: FSMContext):
                 return
                 
             session_file = accounts[0]["session_file"]
-            client = await session_manager.get_client(session_file)
+            client = await session_manager.acquire(session_file)
             
             try:
                 # Получаем информацию о группе по ID
@@ -2447,6 +2527,8 @@ async def process_group_input(message: types.Message, state: FSMContext):
                 logger.error(f"Ошибка при получении информации о группе: {str(e)}")
                 await message.answer("❌ Не удалось получить информацию о группе.")
                 return
+            finally:
+                await session_manager.release(session_file)
         
         await message.answer(
             "❌ Неверный формат!\n"
@@ -2642,12 +2724,22 @@ async def check_groups_access(message: types.Message):
             }
             
             for account in active_accounts:
+                # Аккаунт на паузе после FloodWait не трогаем, чтобы не продлить её
+                cooldown = cooldowns.remaining(account['id'])
+                if cooldown > 0:
+                    group_results['accounts'].append({
+                        'phone': account['phone'],
+                        'can_post': False,
+                        'reason': f"FloodWait, пауза ещё {format_time(int(cooldown))}"
+                    })
+                    continue
+                
                 try:
-                    client = await session_manager.get_client(account['session_file'])
-                    posting_manager = PostingManager(client, Database, bot)
-                    
-                    # Проверяем доступ
-                    can_post, reason = await posting_manager.check_group_access(group['group_id'])
+                    async with session_manager.client(account['session_file']) as client:
+                        posting_manager = PostingManager(client, Database, bot, account['id'])
+                        
+                        # Проверяем доступ
+                        can_post, reason = await posting_manager.check_group_access(group['group_id'])
                     
                     group_results['accounts'].append({
                         'phone': account['phone'],
@@ -3019,6 +3111,7 @@ async def process_auto_time(message: types.Message, state: FSMContext):
     if edit_post_id:
         # Обновляем существующий пост
         await Database.update_automated_post(edit_post_id, times=times)
+        await automation_engine.refresh(edit_post_id)
         await message.answer(
             "✅ Расписание поста успешно обновлено!\n"
             f"Времена отправки: {', '.join(times)}"
@@ -3047,6 +3140,7 @@ async def process_auto_time(message: types.Message, state: FSMContext):
             accounts=accounts,
             times=times
         )
+        await automation_engine.refresh(post_id)
         
         await message.answer(
             "✅ Автоматизированный пост успешно создан!\n"
@@ -3055,126 +3149,73 @@ async def process_auto_time(message: types.Message, state: FSMContext):
         )
         await state.clear()
 
-async def check_automated_posts():
-    """Проверка и отправка автоматизированных постов"""
-    while True:
+async def queue_automated_post(post: dict, slot: int):
+    """Постановка отправок слота автоматизированного поста в очередь заданий (вызывается движком)"""
+    # Получаем аккаунты
+    accounts, missing_accounts = await Database.get_accounts_by_ids(post['accounts'])
+    if missing_accounts:
+        logger.warning(f"Аккаунты {missing_accounts} поста #{post['id']} не найдены в базе")
+    accounts = [account for account in accounts if account['status'] == 'active']
+    
+    if not accounts:
+        logger.error(f"Нет доступных аккаунтов для поста #{post['id']}")
+        return
+    accounts = cooldowns.available(accounts)  # Аккаунты на паузе после FloodWait не получают групп
+    
+    # Получаем группы
+    groups, missing_groups = await Database.get_groups_by_ids(post['groups'])
+    if missing_groups:
+        logger.warning(f"Группы {missing_groups} поста #{post['id']} не найдены в базе")
+    
+    if not groups:
+        logger.error(f"Нет доступных групп для поста #{post['id']}")
+        return
+    
+    # Метка запуска в очереди и журнале доставки - слот расписания
+    assignments = [
+        (group['id'], accounts[i % len(accounts)]['id'])
+        for i, group in enumerate(groups)
+    ]
+    added = await Database.enqueue_send_jobs("automated", post['id'], slot, assignments)
+    logger.info(f"В очередь поставлено заданий отправки автоматизированного поста #{post['id']}: {added}")
+
+async def fire_automated_post(post: dict, slot: int):
+    """Выполнение заданий слота автоматизированного поста (вызывается движком)"""
+    logger.info(f"Отправка автоматизированного поста #{post['id']}")
+    
+    # При FloodWait задание переходит к другому аккаунту запуска (execute_send_job)
+    await run_send_jobs("automated", post['id'], slot, post['message'])
+    counts = await Database.finish_send_jobs("automated", post['id'], slot)
+    
+    # Отправляем уведомление пользователю только если были успешные отправки
+    if counts['done'] > 0:
         try:
-            # Получаем все активные автоматизированные посты
-            posts = await Database.get_automated_posts()
-            active_posts = [p for p in posts if p['status'] == 'active']
-            
-            if not active_posts:
-                await asyncio.sleep(60)  # Если нет активных постов, проверяем раз в минуту
-                continue
+            user_id = post['message'].get('user_id')
+            if user_id:
+                # Формируем список групп, в которые был отправлен пост
+                groups, _ = await Database.get_groups_by_ids(post['groups'])
+                groups_text = "\n".join([f"• {g['title']}" for g in groups])
                 
-            current_time = datetime.now().strftime("%H:%M")
-            
-            for post in active_posts:
-                if current_time in post['times']:
-                    logger.info(f"Отправка автоматизированного поста #{post['id']}")
-                    
-                    # Создаем пул для отправки
-                    posting_pool = PostingPool(MAX_THREADS)
-                    
-                    # Получаем аккаунты
-                    accounts = []
-                    for account_id in post['accounts']:
-                        account = await Database.get_account_by_id(account_id)
-                        if account and account['status'] == 'active':
-                            accounts.append(account)
-                    
-                    if not accounts:
-                        logger.error(f"Нет доступных аккаунтов для поста #{post['id']}")
-                        continue
-                    
-                    # Получаем группы
-                    groups = []
-                    for group_id in post['groups']:
-                        group = await Database.get_group_by_id(str(group_id))
-                        if group:
-                            groups.append(group)
-                    
-                    if not groups:
-                        logger.error(f"Нет доступных групп для поста #{post['id']}")
-                        continue
-                    
-                    # Распределяем группы между аккаунтами
-                    groups_per_account = len(groups) // len(accounts)
-                    if groups_per_account == 0:
-                        groups_per_account = 1
-                    
-                    current_account_index = 0
-                    current_group_index = 0
-                    success_count = 0
-                    error_count = 0
-                    
-                    while current_group_index < len(groups):
-                        account = accounts[current_account_index]
-                        
-                        # Создаем клиент для текущего аккаунта
-                        client = await session_manager.get_client(account['session_file'])
-                        posting_manager = PostingManager(client, Database, bot)
-                        
-                        # Отправляем посты в группы через текущий аккаунт
-                        for _ in range(groups_per_account):
-                            if current_group_index >= len(groups):
-                                break
-                                
-                            group = groups[current_group_index]
-                            task = await posting_pool.add_posting_task(
-                                posting_manager=posting_manager,
-                                group_id=group['group_id'],
-                                message_data=post['message']
-                            )
-                            
-                            if task:
-                                try:
-                                    success, message = await task
-                                    if success:
-                                        success_count += 1
-                                        logger.info(f"✅ Успешно отправлено в группу {group['title']} через аккаунт {account['phone']}")
-                                    else:
-                                        error_count += 1
-                                        logger.error(f"❌ Ошибка при отправке в группу {group['title']}: {message}")
-                                except Exception as e:
-                                    error_count += 1
-                                    logger.error(f"❌ Ошибка при отправке в группу {group['title']}: {str(e)}")
-                            
-                            current_group_index += 1
-                        
-                        current_account_index = (current_account_index + 1) % len(accounts)
-                    
-                    # Ждем завершения всех отправок
-                    await posting_pool.wait_all()
-                    
-                    # Отправляем уведомление пользователю только если были успешные отправки
-                    if success_count > 0:
-                        try:
-                            user_id = post['message'].get('user_id')
-                            if user_id:
-                                # Формируем список групп, в которые был отправлен пост
-                                groups_text = "\n".join([f"• {g['title']}" for g in groups])
-                                
-                                await bot.send_message(
-                                    user_id,
-                                    f"✅ Автоматизированный пост #{post['id']} успешно отправлен!\n\n"
-                                    f"📊 Статистика:\n"
-                                    f"✅ Успешно: {success_count}\n"
-                                    f"❌ Ошибок: {error_count}\n\n"
-                                    f"📢 Группы:\n{groups_text}\n\n"
-                                    f"⏰ Время отправки: {current_time}"
-                                )
-                        except Exception as e:
-                            logger.error(f"Ошибка при отправке уведомления пользователю: {str(e)}")
-                    
-                    logger.info(f"Автоматизированный пост #{post['id']} отправлен")
-            
-            # Проверяем каждую минуту
-            await asyncio.sleep(60)
-            
+                await bot.send_message(
+                    user_id,
+                    f"✅ Автоматизированный пост #{post['id']} успешно отправлен!\n\n"
+                    f"📊 Статистика:\n"
+                    f"✅ Успешно: {counts['done']}\n"
+                    f"❌ Ошибок: {counts['dead']}\n\n"
+                    f"📢 Группы:\n{groups_text}\n\n"
+                    f"⏰ Время отправки: {datetime.fromtimestamp(slot).strftime('%H:%M')}"
+                )
         except Exception as e:
-            logger.exception(f"Ошибка при проверке автоматизированных постов: {str(e)}")
-            await asyncio.sleep(60)
+            logger.error(f"Ошибка при отправке уведомления пользователю: {str(e)}")
+    
+    logger.info(f"Автоматизированный пост #{post['id']} отправлен")
+
+# Движок автопостов: таймер по минутам суток, каждый слот отправляется через очередь заданий один раз
+automation_engine = AutomationEngine(Database, queue_automated_post, fire_automated_post)
+
+async def check_automated_posts():
+    """Загрузка активных автоматизированных постов в движок и запуск его цикла"""
+    await automation_engine.run()
 
 @dp.message(lambda m: m.text == "⚙️ Настройка автопостов")
 async def automated_posts_settings(message: types.Message):
@@ -3307,6 +3348,7 @@ async def toggle_auto_post(callback: types.CallbackQuery):
         
     new_status = 'paused' if post['status'] == 'active' else 'active'
     await Database.update_automated_post(post_id, status=new_status)
+    await automation_engine.refresh(post_id)
     
     action = "приостановлен" if new_status == 'paused' else "возобновлен"
     await callback.answer(f"✅ Пост успешно {action}", show_alert=True)
@@ -4091,12 +4133,31 @@ async def main():
     # Инициализация базы данных
     await init_db()
     
+    # Размер пула отправок берём из сохранённых настроек
+    settings = await Database.get_all_settings()
+    await posting_pool.resize(int(settings.get('max_threads', MAX_THREADS)))
+    
+    # Паузы аккаунтов после FloodWait и сущности групп, сохранённые с прошлого запуска
+    await cooldowns.load()
+    await peer_cache.load()
+    await membership.load()
+    
     # Запускаем проверку отложенных и автоматизированных постов
     asyncio.create_task(check_scheduled_posts())
     asyncio.create_task(check_automated_posts())
     
     # Запуск бота
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Сохраняем несброшенные изменения базы данных и закрываем подключения
+        await Database.flush()
+        await Database.close()
+        await storage.close()
+        await session_manager.close_all()
+        await cooldowns.save()
+        await peer_cache.save()
+        await membership.save()
 
 if __name__ == "__main__":
     # Настройка логирования
@@ -18,6 +18,35 @@ API_HASH = "111111111111111111111111"  # Ваш API Hash от https://my.telegra
 DEFAULT_DELAY = 30  # Задержка между постами в секундах
 MAX_THREADS = 5     # Максимальное количество параллельных потоков
 MAX_RETRIES = 3     # Количество попыток отправки сообщения
+SEND_PER_ACCOUNT = 1  # Сколько сообщений один аккаунт отправляет одновременно (общий пул отправок)
+SEND_RATE_PER_MINUTE = 20  # Сколько сообщений один аккаунт отправляет в минуту (0 - без ограничения)
+JOIN_RATE_PER_HOUR = 20  # Сколько подписок на группы один аккаунт делает в час (0 - без ограничения)
+COOLDOWNS_FILE = DATABASE_PATH.parent / "cooldowns.json"  # Где хранить паузы аккаунтов после FloodWait между перезапусками (None - только в памяти)
+PEER_CACHE_FILE = DATABASE_PATH.parent / "peers.json"  # Где хранить access_hash групп по аккаунтам между перезапусками (None - только в памяти)
+PEER_CACHE_TTL = 7 * 24 * 3600  # Сколько секунд access_hash группы берётся из кэша без повторного get_entity (0 - без ограничения)
+MEMBERSHIP_FILE = DATABASE_PATH.parent / "membership.json"  # Где хранить группы, в которых состоят аккаунты (None - только в памяти)
+MEMBERSHIP_RESYNC = 24 * 3600  # Через сколько секунд список групп аккаунта заново загружается из его диалогов (0 - только один раз)
+MEMBERSHIP_RETRY = 600  # Через сколько секунд повторять загрузку диалогов аккаунта после ошибки (до этого подписки считаются неизвестными)
+ACCESS_CACHE_TTL = 3600  # Сколько секунд хранится подтверждённый доступ аккаунта к группе (0 - проверять при каждой отправке)
+ACCESS_CACHE_NEGATIVE_TTL = 600  # Сколько секунд хранится отказ: нет прав на отправку или группа приватная (0 - не хранить)
+CLIENT_POOL_MAX = 20  # Максимум одновременно открытых подключений аккаунтов к Telegram
+CLIENT_IDLE_TIMEOUT = 600  # Неиспользуемое подключение аккаунта закрывается через столько секунд
+CLIENT_HEALTH_CHECK = 60  # Подключение, простоявшее дольше стольких секунд, перед выдачей проверяется пингом
+AUTOMATED_CATCH_UP = "last"  # Слоты автопостов, пропущенные пока бот был выключен: "skip", "last" (только последний) или "all"
+AUTOMATED_CATCH_UP_WINDOW = 600  # Насколько давние пропущенные слоты ещё отправлять, в секундах
+SEND_JOB_LEASE = 600  # Аренда задания отправки в секундах: после сбоя незавершённые задания подхватываются по её истечении
+SEND_JOB_MAX_ATTEMPTS = 3  # Сколько раз задание берётся в работу, прежде чем попасть в dead-letter
+
+# Настройки базы данных
+DATABASE_BACKEND = "json"  # Хранилище данных: "json" (файлы в database/) или "sqlite" (DATABASE_PATH)
+DB_FLUSH_DELAY = 1.0  # Задержка отложенной записи JSON файлов на диск в секундах
+DB_FSYNC_POLICY = "snapshot"  # fsync при записи: "never", "snapshot" (снимки JSON файлов) или "always" (и журнал)
+DB_SERIALIZER = "json"  # Формат файлов базы: "json" (с отступами), "compact" (компактный JSON, orjson если установлен) или "msgpack"
+JOURNAL_COMPACT_ENTRIES = 1000  # Число записей в журнале постов, после которого он уплотняется в posts.json
+
+# Настройки Redis
+REDIS_URL = None  # Адрес Redis, например "redis://localhost:6379/0"; None - состояния диалогов хранятся в памяти процесса
+REDIS_CACHE_TTL = 60  # Время жизни кэша групп, аккаунтов и настроек в Redis в секундах (0 - без кэша; только для "sqlite")
 
 # Настройки логирования
 LOG_DIR = BASE_DIR / "logs"
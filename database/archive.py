@@ -0,0 +1,110 @@
+import json
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import aiofiles
+from database.fileio import fsync_file, FSYNC_APPENDS
+
+class PostArchive:
+    """Архив завершённых постов в файлах по месяцам: archive/posts_ГГГГ-ММ.jsonl.
+
+    Месяц определяется временем отправки поста (schedule_time, для обычных
+    постов - created_at). Файлы только дописываются; если пост попал в архив
+    дважды (сбой между записью в архив и удалением из posts.json), при чтении
+    остаётся последняя копия. Копии определяются по паре (id, created_at).
+    """
+
+    def __init__(self, directory: Path, prefix: str = "posts"):
+        self.directory = directory
+        self.prefix = prefix
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _post_time(post: dict) -> int:
+        return post.get("schedule_time") or post.get("created_at") or 0
+
+    def _segment_path(self, segment: str) -> Path:
+        return self.directory / f"{self.prefix}_{segment}.jsonl"
+
+    def _segments(self, start_time: int = None, end_time: int = None) -> List[Path]:
+        """Файлы архива, пересекающиеся с интервалом времени"""
+        start = datetime.fromtimestamp(start_time).strftime("%Y-%m") if start_time else None
+        end = datetime.fromtimestamp(end_time).strftime("%Y-%m") if end_time else None
+        paths = []
+        for path in sorted(self.directory.glob(f"{self.prefix}_*.jsonl")):
+            segment = path.stem[len(self.prefix) + 1:]
+            if start and segment < start:
+                continue
+            if end and segment > end:
+                continue
+            paths.append(path)
+        return paths
+
+    async def append(self, posts: List[dict]):
+        """Дозапись постов в файлы архива по месяцам"""
+        archived_at = int(datetime.now().timestamp())
+        segments: Dict[str, List[str]] = {}
+        for post in posts:
+            segment = datetime.fromtimestamp(self._post_time(post)).strftime("%Y-%m")
+            record = {**post, "archived_at": archived_at}
+            segments.setdefault(segment, []).append(
+                json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            )
+
+        async with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for segment, lines in segments.items():
+                async with aiofiles.open(self._segment_path(segment), 'a', encoding='utf-8') as f:
+                    await f.write("".join(lines))
+                    if FSYNC_APPENDS:
+                        await fsync_file(f)
+
+    async def _read_segment(self, path: Path) -> List[dict]:
+        async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+            content = await f.read()
+        records = []
+        for line in content.splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return records
+
+    async def query(
+        self,
+        start_time: int = None,
+        end_time: int = None,
+        status: str = None
+    ) -> List[dict]:
+        """Посты из архива за интервал времени отправки, опционально с фильтром по статусу"""
+        posts: Dict[tuple, dict] = {}
+        for path in self._segments(start_time, end_time):
+            for post in await self._read_segment(path):
+                post_time = self._post_time(post)
+                if start_time and post_time < start_time:
+                    continue
+                if end_time and post_time > end_time:
+                    continue
+                if status and post.get("status") != status:
+                    continue
+                posts[(post.get("id"), post.get("created_at"))] = post
+        return sorted(posts.values(), key=self._post_time)
+
+    async def get(self, post_id: int) -> Optional[dict]:
+        """Поиск поста в архиве по ID (просматривает все файлы, для отчётов)"""
+        found = None
+        for path in self._segments():
+            for post in await self._read_segment(path):
+                if str(post.get("id")) == str(post_id):
+                    found = post
+        return found
+
+    async def max_id(self) -> int:
+        """Наибольший ID поста в архиве (0, если архив пуст)"""
+        max_id = 0
+        for path in self._segments():
+            for post in await self._read_segment(path):
+                if isinstance(post.get("id"), int):
+                    max_id = max(max_id, post["id"])
+        return max_id
@@ -0,0 +1,79 @@
+"""Сравнение форматов файлов базы данных на каталоге групп.
+
+Запуск: python -m database.benchmark [--sizes 1000 10000 100000] [--repeat N]
+
+Для каждого доступного формата (см. DB_SERIALIZER в config.py) измеряет
+время записи (dumps) и чтения (loads) файла groups и его размер. Форматы,
+для которых не установлены зависимости (orjson, msgpack), пропускаются.
+"""
+import argparse
+import sys
+import time
+from typing import List
+from database.serializers import available_serializers, Serializer
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_REPEAT = 3
+
+def _make_groups(count: int) -> dict:
+    """Синтетический каталог групп в формате groups.json"""
+    now = int(time.time())
+    return {
+        "groups": [
+            {
+                "id": i,
+                "group_id": str(-1001000000000 - i),
+                "title": f"Группа №{i} — обсуждение",
+                "username": f"group_{i}",
+                "invite_link": f"https://t.me/+invite{i:012d}",
+                "status": "active",
+                "last_post": now - i,
+                "created_at": now - i * 60
+            }
+            for i in range(1, count + 1)
+        ],
+        "sequences": {"groups": count}
+    }
+
+def _best_time(func, repeat: int) -> float:
+    """Лучшее время из нескольких запусков в секундах"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _measure(serializer: Serializer, data: dict, repeat: int) -> dict:
+    content = serializer.dumps(data)
+    size = len(content) if serializer.binary else len(content.encode("utf-8"))
+    return {
+        "dump": _best_time(lambda: serializer.dumps(data), repeat),
+        "load": _best_time(lambda: serializer.loads(content), repeat),
+        "size": size
+    }
+
+def benchmark(sizes: List[int], repeat: int = DEFAULT_REPEAT):
+    """Печать таблицы времени записи/чтения и размера для каждого формата"""
+    serializers = available_serializers()
+    print(f"{'Групп':>8}  {'Формат':<10}{'Запись, мс':>12}{'Чтение, мс':>12}{'Размер, КБ':>12}")
+    for count in sizes:
+        data = _make_groups(count)
+        for serializer in serializers:
+            r = _measure(serializer, data, repeat)
+            print(
+                f"{count:>8}  {serializer.name:<10}{r['dump'] * 1000:>12.1f}"
+                f"{r['load'] * 1000:>12.1f}{r['size'] / 1024:>12.0f}"
+            )
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение форматов файлов базы данных")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Количество групп")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Запусков на измерение")
+    args = parser.parse_args(argv)
+
+    benchmark(args.sizes, args.repeat)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+import os
+import asyncio
+from pathlib import Path
+import aiofiles
+from config import DB_FSYNC_POLICY
+
+# Политика fsync:
+#   never    - не вызывать fsync, полагаться на кэш ОС
+#   snapshot - fsync при записи снимков JSON файлов (по умолчанию)
+#   always   - дополнительно fsync после каждой записи в журнал и архив
+FSYNC_SNAPSHOTS = DB_FSYNC_POLICY in ("snapshot", "always")
+FSYNC_APPENDS = DB_FSYNC_POLICY == "always"
+
+async def fsync_file(f):
+    """Сброс буферов открытого aiofiles файла на диск"""
+    await f.flush()
+    await asyncio.get_running_loop().run_in_executor(None, os.fsync, f.fileno())
+
+async def atomic_write(path: Path, content, fsync: bool = FSYNC_SNAPSHOTS):
+    """Атомарная запись файла: временный файл + rename.
+
+    При сбое на диске остаётся либо старая, либо новая версия файла целиком.
+    """
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    encoding = None if isinstance(content, bytes) else 'utf-8'
+    async with aiofiles.open(tmp_path, mode, encoding=encoding) as f:
+        await f.write(content)
+        if fsync:
+            await fsync_file(f)
+    os.replace(tmp_path, path)
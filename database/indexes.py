@@ -0,0 +1,119 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+_TIME_RE = re.compile(r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$')
+
+def minute_of_day(value) -> Optional[int]:
+    """Время "ЧЧ:ММ" (или "Ч:ММ") в минутах от начала суток, None для некорректного"""
+    match = _TIME_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+class CollectionIndex:
+    """Хеш-индексы коллекции записей: id -> запись, поле -> запись, статус -> множество id.
+
+    Если задано minute_field (список времён "ЧЧ:ММ"), ведётся ещё индекс
+    минута суток (0-1439) -> множество id.
+
+    Индекс хранит ссылки на те же словари, что лежат в кэше JSON файла,
+    поэтому при изменении записи её нужно убрать из индекса (discard),
+    изменить и добавить обратно (add).
+    """
+
+    def __init__(
+        self,
+        fields: Iterable[str] = (),
+        status_field: str = "status",
+        minute_field: Optional[str] = None
+    ):
+        self.fields = tuple(fields)
+        self.status_field = status_field
+        self.minute_field = minute_field
+        self.by_id: Dict[str, dict] = {}
+        self.by_field: Dict[str, Dict[str, dict]] = {field: {} for field in self.fields}
+        self.by_status: Dict[str, Set[str]] = {}
+        self.by_minute: Dict[int, Set[str]] = {}
+
+    @staticmethod
+    def _key(value) -> str:
+        """ID и group_id встречаются и строками, и числами - сравниваем как строки"""
+        return str(value)
+
+    def _minutes(self, record: dict) -> Set[int]:
+        if self.minute_field is None:
+            return set()
+        minutes = (minute_of_day(value) for value in record.get(self.minute_field) or ())
+        return {minute for minute in minutes if minute is not None}
+
+    def rebuild(self, records: Iterable[dict]):
+        """Полное перестроение индексов по списку записей"""
+        self.by_id.clear()
+        for field in self.fields:
+            self.by_field[field].clear()
+        self.by_status.clear()
+        self.by_minute.clear()
+        for record in records:
+            self.add(record)
+
+    def add(self, record: dict):
+        """Добавление записи во все индексы"""
+        record_id = self._key(record.get("id"))
+        self.by_id[record_id] = record
+        for field in self.fields:
+            value = record.get(field)
+            if value is not None:
+                # При дублях побеждает первая запись, как при линейном поиске
+                self.by_field[field].setdefault(self._key(value), record)
+        status = record.get(self.status_field)
+        if status is not None:
+            self.by_status.setdefault(status, set()).add(record_id)
+        for minute in self._minutes(record):
+            self.by_minute.setdefault(minute, set()).add(record_id)
+
+    def discard(self, record: dict):
+        """Удаление записи из всех индексов"""
+        record_id = self._key(record.get("id"))
+        if self.by_id.get(record_id) is record:
+            del self.by_id[record_id]
+        for field in self.fields:
+            value = record.get(field)
+            if value is not None and self.by_field[field].get(self._key(value)) is record:
+                del self.by_field[field][self._key(value)]
+        status = record.get(self.status_field)
+        if status in self.by_status:
+            self.by_status[status].discard(record_id)
+        for minute in self._minutes(record):
+            ids = self.by_minute.get(minute)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self.by_minute[minute]
+
+    def get(self, record_id) -> Optional[dict]:
+        """Запись по id"""
+        return self.by_id.get(self._key(record_id))
+
+    def get_by(self, field: str, value) -> Optional[dict]:
+        """Запись по значению проиндексированного поля"""
+        return self.by_field[field].get(self._key(value))
+
+    def with_status(self, status: str) -> List[dict]:
+        """Записи с указанным статусом в порядке id"""
+        ids = self.by_status.get(status, ())
+        records = [self.by_id[record_id] for record_id in ids if record_id in self.by_id]
+        return sorted(records, key=lambda r: r.get("id", 0))
+
+    def at_minute(self, minute: int, status: str = None) -> List[dict]:
+        """Записи, у которых в расписании есть минута суток, опционально с фильтром по статусу"""
+        records = [self.by_id[record_id] for record_id in self.by_minute.get(minute, ())]
+        if status is not None:
+            records = [r for r in records if r.get(self.status_field) == status]
+        return sorted(records, key=lambda r: r.get("id", 0))
+
+    def minutes(self, status: str = None) -> List[int]:
+        """Минуты суток, на которые есть записи (с указанным статусом)"""
+        if status is None:
+            return sorted(self.by_minute)
+        active = self.by_status.get(status, set())
+        return sorted(minute for minute, ids in self.by_minute.items() if not ids.isdisjoint(active))
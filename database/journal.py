@@ -0,0 +1,123 @@
+import json
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Iterable
+import aiofiles
+from database.fileio import atomic_write, fsync_file, FSYNC_APPENDS
+
+class Journal:
+    """Журнал изменений JSON файла: одна JSON запись на строку, только дозапись.
+
+    Изменение сначала применяется к данным в кэше, затем дописывается в журнал.
+    Снимок (сам JSON файл) перезаписывается только при уплотнении, после чего
+    из журнала удаляются записи, уже попавшие в снимок. При запуске журнал
+    проигрывается поверх снимка. Операции идемпотентны, поэтому повторное
+    применение записей, уже попавших в снимок, безопасно.
+
+    Операции:
+        {"op": "insert", "collection": ..., "record": {...}}
+        {"op": "update", "collection": ..., "id": ..., "fields": {...}}
+        {"op": "delete", "collection": ..., "id": ...}
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = 0      # Размер журнала в байтах
+        self.entries = 0   # Количество записей с момента последнего уплотнения
+        self._lock = asyncio.Lock()
+
+    async def append(self, entry: dict):
+        """Дозапись одного изменения в конец журнала"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        async with self._lock:
+            async with aiofiles.open(self.path, 'a', encoding='utf-8') as f:
+                await f.write(line)
+                if FSYNC_APPENDS:
+                    await fsync_file(f)
+            self.size += len(line.encode('utf-8'))
+            self.entries += 1
+
+    async def replay(self, data: dict) -> int:
+        """Применение журнала к загруженному снимку"""
+        try:
+            async with aiofiles.open(self.path, 'r', encoding='utf-8') as f:
+                content = await f.read()
+        except FileNotFoundError:
+            content = ""
+        if content and not content.endswith("\n"):
+            # Отрезаем оборванную при сбое строку, чтобы новые записи не склеились с ней
+            logging.warning(f"Журнал {self.path.name} оборван, незавершённая запись удалена")
+            content = content[:content.rfind("\n") + 1]
+            await atomic_write(self.path, content)
+        applied = self.apply_lines(data, content.splitlines())
+        self.size = len(content.encode('utf-8'))
+        self.entries = applied
+        return applied
+
+    async def compact(self, offset: int):
+        """Удаление записей до offset (они уже сохранены в снимке)"""
+        async with self._lock:
+            try:
+                async with aiofiles.open(self.path, 'rb') as f:
+                    await f.seek(offset)
+                    tail = await f.read()
+            except FileNotFoundError:
+                tail = b""
+            await atomic_write(self.path, tail)
+            self.size = len(tail)
+            self.entries = tail.count(b"\n")
+
+    @staticmethod
+    def apply_lines(data: dict, lines: Iterable[str]) -> int:
+        """Применение строк журнала к данным, возвращает число применённых записей"""
+        lookups: Dict[str, Dict[str, dict]] = {}
+        applied = 0
+
+        def lookup(collection: str) -> Dict[str, dict]:
+            if collection not in lookups:
+                lookups[collection] = {
+                    str(record.get("id")): record
+                    for record in data.setdefault(collection, [])
+                }
+            return lookups[collection]
+
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Оборванная при сбое последняя строка - изменение не было подтверждено
+                logging.warning("Пропущена повреждённая запись журнала")
+                continue
+
+            collection = entry["collection"]
+            records = lookup(collection)
+            record_id = str(entry.get("id", entry.get("record", {}).get("id")))
+
+            if entry["op"] == "insert":
+                # Счётчик ID не должен отставать от записей, восстановленных из журнала
+                sequences = data.setdefault("sequences", {})
+                inserted_id = entry["record"].get("id")
+                if isinstance(inserted_id, int) and inserted_id > sequences.get(collection, 0):
+                    sequences[collection] = inserted_id
+                existing = records.get(record_id)
+                if existing is not None:
+                    existing.clear()
+                    existing.update(entry["record"])
+                else:
+                    record = dict(entry["record"])
+                    data[collection].append(record)
+                    records[record_id] = record
+            elif entry["op"] == "update":
+                record = records.get(record_id)
+                if record is not None:
+                    record.update(entry["fields"])
+            elif entry["op"] == "delete":
+                record = records.pop(record_id, None)
+                if record is not None:
+                    data[collection] = [r for r in data[collection] if r is not record]
+            applied += 1
+
+        return applied
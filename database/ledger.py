@@ -0,0 +1,142 @@
+import json
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import aiofiles
+from database.fileio import atomic_write, fsync_file, FSYNC_APPENDS
+
+class DeliveryLedger:
+    """Журнал результатов отправки в файлах по дням: ledger/deliveries_ГГГГ-ММ-ДД.jsonl.
+
+    Одна запись на попытку отправки поста в группу через аккаунт. Файлы только
+    дописываются, старые дни можно сжимать или удалять целиком. Индекс
+    ledger/deliveries_index.json хранит дни, в которые писались попытки
+    каждого поста, поэтому запрос по посту читает только эти файлы.
+
+    Запись:
+        {"ts": ..., "kind": "instant" | "scheduled" | "automated", "post_id": ...,
+         "run": ..., "group_id": ..., "account_id": ..., "phone": ...,
+         "outcome": "sent" | "failed" | "skipped", "error": ..., "message_id": ...,
+         "attempts": ..., "stages": {"access": мс, "prepare": мс, "send": мс, ...}}
+    """
+
+    def __init__(self, directory: Path, prefix: str = "deliveries"):
+        self.directory = directory
+        self.prefix = prefix
+        self._lock = asyncio.Lock()
+        self._post_segments: Optional[Dict[str, Set[str]]] = None  # post_id -> дни с попытками
+
+    @property
+    def _index_path(self) -> Path:
+        return self.directory / f"{self.prefix}_index.json"
+
+    def _segment_path(self, segment: str) -> Path:
+        return self.directory / f"{self.prefix}_{segment}.jsonl"
+
+    def _segments(self, start_time: int = None, end_time: int = None) -> List[Path]:
+        """Файлы журнала, пересекающиеся с интервалом времени"""
+        start = datetime.fromtimestamp(start_time).strftime("%Y-%m-%d") if start_time else None
+        end = datetime.fromtimestamp(end_time).strftime("%Y-%m-%d") if end_time else None
+        paths = []
+        for path in sorted(self.directory.glob(f"{self.prefix}_*.jsonl")):
+            segment = path.stem[len(self.prefix) + 1:]
+            if start and segment < start:
+                continue
+            if end and segment > end:
+                continue
+            paths.append(path)
+        return paths
+
+    async def _read_segment(self, path: Path) -> List[dict]:
+        async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+            content = await f.read()
+        records = []
+        for line in content.splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return records
+
+    async def _load_index(self) -> Dict[str, Set[str]]:
+        """Индекс дней по постам; без файла индекса собирается один раз из всех дней журнала"""
+        if self._post_segments is not None:
+            return self._post_segments
+        try:
+            async with aiofiles.open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.loads(await f.read())
+            self._post_segments = {post_id: set(segments) for post_id, segments in data.items()}
+        except (OSError, json.JSONDecodeError):
+            self._post_segments = {}
+            for path in self._segments():
+                segment = path.stem[len(self.prefix) + 1:]
+                for record in await self._read_segment(path):
+                    if record.get("post_id") is not None:
+                        self._post_segments.setdefault(str(record["post_id"]), set()).add(segment)
+            if self._post_segments:
+                await self._save_index()
+        return self._post_segments
+
+    async def _save_index(self):
+        content = json.dumps(
+            {post_id: sorted(segments) for post_id, segments in self._post_segments.items()},
+            separators=(",", ":")
+        )
+        await atomic_write(self._index_path, content)
+
+    async def append(self, record: dict):
+        """Дозапись результата одной попытки отправки"""
+        segment = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d")
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        async with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if record.get("post_id") is not None:
+                # День попадает в индекс до записи попытки: после сбоя индекс
+                # может указать на лишний день, но не потеряет нужный
+                segments = (await self._load_index()).setdefault(str(record["post_id"]), set())
+                if segment not in segments:
+                    segments.add(segment)
+                    await self._save_index()
+            async with aiofiles.open(self._segment_path(segment), 'a', encoding='utf-8') as f:
+                await f.write(line)
+                if FSYNC_APPENDS:
+                    await fsync_file(f)
+
+    async def query(
+        self,
+        start_time: int = None,
+        end_time: int = None,
+        post_id: int = None,
+        run: int = None,
+        outcome: str = None
+    ) -> List[dict]:
+        """Записи за интервал времени с фильтрами по посту, запуску и результату"""
+        paths = self._segments(start_time, end_time)
+        if post_id is not None:
+            async with self._lock:
+                segments = (await self._load_index()).get(str(post_id), set())
+            paths = [path for path in paths if path.stem[len(self.prefix) + 1:] in segments]
+        records = []
+        for path in paths:
+            for record in await self._read_segment(path):
+                if start_time and record["ts"] < start_time:
+                    continue
+                if end_time and record["ts"] > end_time:
+                    continue
+                if post_id is not None and record.get("post_id") != post_id:
+                    continue
+                if run is not None and record.get("run") != run:
+                    continue
+                if outcome and record.get("outcome") != outcome:
+                    continue
+                records.append(record)
+        return records
+
+    @staticmethod
+    def latest_failures(records: List[dict]) -> List[dict]:
+        """Группы, последняя попытка отправки в которые не удалась"""
+        latest: Dict[str, dict] = {}
+        for record in records:
+            latest[str(record.get("group_id"))] = record
+        return [record for record in latest.values() if record.get("outcome") != "sent"]
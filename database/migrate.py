@@ -0,0 +1,402 @@
+"""Перенос данных из JSON файлов в SQLite базу.
+
+Запуск: python -m database.migrate [--source DIR] [--target FILE] [--batch-size N] [--force]
+
+Бот должен быть остановлен на время переноса (изменения из кэша сбрасываются
+на диск при остановке). После успешной проверки установите
+DATABASE_BACKEND = "sqlite" в config.py и запустите бота.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List
+from config import BASE_DIR, DATABASE_PATH
+from database.sqlite_db import SCHEMA, JSON_FIELDS
+from database.indexes import minute_of_day
+from database.journal import Journal
+from database.serializers import load_file
+
+DEFAULT_SOURCE_DIR = BASE_DIR / "database"
+DEFAULT_BATCH_SIZE = 500
+
+# Таблица -> (JSON файл, ключ в файле, колонки)
+TABLES = {
+    "accounts": (
+        "accounts.json", "accounts",
+        ("id", "phone", "session_file", "status", "last_used", "created_at")
+    ),
+    "groups": (
+        "groups.json", "groups",
+        ("id", "group_id", "title", "username", "invite_link", "status", "last_post", "created_at")
+    ),
+    "posts": (
+        "posts.json", "posts",
+        ("id", "content", "message", "groups", "accounts", "schedule_time", "status", "created_at")
+    ),
+    "automated_posts": (
+        "posts.json", "automated_posts",
+        ("id", "message", "groups", "accounts", "times", "status", "created_at", "last_fire")
+    ),
+    "bulk_groups": (
+        "bulk_groups.json", "bulk_groups",
+        ("id", "name", "created_at")
+    ),
+    "send_jobs": (
+        "send_jobs.json", "send_jobs",
+        (
+            "id", "kind", "post_id", "run", "group_id", "account_id", "status",
+            "attempts", "lease_until", "error", "created_at", "updated_at"
+        )
+    ),
+    "posts_archive": (
+        "archive", "posts",
+        ("id", "content", "message", "groups", "accounts", "schedule_time", "status", "created_at", "archived_at")
+    )
+}
+
+# Журнал доставки: папка с файлами по дням и колонки (ID записям даёт база)
+LEDGER_DIR_NAME = "ledger"
+DELIVERY_COLUMNS = (
+    "ts", "kind", "post_id", "run", "group_id", "account_id", "phone",
+    "outcome", "error", "message_id", "attempts", "stages"
+)
+
+# Архивная таблица -> таблица, чей счётчик ID должен быть больше ID архива
+ARCHIVE_TABLES = {
+    "posts_archive": "posts"
+}
+
+def _load_data(path: Path) -> dict:
+    """Чтение файла базы (в любом формате) с учётом журнала изменений"""
+    data = load_file(path)
+    if data is None:
+        return {}
+
+    journal_path = path.with_suffix(".journal")
+    if journal_path.exists():
+        with open(journal_path, "r", encoding="utf-8") as f:
+            Journal.apply_lines(data, f.read().splitlines())
+
+    return data
+
+def _load_records(source_dir: Path, file_name: str, key: str) -> List[dict]:
+    """Чтение записей коллекции из файла базы с учётом журнала изменений"""
+    path = source_dir / file_name
+    if path.is_dir():
+        return _load_archive(path, key)
+    return _load_data(path).get(key, [])
+
+def _load_sequences(source_dir: Path) -> Dict[str, int]:
+    """Счётчики ID коллекций из файлов базы"""
+    sequences = {}
+    for table, (file_name, key, _) in TABLES.items():
+        path = source_dir / file_name
+        if path.is_dir():
+            continue
+        value = _load_data(path).get("sequences", {}).get(key)
+        if value:
+            sequences[table] = value
+    return sequences
+
+def _load_archive(directory: Path, prefix: str) -> List[dict]:
+    """Чтение архива постов из файлов по месяцам (повторные копии схлопываются)"""
+    records = {}
+    for path in sorted(directory.glob(f"{prefix}_*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[(record.get("id"), record.get("created_at"))] = record
+    return list(records.values())
+
+def _load_deliveries(directory: Path) -> List[dict]:
+    """Чтение журнала доставки из файлов по дням в порядке записи"""
+    records = []
+    for path in sorted(directory.glob("deliveries_*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+def _to_row(record: dict, columns: tuple) -> tuple:
+    """Преобразование записи в строку таблицы"""
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if column in JSON_FIELDS and value is not None:
+            value = json.dumps(value, ensure_ascii=False)
+        elif column == "group_id" and value is not None:
+            value = str(value)
+        row.append(value)
+    return tuple(row)
+
+def _batches(items: list, size: int) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _migrate_table(conn: sqlite3.Connection, table: str, records: List[dict], batch_size: int) -> dict:
+    """Перенос одной коллекции пакетными транзакциями"""
+    _, _, columns = TABLES[table]
+    placeholders = ", ".join("?" for _ in columns)
+    query = f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    start = time.perf_counter()
+    inserted = 0
+    for batch in _batches(records, batch_size):
+        with conn:
+            cursor = conn.executemany(query, [_to_row(r, columns) for r in batch])
+            inserted += cursor.rowcount
+    elapsed = time.perf_counter() - start
+
+    return {
+        "table": table,
+        "source": len(records),
+        "inserted": inserted,
+        "skipped": len(records) - inserted,
+        "seconds": elapsed,
+        "rows_per_sec": inserted / elapsed if elapsed > 0 else float(inserted)
+    }
+
+def _migrate_bulk_group_members(conn: sqlite3.Connection, bulk_groups: List[dict], batch_size: int) -> dict:
+    """Перенос состава оптомгрупп (старые записи хранят копии групп, а не ID)"""
+    rows = []
+    for bulk_group in bulk_groups:
+        group_ids = bulk_group.get("group_ids")
+        if group_ids is None:
+            group_ids = [group["id"] for group in bulk_group.get("groups", [])]
+        rows.extend((bulk_group["id"], group_id) for group_id in set(group_ids))
+
+    start = time.perf_counter()
+    inserted = 0
+    for batch in _batches(rows, batch_size):
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO bulk_group_members (bulk_group_id, group_id) VALUES (?, ?)",
+                batch
+            )
+            inserted += cursor.rowcount
+    elapsed = time.perf_counter() - start
+
+    return {
+        "table": "bulk_group_members",
+        "source": len(rows),
+        "inserted": inserted,
+        "skipped": len(rows) - inserted,
+        "seconds": elapsed,
+        "rows_per_sec": inserted / elapsed if elapsed > 0 else float(inserted)
+    }
+
+def _migrate_automated_post_times(conn: sqlite3.Connection, posts: List[dict], batch_size: int) -> dict:
+    """Заполнение индекса минут суток по расписаниям автоматизированных постов"""
+    rows = []
+    for post in posts:
+        minutes = {minute_of_day(value) for value in post.get("times") or ()}
+        rows.extend((minute, post["id"]) for minute in minutes if minute is not None)
+
+    start = time.perf_counter()
+    inserted = 0
+    for batch in _batches(rows, batch_size):
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO automated_post_times (minute, post_id) VALUES (?, ?)",
+                batch
+            )
+            inserted += cursor.rowcount
+    elapsed = time.perf_counter() - start
+
+    return {
+        "table": "automated_post_times",
+        "source": len(rows),
+        "inserted": inserted,
+        "skipped": len(rows) - inserted,
+        "seconds": elapsed,
+        "rows_per_sec": inserted / elapsed if elapsed > 0 else float(inserted)
+    }
+
+def _migrate_deliveries(conn: sqlite3.Connection, records: List[dict], batch_size: int) -> dict:
+    """Перенос журнала доставки пакетными транзакциями"""
+    placeholders = ", ".join("?" for _ in DELIVERY_COLUMNS)
+    query = f"INSERT INTO deliveries ({', '.join(DELIVERY_COLUMNS)}) VALUES ({placeholders})"
+
+    start = time.perf_counter()
+    inserted = 0
+    for batch in _batches(records, batch_size):
+        with conn:
+            cursor = conn.executemany(query, [_to_row(r, DELIVERY_COLUMNS) for r in batch])
+            inserted += cursor.rowcount
+    elapsed = time.perf_counter() - start
+
+    return {
+        "table": "deliveries",
+        "source": len(records),
+        "inserted": inserted,
+        "skipped": len(records) - inserted,
+        "seconds": elapsed,
+        "rows_per_sec": inserted / elapsed if elapsed > 0 else float(inserted)
+    }
+
+def _verify_deliveries(conn: sqlite3.Connection, records: List[dict]) -> List[str]:
+    """Проверка количества перенесённых записей журнала доставки"""
+    count = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+    if count != len(records):
+        return [f"deliveries: записей в журнале {len(records)}, в базе {count}"]
+    return []
+
+def _migrate_settings(conn: sqlite3.Connection, source_dir: Path) -> dict:
+    """Перенос настроек"""
+    settings = _load_data(source_dir / "settings.json").get("settings", {})
+
+    start = time.perf_counter()
+    with conn:
+        conn.executemany(
+            "INSERT INTO settings (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            [(key, str(value)) for key, value in settings.items()]
+        )
+    elapsed = time.perf_counter() - start
+
+    return {
+        "table": "settings",
+        "source": len(settings),
+        "inserted": len(settings),
+        "skipped": 0,
+        "seconds": elapsed,
+        "rows_per_sec": len(settings) / elapsed if elapsed > 0 else float(len(settings))
+    }
+
+def _advance_sequence(conn: sqlite3.Connection, table: str, value: int):
+    """Поднимает счётчик ID таблицы до value (счётчик не уменьшается)"""
+    cursor = conn.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+        (value, table)
+    )
+    if cursor.rowcount == 0:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, value))
+
+def _advance_sequences(conn: sqlite3.Connection, sequences: Dict[str, int]):
+    """Счётчики ID таблиц должны учитывать записи, перенесённые в архив, и счётчики JSON файлов"""
+    with conn:
+        for archive_table, table in ARCHIVE_TABLES.items():
+            archive_max = conn.execute(f"SELECT MAX(id) FROM {archive_table}").fetchone()[0]
+            if archive_max:
+                _advance_sequence(conn, table, archive_max)
+        for table, value in sequences.items():
+            _advance_sequence(conn, table, value)
+
+def _verify_table(conn: sqlite3.Connection, table: str, records: List[dict]) -> List[str]:
+    """Проверка количества строк и непрерывности ID после переноса"""
+    errors = []
+    source_ids = [r.get("id") for r in records]
+    target_ids = {row[0] for row in conn.execute(f"SELECT id FROM {table}")}
+
+    if len(target_ids) != len(records):
+        errors.append(f"{table}: строк в источнике {len(records)}, в базе {len(target_ids)}")
+
+    duplicates = len(source_ids) - len(set(source_ids))
+    if duplicates:
+        errors.append(f"{table}: повторяющихся ID в источнике: {duplicates}")
+
+    missing = set(source_ids) - target_ids
+    if missing:
+        errors.append(f"{table}: не перенесены ID {sorted(missing, key=str)[:10]}")
+
+    # Новые записи должны получать ID больше всех перенесённых
+    if target_ids:
+        sequence_table = ARCHIVE_TABLES.get(table, table)
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (sequence_table,)).fetchone()
+        sequence = row[0] if row else 0
+        if sequence < max(target_ids):
+            errors.append(f"{table}: счётчик ID {sequence} меньше максимального ID {max(target_ids)}")
+
+    return errors
+
+def migrate(source_dir: Path, target: Path, batch_size: int = DEFAULT_BATCH_SIZE, force: bool = False) -> bool:
+    """Перенос всех данных из JSON в SQLite с проверкой и отчётом о скорости"""
+    conn = sqlite3.connect(target)
+    try:
+        conn.executescript(SCHEMA)
+
+        existing = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in (*TABLES, "deliveries")
+        }
+        if any(existing.values()):
+            if not force:
+                print(f"❌ База {target} уже содержит данные: {existing}")
+                print("Используйте --force, чтобы очистить таблицы перед переносом")
+                return False
+            with conn:
+                for table in TABLES:
+                    conn.execute(f"DELETE FROM {table}")
+                conn.execute("DELETE FROM bulk_group_members")
+                conn.execute("DELETE FROM automated_post_times")
+                conn.execute("DELETE FROM deliveries")
+                conn.execute(
+                    f"DELETE FROM sqlite_sequence WHERE name IN ({', '.join('?' for _ in TABLES)}, ?)",
+                    (*TABLES, "deliveries")
+                )
+
+        reports = []
+        errors = []
+        total_start = time.perf_counter()
+
+        sources = {}
+        for table, (file_name, key, _) in TABLES.items():
+            sources[table] = _load_records(source_dir, file_name, key)
+            reports.append(_migrate_table(conn, table, sources[table], batch_size))
+
+        reports.append(_migrate_bulk_group_members(conn, sources["bulk_groups"], batch_size))
+        reports.append(_migrate_automated_post_times(conn, sources["automated_posts"], batch_size))
+        deliveries = _load_deliveries(source_dir / LEDGER_DIR_NAME)
+        reports.append(_migrate_deliveries(conn, deliveries, batch_size))
+        _advance_sequences(conn, _load_sequences(source_dir))
+        for table, records in sources.items():
+            errors.extend(_verify_table(conn, table, records))
+        errors.extend(_verify_deliveries(conn, deliveries))
+
+        reports.append(_migrate_settings(conn, source_dir))
+        total_elapsed = time.perf_counter() - total_start
+
+        print(f"📦 Перенос {source_dir} -> {target}\n")
+        print(f"{'Таблица':<22}{'Источник':>10}{'Перенесено':>12}{'Пропущено':>11}{'Сек':>9}{'Строк/сек':>12}")
+        for r in reports:
+            print(
+                f"{r['table']:<22}{r['source']:>10}{r['inserted']:>12}{r['skipped']:>11}"
+                f"{r['seconds']:>9.3f}{r['rows_per_sec']:>12.0f}"
+            )
+        total_rows = sum(r["inserted"] for r in reports)
+        rate = total_rows / total_elapsed if total_elapsed > 0 else float(total_rows)
+        print(f"\n⏱ Всего: {total_rows} строк за {total_elapsed:.3f} сек ({rate:.0f} строк/сек)")
+
+        if errors:
+            print("\n❌ Проверка не пройдена:")
+            for error in errors:
+                print(f"  • {error}")
+            return False
+
+        print("\n✅ Проверка пройдена: количество строк и ID совпадают")
+        return True
+    finally:
+        conn.close()
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Перенос данных из JSON файлов в SQLite базу")
+    parser.add_argument("--source", type=Path, default=DEFAULT_SOURCE_DIR, help="Папка с JSON файлами")
+    parser.add_argument("--target", type=Path, default=DATABASE_PATH, help="Файл SQLite базы")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Строк в одной транзакции")
+    parser.add_argument("--force", action="store_true", help="Очистить таблицы, если база уже содержит данные")
+    args = parser.parse_args(argv)
+
+    ok = migrate(args.source, args.target, args.batch_size, args.force)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
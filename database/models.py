@@ -1,12 +1,23 @@
+import copy
 import json
 import os
+import asyncio
 from datetime import datetime
 import aiofiles
 from pathlib import Path
-from config import BASE_DIR
+from config import (
+    BASE_DIR, DB_FLUSH_DELAY, DATABASE_BACKEND, JOURNAL_COMPACT_ENTRIES, REDIS_URL, REDIS_CACHE_TTL,
+    SEND_JOB_LEASE, SEND_JOB_MAX_ATTEMPTS
+)
 import time
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 import logging
+from database.indexes import CollectionIndex
+from database.journal import Journal
+from database.archive import PostArchive
+from database.ledger import DeliveryLedger
+from database.fileio import atomic_write
+from database.serializers import SERIALIZER, find_file, stale_paths, storage_path
 
 # Пути к JSON файлам
 DATABASE_DIR = BASE_DIR / "database"
@@ -15,6 +26,14 @@ GROUPS_FILE = DATABASE_DIR / "groups.json"
 POSTS_FILE = DATABASE_DIR / "posts.json"
 SETTINGS_FILE = DATABASE_DIR / "settings.json"
 BULK_GROUPS_FILE = DATABASE_DIR / "bulk_groups.json"
+POSTS_JOURNAL_FILE = DATABASE_DIR / "posts.journal"
+SEND_JOBS_FILE = DATABASE_DIR / "send_jobs.json"
+SEND_JOBS_JOURNAL_FILE = DATABASE_DIR / "send_jobs.journal"
+ARCHIVE_DIR = DATABASE_DIR / "archive"
+LEDGER_DIR = DATABASE_DIR / "ledger"
+
+# Статусы завершённых постов, которые переносятся в архив
+ARCHIVED_POST_STATUSES = ("sent", "cancelled")
 
 # Создаем директорию для базы данных
 DATABASE_DIR.mkdir(parents=True, exist_ok=True)
@@ -31,214 +50,443 @@ DEFAULT_SETTINGS = {
     }
 }
 DEFAULT_BULK_GROUPS = {"bulk_groups": []}
+DEFAULT_SEND_JOBS = {"send_jobs": []}
+
+# Кэш JSON файлов в памяти процесса: каждый файл читается с диска один раз,
+# изменения применяются к кэшу и сбрасываются на диск отложенной записью
+_cache: Dict[Path, dict] = {}
+_dirty: Set[Path] = set()
+_flush_task: Optional[asyncio.Task] = None
+
+# Блокировки на файл: _locks защищают read-modify-write в методах Database
+# и запись снимка на диск, _load_locks - первое чтение файла в кэш
+_locks: Dict[Path, asyncio.Lock] = {}
+_load_locks: Dict[Path, asyncio.Lock] = {}
+
+_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "read_time": 0.0,
+    "flushes": 0
+}
+
+# Журналы изменений: файл -> журнал. Изменения таких файлов дописываются
+# в журнал, а сам файл перезаписывается только при уплотнении
+_journals: Dict[Path, Journal] = {
+    POSTS_FILE: Journal(POSTS_JOURNAL_FILE),
+    SEND_JOBS_FILE: Journal(SEND_JOBS_JOURNAL_FILE)
+}
+
+# Архив завершённых постов
+_posts_archive = PostArchive(ARCHIVE_DIR)
+
+# Журнал результатов отправки
+_delivery_ledger = DeliveryLedger(LEDGER_DIR)
 
-async def init_db():
+# Хеш-индексы коллекций поверх кэша: (путь, коллекция) -> индекс
+_indexes: Dict[Tuple[Path, str], CollectionIndex] = {}
+INDEX_FIELDS = {
+    "accounts": ("phone",),
+    "groups": ("group_id",)
+}
+# Поля с расписанием "ЧЧ:ММ", по которым строится индекс минут суток
+MINUTE_FIELDS = {
+    "automated_posts": "times"
+}
+
+def _copy(value):
+    """Копия данных из кэша: изменения в вызывающем коде не должны попадать в кэш и индексы"""
+    return copy.deepcopy(value)
+
+async def init_json_db():
     """Инициализация JSON файлов базы данных"""
     files = {
         ACCOUNTS_FILE: DEFAULT_ACCOUNTS,
         GROUPS_FILE: DEFAULT_GROUPS,
         POSTS_FILE: DEFAULT_POSTS,
         SETTINGS_FILE: DEFAULT_SETTINGS,
-        BULK_GROUPS_FILE: DEFAULT_BULK_GROUPS
+        BULK_GROUPS_FILE: DEFAULT_BULK_GROUPS,
+        SEND_JOBS_FILE: DEFAULT_SEND_JOBS
     }
     
     for file_path, default_data in files.items():
-        if not file_path.exists():
-            async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(default_data, ensure_ascii=False, indent=4))
+        if find_file(file_path) is None:
+            await atomic_write(storage_path(file_path), SERIALIZER.dumps(default_data))
+
+class JSONDatabase:
+    @staticmethod
+    def _cache_key(file_path) -> Path:
+        """Нормализация пути к файлу для ключа кэша"""
+        path = Path(file_path)
+        if not path.is_absolute():
+            path = BASE_DIR / path
+        return path
+
+    @staticmethod
+    def _lock(file_path: Path) -> asyncio.Lock:
+        """Блокировка файла для изменения данных и записи на диск"""
+        return _locks.setdefault(JSONDatabase._cache_key(file_path), asyncio.Lock())
 
-class Database:
     @staticmethod
     async def _read_json(file_path: Path) -> dict:
-        """Чтение JSON файла"""
-        try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+        """Чтение JSON файла (из кэша, с диска только при первом обращении)"""
+        start = time.perf_counter()
+        key = JSONDatabase._cache_key(file_path)
+        data = _cache.get(key)
+        if data is not None:
+            _cache_stats["hits"] += 1
+            _cache_stats["read_time"] += time.perf_counter() - start
+            return data
+
+        async with _load_locks.setdefault(key, asyncio.Lock()):
+            # Файл мог загрузить другой обработчик, пока мы ждали блокировку
+            data = _cache.get(key)
+            if data is not None:
+                return data
+
+            found = find_file(key)
+            if found is None:
+                return {}
+            path, serializer = found
+            mode = 'rb' if serializer.binary else 'r'
+            encoding = None if serializer.binary else 'utf-8'
+            async with aiofiles.open(path, mode, encoding=encoding) as f:
                 content = await f.read()
-                return json.loads(content)
-        except FileNotFoundError:
-            return {}
+                data = serializer.loads(content)
+            if serializer is not SERIALIZER:
+                # Формат сменился - при следующем сбросе файл перезапишется в новом
+                _dirty.add(key)
+                JSONDatabase._schedule_flush()
+
+            journal = _journals.get(key)
+            if journal is not None:
+                applied = await journal.replay(data)
+                if applied:
+                    logging.info(f"Восстановлено {applied} изменений из журнала {journal.path.name}")
+
+            _cache[key] = data
+            _cache_stats["misses"] += 1
+            _cache_stats["read_time"] += time.perf_counter() - start
+            return data
 
     @staticmethod
     async def _write_json(file_path: Path, data: dict):
-        """Запись в JSON файл"""
-        async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(data, ensure_ascii=False, indent=4))
+        """Запись в JSON файл (обновляет кэш, на диск пишет отложенно)"""
+        key = JSONDatabase._cache_key(file_path)
+        if _cache.get(key) is not data:
+            # Файл заменён целиком - индексы по нему перестроятся при следующем обращении
+            for index_key in [k for k in _indexes if k[0] == key]:
+                del _indexes[index_key]
+        _cache[key] = data
+        _dirty.add(key)
+        JSONDatabase._schedule_flush()
+
+    @staticmethod
+    async def _log_change(file_path: Path, entry: dict):
+        """Запись изменения в журнал файла вместо перезаписи всего файла"""
+        key = JSONDatabase._cache_key(file_path)
+        journal = _journals[key]
+        await journal.append(entry)
+        if journal.entries >= JOURNAL_COMPACT_ENTRIES:
+            # Уплотнение: снимок перезаписывается при ближайшем сбросе на диск
+            _dirty.add(key)
+            JSONDatabase._schedule_flush()
+
+    @staticmethod
+    async def _get_index(file_path: Path, collection: str) -> CollectionIndex:
+        """Индекс коллекции JSON файла (строится при первом обращении)"""
+        data = await JSONDatabase._read_json(file_path)
+        index_key = (JSONDatabase._cache_key(file_path), collection)
+        index = _indexes.get(index_key)
+        if index is None:
+            index = CollectionIndex(INDEX_FIELDS.get(collection, ()), minute_field=MINUTE_FIELDS.get(collection))
+            index.rebuild(data.setdefault(collection, []))
+            _indexes[index_key] = index
+        return index
+
+    @staticmethod
+    async def _next_id(file_path: Path, data: dict, collection: str) -> int:
+        """Следующий ID коллекции из счётчика в файле (ID не переиспользуются после удаления)"""
+        sequences = data.setdefault("sequences", {})
+        last_id = sequences.get(collection)
+        if last_id is None:
+            # Файл создан до появления счётчиков - продолжаем с максимального ID
+            last_id = max((record.get("id", 0) for record in data.get(collection, [])), default=0)
+            if JSONDatabase._cache_key(file_path) == POSTS_FILE and collection == "posts":
+                last_id = max(last_id, await _posts_archive.max_id())
+        sequences[collection] = last_id + 1
+        return last_id + 1
+
+    @staticmethod
+    def _resolve_ids(index: CollectionIndex, ids: List[int]) -> Tuple[List[dict], List[int]]:
+        """Поиск записей по списку ID за один проход"""
+        found = []
+        missing = []
+        for record_id in ids:
+            record = index.get(record_id)
+            if record is None:
+                missing.append(record_id)
+            else:
+                found.append(_copy(record))
+        return found, missing
+
+    @staticmethod
+    def _schedule_flush():
+        """Планирует отложенный сброс изменённых файлов на диск"""
+        global _flush_task
+        if _flush_task is not None and not _flush_task.done():
+            return
+        _flush_task = asyncio.create_task(JSONDatabase._delayed_flush())
+
+    @staticmethod
+    async def _delayed_flush():
+        """Сбрасывает изменения после задержки, объединяя несколько записей в одну"""
+        await asyncio.sleep(DB_FLUSH_DELAY)
+        try:
+            await JSONDatabase.flush()
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении базы данных на диск: {str(e)}")
+
+    @staticmethod
+    async def flush():
+        """Запись всех изменённых файлов из кэша на диск"""
+        while _dirty:
+            key = _dirty.pop()
+            async with JSONDatabase._lock(key):
+                journal = _journals.get(key)
+                # Всё, что записано в журнал до этого момента, попадёт в снимок
+                journal_offset = journal.size if journal else 0
+                content = SERIALIZER.dumps(_cache[key])
+                try:
+                    await atomic_write(storage_path(key), content)
+                except Exception:
+                    _dirty.add(key)
+                    raise
+                for stale in stale_paths(key):
+                    stale.unlink(missing_ok=True)
+                if journal:
+                    await journal.compact(journal_offset)
+                _cache_stats["flushes"] += 1
+
+    @staticmethod
+    async def close():
+        """Сброс изменений на диск перед остановкой бота"""
+        await JSONDatabase.flush()
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        """Статистика кэша: попадания, промахи, среднее время чтения в мс"""
+        reads = _cache_stats["hits"] + _cache_stats["misses"]
+        return {
+            **_cache_stats,
+            "cached_files": len(_cache),
+            "dirty_files": len(_dirty),
+            "avg_read_ms": (_cache_stats["read_time"] / reads * 1000) if reads else 0.0
+        }
 
     @staticmethod
     async def add_account(phone: str, session_file: str):
         """Добавление нового аккаунта"""
-        data = await Database._read_json(ACCOUNTS_FILE)
-        accounts = data.get("accounts", [])
+        async with JSONDatabase._lock(ACCOUNTS_FILE):
+            data = await JSONDatabase._read_json(ACCOUNTS_FILE)
+            accounts = data.get("accounts", [])
         
-        # Генерируем новый ID
-        new_id = max([acc.get("id", 0) for acc in accounts], default=0) + 1
+            # Генерируем новый ID
+            new_id = await JSONDatabase._next_id(ACCOUNTS_FILE, data, "accounts")
         
-        account = {
-            "id": new_id,
-            "phone": phone,
-            "session_file": f"{phone}.session",
-            "status": "active",  # active, frozen, banned
-            "last_used": None,
-            "created_at": int(time.time())
-        }
+            account = {
+                "id": new_id,
+                "phone": phone,
+                "session_file": f"{phone}.session",
+                "status": "active",  # active, frozen, banned
+                "last_used": None,
+                "created_at": int(time.time())
+            }
         
-        accounts.append(account)
-        data["accounts"] = accounts
-        await Database._write_json(ACCOUNTS_FILE, data)
+            accounts.append(account)
+            data["accounts"] = accounts
+            index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
+            index.add(account)
+            await JSONDatabase._write_json(ACCOUNTS_FILE, data)
 
     @staticmethod
     async def get_active_accounts():
         """Получение активных аккаунтов"""
-        data = await Database._read_json(ACCOUNTS_FILE)
-        return [acc for acc in data.get("accounts", []) if acc["status"] == "active"]
+        index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
+        return _copy(index.with_status("active"))
 
     @staticmethod
     async def update_account_status(account_id: int, status: str):
         """Обновление статуса аккаунта"""
-        data = await Database._read_json(ACCOUNTS_FILE)
-        accounts = data.get("accounts", [])
+        async with JSONDatabase._lock(ACCOUNTS_FILE):
+            data = await JSONDatabase._read_json(ACCOUNTS_FILE)
+            index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
         
-        for account in accounts:
-            if account["id"] == account_id:
+            account = index.get(account_id)
+            if account:
+                index.discard(account)
                 account["status"] = status
                 account["last_used"] = int(time.time())
-                break
+                index.add(account)
                 
-        data["accounts"] = accounts
-        await Database._write_json(ACCOUNTS_FILE, data)
+            await JSONDatabase._write_json(ACCOUNTS_FILE, data)
 
     @staticmethod
     async def get_account_by_id(account_id: int):
         """Получение аккаунта по ID"""
-        data = await Database._read_json(ACCOUNTS_FILE)
-        for account in data.get("accounts", []):
-            if account["id"] == account_id:
-                return account
-        return None
+        index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
+        return _copy(index.get(account_id))
+
+    @staticmethod
+    async def get_accounts_by_ids(account_ids: List[int]) -> Tuple[List[dict], List[int]]:
+        """Получение аккаунтов по списку ID: (найденные в порядке запроса, ненайденные ID)"""
+        index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
+        return JSONDatabase._resolve_ids(index, account_ids)
+
+    @staticmethod
+    async def get_account_by_phone(phone: str):
+        """Получение аккаунта по номеру телефона"""
+        index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
+        return _copy(index.get_by("phone", phone))
 
     @staticmethod
     async def delete_account(account_id: int):
         """Удаление аккаунта"""
-        data = await Database._read_json(ACCOUNTS_FILE)
-        accounts = data.get("accounts", [])
-        data["accounts"] = [acc for acc in accounts if acc["id"] != account_id]
-        await Database._write_json(ACCOUNTS_FILE, data)
+        async with JSONDatabase._lock(ACCOUNTS_FILE):
+            data = await JSONDatabase._read_json(ACCOUNTS_FILE)
+            index = await JSONDatabase._get_index(ACCOUNTS_FILE, "accounts")
+            account = index.get(account_id)
+            if not account:
+                return
+            index.discard(account)
+            data["accounts"] = [acc for acc in data.get("accounts", []) if acc is not account]
+            await JSONDatabase._write_json(ACCOUNTS_FILE, data)
 
     @staticmethod
     async def add_group(group_id: str, title: str, username: str = None, invite_link: str = None):
         """Добавление новой группы"""
-        data = await Database._read_json(GROUPS_FILE)
-        groups = data.get("groups", [])
+        async with JSONDatabase._lock(GROUPS_FILE):
+            data = await JSONDatabase._read_json(GROUPS_FILE)
+            groups = data.get("groups", [])
         
-        # Генерируем новый ID
-        new_id = max([group.get("id", 0) for group in groups], default=0) + 1
+            # Генерируем новый ID
+            new_id = await JSONDatabase._next_id(GROUPS_FILE, data, "groups")
         
-        group = {
-            "id": new_id,
-            "group_id": group_id,
-            "title": title,
-            "username": username,
-            "invite_link": invite_link,
-            "status": "active",
-            "last_post": None,
-            "created_at": int(time.time())
-        }
+            group = {
+                "id": new_id,
+                "group_id": group_id,
+                "title": title,
+                "username": username,
+                "invite_link": invite_link,
+                "status": "active",
+                "last_post": None,
+                "created_at": int(time.time())
+            }
         
-        # Обновляем существующую группу или добавляем новую
-        updated = False
-        for i, existing_group in enumerate(groups):
-            if existing_group["group_id"] == group_id:
-                groups[i] = group
-                updated = True
-                break
-                
-        if not updated:
-            groups.append(group)
+            # Обновляем существующую группу или добавляем новую
+            index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+            existing_group = index.get_by("group_id", group_id)
+            if existing_group:
+                index.discard(existing_group)
+                # Заменяем содержимое записи на месте, сохраняя её позицию в списке
+                existing_group.clear()
+                existing_group.update(group)
+                group = existing_group
+            else:
+                groups.append(group)
+            index.add(group)
             
-        data["groups"] = groups
-        await Database._write_json(GROUPS_FILE, data)
+            data["groups"] = groups
+            await JSONDatabase._write_json(GROUPS_FILE, data)
 
     @staticmethod
     async def get_active_groups():
         """Получение активных групп"""
-        data = await Database._read_json(GROUPS_FILE)
-        return sorted(
-            [g for g in data.get("groups", []) if g["status"] == "active"],
+        index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+        return _copy(sorted(
+            index.with_status("active"),
             key=lambda x: x["title"]
-        )
+        ))
 
     @staticmethod
     async def delete_group(group_id: int):
         """Удаление группы"""
-        data = await Database._read_json(GROUPS_FILE)
-        groups = data.get("groups", [])
-        data["groups"] = [g for g in groups if g["id"] != group_id]
-        await Database._write_json(GROUPS_FILE, data)
+        async with JSONDatabase._lock(GROUPS_FILE):
+            data = await JSONDatabase._read_json(GROUPS_FILE)
+            index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+            group = index.get(group_id)
+            if not group:
+                return
+            index.discard(group)
+            data["groups"] = [g for g in data.get("groups", []) if g is not group]
+            await JSONDatabase._write_json(GROUPS_FILE, data)
 
     @staticmethod
     async def get_group_by_group_id(group_id: str):
         """Получение группы по group_id"""
-        data = await Database._read_json(GROUPS_FILE)
-        for group in data.get("groups", []):
-            if str(group["group_id"]) == str(group_id):
-                return group
-        return None
+        index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+        return _copy(index.get_by("group_id", group_id))
 
     @staticmethod
     async def update_group_status(group_id: str, status: str):
         """Обновление статуса группы"""
-        data = await Database._read_json(GROUPS_FILE)
-        groups = data.get("groups", [])
+        async with JSONDatabase._lock(GROUPS_FILE):
+            data = await JSONDatabase._read_json(GROUPS_FILE)
+            index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
         
-        for group in groups:
-            if group["group_id"] == group_id:
+            group = index.get_by("group_id", group_id)
+            if group:
+                index.discard(group)
                 group["status"] = status
-                break
+                index.add(group)
                 
-        data["groups"] = groups
-        await Database._write_json(GROUPS_FILE, data)
+            await JSONDatabase._write_json(GROUPS_FILE, data)
 
     @staticmethod
     async def add_post(content: str) -> int:
         """Добавление нового поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("posts", [])
+        async with JSONDatabase._lock(POSTS_FILE):
+            data = await JSONDatabase._read_json(POSTS_FILE)
+            posts = data.get("posts", [])
         
-        # Генерируем новый ID
-        new_id = max([post.get("id", 0) for post in posts], default=0) + 1
+            # Генерируем новый ID
+            new_id = await JSONDatabase._next_id(POSTS_FILE, data, "posts")
         
-        post = {
-            "id": new_id,
-            "content": content,
-            "created_at": int(time.time())
-        }
+            post = {
+                "id": new_id,
+                "content": content,
+                "created_at": int(time.time())
+            }
         
-        posts.append(post)
-        data["posts"] = posts
-        await Database._write_json(POSTS_FILE, data)
+            posts.append(post)
+            data["posts"] = posts
+            index = await JSONDatabase._get_index(POSTS_FILE, "posts")
+            index.add(post)
+            await JSONDatabase._log_change(POSTS_FILE, {"op": "insert", "collection": "posts", "record": post})
         
-        return new_id
+            return new_id
 
     @staticmethod
     async def get_setting(key: str) -> str:
         """Получение значения настройки"""
-        data = await Database._read_json(SETTINGS_FILE)
+        data = await JSONDatabase._read_json(SETTINGS_FILE)
         return data.get("settings", {}).get(key)
 
     @staticmethod
     async def update_setting(key: str, value: str):
         """Обновление настройки"""
-        data = await Database._read_json(SETTINGS_FILE)
-        settings = data.get("settings", {})
-        settings[key] = str(value)
-        data["settings"] = settings
-        await Database._write_json(SETTINGS_FILE, data)
+        async with JSONDatabase._lock(SETTINGS_FILE):
+            data = await JSONDatabase._read_json(SETTINGS_FILE)
+            settings = data.get("settings", {})
+            settings[key] = str(value)
+            data["settings"] = settings
+            await JSONDatabase._write_json(SETTINGS_FILE, data)
 
     @staticmethod
     async def get_all_settings() -> dict:
         """Получение всех настроек"""
-        data = await Database._read_json(SETTINGS_FILE)
-        return data.get("settings", {})
+        data = await JSONDatabase._read_json(SETTINGS_FILE)
+        return dict(data.get("settings", {}))
 
     @staticmethod
     async def add_scheduled_post(
@@ -248,87 +496,307 @@ class Database:
         schedule_time: int
     ) -> int:
         """Добавление отложенного поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("posts", [])
+        async with JSONDatabase._lock(POSTS_FILE):
+            data = await JSONDatabase._read_json(POSTS_FILE)
+            posts = data.get("posts", [])
         
-        # Генерируем новый ID
-        new_id = max([post.get("id", 0) for post in posts], default=0) + 1
+            # Генерируем новый ID
+            new_id = await JSONDatabase._next_id(POSTS_FILE, data, "posts")
         
-        post = {
-            "id": new_id,
-            "message": message_data,
-            "groups": groups,
-            "accounts": accounts,
-            "schedule_time": schedule_time,  # Время отправки в unix timestamp
-            "status": "pending",  # pending, sent, cancelled
-            "created_at": int(time.time())
-        }
+            post = {
+                "id": new_id,
+                "message": _copy(message_data),
+                "groups": list(groups),
+                "accounts": list(accounts),
+                "schedule_time": schedule_time,  # Время отправки в unix timestamp
+                "status": "pending",  # pending, sent, cancelled
+                "created_at": int(time.time())
+            }
         
-        posts.append(post)
-        data["posts"] = posts
-        await Database._write_json(POSTS_FILE, data)
-        return new_id
+            posts.append(post)
+            data["posts"] = posts
+            index = await JSONDatabase._get_index(POSTS_FILE, "posts")
+            index.add(post)
+            await JSONDatabase._log_change(POSTS_FILE, {"op": "insert", "collection": "posts", "record": post})
+            return new_id
 
     @staticmethod
     async def get_pending_posts() -> List[dict]:
         """Получение всех отложенных постов со статусом pending"""
-        data = await Database._read_json(POSTS_FILE)
-        return [
-            post for post in data.get("posts", [])
-            if post.get("status") == "pending"
-        ]
+        index = await JSONDatabase._get_index(POSTS_FILE, "posts")
+        return _copy(index.with_status("pending"))
 
     @staticmethod
     async def get_post_by_id(post_id: int) -> Optional[dict]:
         """Получение поста по ID"""
-        data = await Database._read_json(POSTS_FILE)
-        for post in data.get("posts", []):
-            if post["id"] == post_id:
-                return post
-        return None
+        index = await JSONDatabase._get_index(POSTS_FILE, "posts")
+        return _copy(index.get(post_id))
 
     @staticmethod
     async def update_post_status(post_id: int, status: str):
         """Обновление статуса поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("posts", [])
+        async with JSONDatabase._lock(POSTS_FILE):
+            index = await JSONDatabase._get_index(POSTS_FILE, "posts")
         
-        for post in posts:
-            if post["id"] == post_id:
-                post["status"] = status
-                break
+            post = index.get(post_id)
+            if not post:
+                return
+            index.discard(post)
+            post["status"] = status
+            index.add(post)
                 
-        data["posts"] = posts
-        await Database._write_json(POSTS_FILE, data)
+            await JSONDatabase._log_change(POSTS_FILE, {
+                "op": "update", "collection": "posts", "id": post["id"], "fields": {"status": status}
+            })
 
     @staticmethod
     async def delete_post(post_id: int):
         """Удаление поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("posts", [])
-        data["posts"] = [p for p in posts if p["id"] != post_id]
-        await Database._write_json(POSTS_FILE, data)
+        async with JSONDatabase._lock(POSTS_FILE):
+            data = await JSONDatabase._read_json(POSTS_FILE)
+            index = await JSONDatabase._get_index(POSTS_FILE, "posts")
+            post = index.get(post_id)
+            if not post:
+                return
+            index.discard(post)
+            data["posts"] = [p for p in data.get("posts", []) if p is not post]
+            await JSONDatabase._log_change(POSTS_FILE, {"op": "delete", "collection": "posts", "id": post["id"]})
+
+    @staticmethod
+    async def archive_finished_posts() -> int:
+        """Перенос отправленных и отменённых постов в архив"""
+        async with JSONDatabase._lock(POSTS_FILE):
+            data = await JSONDatabase._read_json(POSTS_FILE)
+            index = await JSONDatabase._get_index(POSTS_FILE, "posts")
+            finished = [post for status in ARCHIVED_POST_STATUSES for post in index.with_status(status)]
+            if not finished:
+                return 0
+
+            # Сначала пишем в архив, потом удаляем из рабочего файла
+            await _posts_archive.append(finished)
+
+            finished_ids = {id(post) for post in finished}
+            for post in finished:
+                index.discard(post)
+            data["posts"] = [p for p in data.get("posts", []) if id(p) not in finished_ids]
+            for post in finished:
+                await JSONDatabase._log_change(POSTS_FILE, {"op": "delete", "collection": "posts", "id": post["id"]})
+            return len(finished)
+
+    @staticmethod
+    async def get_archived_posts(start_time: int = None, end_time: int = None, status: str = None) -> List[dict]:
+        """Получение постов из архива за период (по времени отправки)"""
+        return await _posts_archive.query(start_time, end_time, status)
+
+    @staticmethod
+    async def get_archived_post(post_id: int) -> Optional[dict]:
+        """Получение поста из архива по ID"""
+        return await _posts_archive.get(post_id)
+
+    @staticmethod
+    async def record_delivery(record: dict):
+        """Запись результата попытки отправки в журнал доставки"""
+        await _delivery_ledger.append(record)
+
+    @staticmethod
+    async def get_deliveries(
+        start_time: int = None,
+        end_time: int = None,
+        post_id: int = None,
+        run: int = None,
+        outcome: str = None
+    ) -> List[dict]:
+        """Результаты отправки за период с фильтрами по посту, запуску и результату"""
+        return await _delivery_ledger.query(start_time, end_time, post_id, run, outcome)
+
+    @staticmethod
+    async def get_failed_deliveries(post_id: int, run: int = None) -> List[dict]:
+        """Последние неудачные попытки по группам поста (для повторной отправки)"""
+        records = await _delivery_ledger.query(post_id=post_id, run=run)
+        return DeliveryLedger.latest_failures(records)
+
+    @staticmethod
+    def _job_matches(job: dict, kind: str, post_id: int, run: int) -> bool:
+        return job["kind"] == kind and str(job["post_id"]) == str(post_id) and job["run"] == run
+
+    @staticmethod
+    async def _update_send_job(job: dict, index: CollectionIndex, fields: dict):
+        """Изменение задания отправки с записью в журнал"""
+        fields["updated_at"] = int(time.time())
+        index.discard(job)
+        job.update(fields)
+        index.add(job)
+        await JSONDatabase._log_change(SEND_JOBS_FILE, {
+            "op": "update", "collection": "send_jobs", "id": job["id"], "fields": fields
+        })
+
+    @staticmethod
+    async def enqueue_send_jobs(kind: str, post_id: int, run: int, assignments: List[Tuple[int, int]]) -> int:
+        """Постановка заданий (группа, аккаунт) запуска поста в очередь; уже поставленные группы пропускаются"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            data = await JSONDatabase._read_json(SEND_JOBS_FILE)
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            queued = {
+                str(job["group_id"]) for job in index.by_id.values()
+                if JSONDatabase._job_matches(job, kind, post_id, run)
+            }
+            now = int(time.time())
+            added = 0
+            for group_id, account_id in assignments:
+                if str(group_id) in queued:
+                    continue
+                queued.add(str(group_id))
+                job = {
+                    "id": await JSONDatabase._next_id(SEND_JOBS_FILE, data, "send_jobs"),
+                    "kind": kind,
+                    "post_id": post_id,
+                    "run": run,
+                    "group_id": group_id,
+                    "account_id": account_id,
+                    "status": "pending",  # pending, claimed, done, dead
+                    "attempts": 0,
+                    "lease_until": None,
+                    "error": None,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                data.setdefault("send_jobs", []).append(job)
+                index.add(job)
+                await JSONDatabase._log_change(SEND_JOBS_FILE, {"op": "insert", "collection": "send_jobs", "record": job})
+                added += 1
+            return added
+
+    @staticmethod
+    async def claim_send_jobs(kind: str, post_id: int, run: int, limit: int = None) -> List[dict]:
+        """Захват заданий запуска на SEND_JOB_LEASE секунд (свободных и с истёкшей арендой)"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            now = int(time.time())
+            candidates = index.with_status("pending") + [
+                job for job in index.with_status("claimed") if job["lease_until"] <= now
+            ]
+            claimed = []
+            for job in sorted(candidates, key=lambda j: j["id"]):
+                if limit is not None and len(claimed) >= limit:
+                    break
+                if not JSONDatabase._job_matches(job, kind, post_id, run):
+                    continue
+                if job["attempts"] >= SEND_JOB_MAX_ATTEMPTS:
+                    # Задание уже брали максимальное число раз и не завершили
+                    await JSONDatabase._update_send_job(job, index, {
+                        "status": "dead", "error": job["error"] or "Аренда истекла без подтверждения"
+                    })
+                    continue
+                await JSONDatabase._update_send_job(job, index, {
+                    "status": "claimed", "attempts": job["attempts"] + 1, "lease_until": now + SEND_JOB_LEASE
+                })
+                claimed.append(dict(job))
+            return claimed
+
+    @staticmethod
+    async def renew_send_job(job_id: int, attempts: int) -> bool:
+        """Продление аренды задания перед отправкой; False - аренду уже перехватил другой захват"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            job = index.get(job_id)
+            if not job or job["status"] != "claimed" or job["attempts"] != attempts:
+                return False
+            await JSONDatabase._update_send_job(job, index, {"lease_until": int(time.time()) + SEND_JOB_LEASE})
+            return True
+
+    @staticmethod
+    async def ack_send_job(job_id: int):
+        """Подтверждение выполненного задания"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            job = index.get(job_id)
+            if job:
+                await JSONDatabase._update_send_job(job, index, {"status": "done", "lease_until": None})
+
+    @staticmethod
+    async def fail_send_job(job_id: int, error: str, retry: bool = False):
+        """Неудачное задание: возврат в очередь (retry) или в dead-letter"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            job = index.get(job_id)
+            if not job:
+                return
+            status = "pending" if retry and job["attempts"] < SEND_JOB_MAX_ATTEMPTS else "dead"
+            await JSONDatabase._update_send_job(job, index, {"status": status, "lease_until": None, "error": error})
+
+    @staticmethod
+    async def defer_send_job(job_id: int, error: str, account_id: int = None):
+        """Возврат задания в очередь без траты попытки (FloodWait), опционально на другой аккаунт"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            job = index.get(job_id)
+            if not job:
+                return
+            fields = {"status": "pending", "attempts": max(job["attempts"] - 1, 0), "lease_until": None, "error": error}
+            if account_id is not None:
+                fields["account_id"] = account_id
+            await JSONDatabase._update_send_job(job, index, fields)
+
+    @staticmethod
+    async def get_send_jobs(kind: str, post_id: int, run: int, status: str = None) -> List[dict]:
+        """Задания запуска поста, опционально с фильтром по статусу"""
+        index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+        jobs = [
+            job for job in index.by_id.values()
+            if JSONDatabase._job_matches(job, kind, post_id, run) and (status is None or job["status"] == status)
+        ]
+        return _copy(sorted(jobs, key=lambda j: j["id"]))
+
+    @staticmethod
+    async def get_dead_send_jobs() -> List[dict]:
+        """Задания в dead-letter"""
+        index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+        return _copy(index.with_status("dead"))
+
+    @staticmethod
+    async def finish_send_jobs(kind: str, post_id: int, run: int) -> Dict[str, int]:
+        """Удаление выполненных заданий завершённого запуска; задания в dead-letter остаются"""
+        async with JSONDatabase._lock(SEND_JOBS_FILE):
+            data = await JSONDatabase._read_json(SEND_JOBS_FILE)
+            index = await JSONDatabase._get_index(SEND_JOBS_FILE, "send_jobs")
+            counts = {"done": 0, "dead": 0}
+            done = []
+            for job in index.by_id.values():
+                if JSONDatabase._job_matches(job, kind, post_id, run) and job["status"] in counts:
+                    counts[job["status"]] += 1
+                    if job["status"] == "done":
+                        done.append(job)
+            done_ids = {id(job) for job in done}
+            for job in done:
+                index.discard(job)
+            data["send_jobs"] = [j for j in data.get("send_jobs", []) if id(j) not in done_ids]
+            for job in done:
+                await JSONDatabase._log_change(SEND_JOBS_FILE, {"op": "delete", "collection": "send_jobs", "id": job["id"]})
+            return counts
 
     @staticmethod
     async def get_groups() -> List[dict]:
         """Получение всех групп"""
-        data = await Database._read_json(GROUPS_FILE)
-        return data.get("groups", [])
+        data = await JSONDatabase._read_json(GROUPS_FILE)
+        return _copy(data.get("groups", []))
 
     @staticmethod
     async def get_accounts() -> List[dict]:
         """Получение всех аккаунтов"""
-        data = await Database._read_json(ACCOUNTS_FILE)
-        return data.get("accounts", [])
+        data = await JSONDatabase._read_json(ACCOUNTS_FILE)
+        return _copy(data.get("accounts", []))
 
     @staticmethod
     async def get_group_by_id(group_id: str):
         """Получение группы по внутреннему id"""
-        data = await Database._read_json(GROUPS_FILE)
-        for group in data.get("groups", []):
-            if str(group["id"]) == str(group_id):
-                return group
-        return None
+        index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+        return _copy(index.get(group_id))
+
+    @staticmethod
+    async def get_groups_by_ids(group_ids: List[int]) -> Tuple[List[dict], List[int]]:
+        """Получение групп по списку внутренних ID: (найденные в порядке запроса, ненайденные ID)"""
+        index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+        return JSONDatabase._resolve_ids(index, group_ids)
 
     @staticmethod
     async def add_automated_post(
@@ -338,43 +806,55 @@ class Database:
         times: List[str]
     ) -> int:
         """Добавление нового автоматизированного поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("automated_posts", [])
+        async with JSONDatabase._lock(POSTS_FILE):
+            data = await JSONDatabase._read_json(POSTS_FILE)
+            posts = data.get("automated_posts", [])
         
-        # Генерируем новый ID
-        new_id = max([post.get("id", 0) for post in posts], default=0) + 1
+            # Генерируем новый ID
+            new_id = await JSONDatabase._next_id(POSTS_FILE, data, "automated_posts")
         
-        post = {
-            "id": new_id,
-            "message": message_data,
-            "groups": groups,
-            "accounts": accounts,
-            "times": times,  # Список времен для ежедневной отправки
-            "status": "active",  # active, paused, deleted
-            "created_at": int(time.time())
-        }
+            post = {
+                "id": new_id,
+                "message": _copy(message_data),
+                "groups": list(groups),
+                "accounts": list(accounts),
+                "times": list(times),  # Список времен для ежедневной отправки
+                "status": "active",  # active, paused, deleted
+                "created_at": int(time.time())
+            }
         
-        if "automated_posts" not in data:
-            data["automated_posts"] = []
+            if "automated_posts" not in data:
+                data["automated_posts"] = []
             
-        data["automated_posts"].append(post)
-        await Database._write_json(POSTS_FILE, data)
-        return new_id
+            data["automated_posts"].append(post)
+            index = await JSONDatabase._get_index(POSTS_FILE, "automated_posts")
+            index.add(post)
+            await JSONDatabase._log_change(POSTS_FILE, {"op": "insert", "collection": "automated_posts", "record": post})
+            return new_id
 
     @staticmethod
     async def get_automated_posts() -> List[dict]:
         """Получение всех автоматизированных постов"""
-        data = await Database._read_json(POSTS_FILE)
-        return data.get("automated_posts", [])
+        data = await JSONDatabase._read_json(POSTS_FILE)
+        return _copy(data.get("automated_posts", []))
 
     @staticmethod
     async def get_automated_post_by_id(post_id: int) -> Optional[dict]:
         """Получение автоматизированного поста по ID"""
-        data = await Database._read_json(POSTS_FILE)
-        for post in data.get("automated_posts", []):
-            if post["id"] == post_id:
-                return post
-        return None
+        index = await JSONDatabase._get_index(POSTS_FILE, "automated_posts")
+        return _copy(index.get(post_id))
+
+    @staticmethod
+    async def get_automated_posts_at(minute: int) -> List[dict]:
+        """Активные автоматизированные посты, запланированные на минуту суток (0-1439)"""
+        index = await JSONDatabase._get_index(POSTS_FILE, "automated_posts")
+        return _copy(index.at_minute(minute, status="active"))
+
+    @staticmethod
+    async def get_automated_minutes() -> List[int]:
+        """Минуты суток, на которые запланирован хотя бы один активный автоматизированный пост"""
+        index = await JSONDatabase._get_index(POSTS_FILE, "automated_posts")
+        return index.minutes(status="active")
 
     @staticmethod
     async def update_automated_post(
@@ -383,156 +863,178 @@ class Database:
         accounts: List[int] = None,
         times: List[str] = None,
         status: str = None,
-        message_data: dict = None
+        message_data: dict = None,
+        last_fire: int = None
     ):
         """Обновление автоматизированного поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("automated_posts", [])
-        updated = False
+        async with JSONDatabase._lock(POSTS_FILE):
+            index = await JSONDatabase._get_index(POSTS_FILE, "automated_posts")
         
-        for post in posts:
-            if post["id"] == post_id:
-                if groups is not None:
-                    post["groups"] = sorted(list(set(groups)))  # Убираем дубликаты и сортируем
-                if accounts is not None:
-                    post["accounts"] = sorted(list(set(accounts)))  # Убираем дубликаты и сортируем
-                if times is not None:
-                    post["times"] = sorted(list(set(times)))  # Убираем дубликаты и сортируем
-                if status is not None:
-                    post["status"] = status
-                if message_data is not None:
-                    post["message"] = message_data
-                updated = True
-                break
-                
-        if not updated:
-            logging.error(f"Пост с ID {post_id} не найден при обновлении")
-            return False
+            post = index.get(post_id)
+            if not post:
+                logging.error(f"Пост с ID {post_id} не найден при обновлении")
+                return False
+            
+            fields = {}
+            if groups is not None:
+                fields["groups"] = sorted(list(set(groups)))  # Убираем дубликаты и сортируем
+            if accounts is not None:
+                fields["accounts"] = sorted(list(set(accounts)))  # Убираем дубликаты и сортируем
+            if times is not None:
+                fields["times"] = sorted(list(set(times)))  # Убираем дубликаты и сортируем
+            if status is not None:
+                fields["status"] = status
+            if message_data is not None:
+                fields["message"] = _copy(message_data)
+            if last_fire is not None:
+                fields["last_fire"] = last_fire  # Последний отработанный слот расписания
+
+            index.discard(post)
+            post.update(fields)
+            index.add(post)
             
-        data["automated_posts"] = posts
-        await Database._write_json(POSTS_FILE, data)
-        return True
+            await JSONDatabase._log_change(POSTS_FILE, {
+                "op": "update", "collection": "automated_posts", "id": post["id"], "fields": fields
+            })
+            return True
 
     @staticmethod
     async def delete_automated_post(post_id: int):
         """Удаление автоматизированного поста"""
-        data = await Database._read_json(POSTS_FILE)
-        posts = data.get("automated_posts", [])
-        data["automated_posts"] = [p for p in posts if p["id"] != post_id]
-        await Database._write_json(POSTS_FILE, data)
+        async with JSONDatabase._lock(POSTS_FILE):
+            data = await JSONDatabase._read_json(POSTS_FILE)
+            index = await JSONDatabase._get_index(POSTS_FILE, "automated_posts")
+            post = index.get(post_id)
+            if not post:
+                return
+            index.discard(post)
+            data["automated_posts"] = [p for p in data.get("automated_posts", []) if p is not post]
+            await JSONDatabase._log_change(POSTS_FILE, {"op": "delete", "collection": "automated_posts", "id": post["id"]})
+
+    @staticmethod
+    def _bulk_group_ids(bulk_group: dict) -> List[int]:
+        """ID групп оптомгруппы (старые записи хранят копии групп в "groups")"""
+        if "group_ids" in bulk_group:
+            return bulk_group["group_ids"]
+        return [group["id"] for group in bulk_group.get("groups", [])]
+
+    @staticmethod
+    async def _existing_group_ids(group_ids: List[int]) -> List[int]:
+        """ID существующих групп из списка, без повторов и по порядку"""
+        found, _ = await JSONDatabase.get_groups_by_ids(list(set(group_ids)))
+        return sorted(group["id"] for group in found)
+
+    @staticmethod
+    def _join_bulk_group(bulk_group: dict, groups_index: CollectionIndex) -> dict:
+        """Оптомгруппа с актуальными данными групп (удалённые группы пропускаются)"""
+        groups = [
+            _copy(group) for group in (groups_index.get(group_id) for group_id in JSONDatabase._bulk_group_ids(bulk_group))
+            if group is not None
+        ]
+        return {
+            "id": bulk_group["id"],
+            "name": bulk_group["name"],
+            "created_at": bulk_group.get("created_at"),
+            "groups": groups,
+            "group_ids": frozenset(group["id"] for group in groups)
+        }
 
     @staticmethod
     async def add_bulk_group(name: str, group_ids: List[int]) -> int:
         """Добавление новой оптомгруппы"""
-        data = await Database._read_json(BULK_GROUPS_FILE)
-        bulk_groups = data.get("bulk_groups", [])
-        
-        # Генерируем новый ID
-        new_id = max([group.get("id", 0) for group in bulk_groups], default=0) + 1
-        
-        # Получаем полную информацию о группах
-        groups_data = await Database._read_json(GROUPS_FILE)
-        groups = groups_data.get("groups", [])
-        selected_groups = []
+        async with JSONDatabase._lock(BULK_GROUPS_FILE):
+            data = await JSONDatabase._read_json(BULK_GROUPS_FILE)
+            bulk_groups = data.get("bulk_groups", [])
         
-        for group in groups:
-            if group["id"] in group_ids:
-                selected_groups.append({
-                    "id": group["id"],
-                    "group_id": group["group_id"],
-                    "title": group["title"],
-                    "username": group["username"],
-                    "invite_link": group["invite_link"],
-                    "status": group["status"]
-                })
+            # Генерируем новый ID
+            new_id = await JSONDatabase._next_id(BULK_GROUPS_FILE, data, "bulk_groups")
         
-        bulk_group = {
-            "id": new_id,
-            "name": name,
-            "groups": selected_groups,
-            "created_at": int(time.time())
-        }
+            bulk_group = {
+                "id": new_id,
+                "name": name,
+                "group_ids": await JSONDatabase._existing_group_ids(group_ids),
+                "created_at": int(time.time())
+            }
         
-        bulk_groups.append(bulk_group)
-        data["bulk_groups"] = bulk_groups
-        await Database._write_json(BULK_GROUPS_FILE, data)
-        return new_id
+            bulk_groups.append(bulk_group)
+            data["bulk_groups"] = bulk_groups
+            index = await JSONDatabase._get_index(BULK_GROUPS_FILE, "bulk_groups")
+            index.add(bulk_group)
+            await JSONDatabase._write_json(BULK_GROUPS_FILE, data)
+            return new_id
 
     @staticmethod
     async def get_bulk_groups() -> List[dict]:
         """Получение всех оптомгрупп"""
-        data = await Database._read_json(BULK_GROUPS_FILE)
-        return data.get("bulk_groups", [])
+        data = await JSONDatabase._read_json(BULK_GROUPS_FILE)
+        groups_index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+        return [JSONDatabase._join_bulk_group(bg, groups_index) for bg in data.get("bulk_groups", [])]
 
     @staticmethod
     async def get_bulk_group_by_id(bulk_group_id: int) -> Optional[dict]:
         """Получение оптомгруппы по ID"""
-        data = await Database._read_json(BULK_GROUPS_FILE)
-        for bulk_group in data.get("bulk_groups", []):
-            if bulk_group["id"] == bulk_group_id:
-                return bulk_group
-        return None
+        index = await JSONDatabase._get_index(BULK_GROUPS_FILE, "bulk_groups")
+        bulk_group = index.get(bulk_group_id)
+        if bulk_group is None:
+            return None
+        groups_index = await JSONDatabase._get_index(GROUPS_FILE, "groups")
+        return JSONDatabase._join_bulk_group(bulk_group, groups_index)
 
     @staticmethod
     async def update_bulk_group(bulk_group_id: int, name: str = None, group_ids: List[int] = None) -> bool:
         """Обновление оптомгруппы"""
-        try:
-            data = await Database._read_json(BULK_GROUPS_FILE)
-            bulk_groups = data.get("bulk_groups", [])
-            updated = False
+        async with JSONDatabase._lock(BULK_GROUPS_FILE):
+            try:
+                data = await JSONDatabase._read_json(BULK_GROUPS_FILE)
+                index = await JSONDatabase._get_index(BULK_GROUPS_FILE, "bulk_groups")
             
-            # Находим индекс оптомгруппы
-            index = None
-            for i, group in enumerate(bulk_groups):
-                if group["id"] == bulk_group_id:
-                    index = i
-                    break
+                # Находим оптомгруппу
+                bulk_group = index.get(bulk_group_id)
             
-            if index is not None:
-                # Обновляем существующую запись
-                if name is not None:
-                    bulk_groups[index]["name"] = name
-                if group_ids is not None:
-                    # Получаем полную информацию о группах
-                    groups_data = await Database._read_json(GROUPS_FILE)
-                    groups = groups_data.get("groups", [])
-                    selected_groups = []
-                    
-                    for group in groups:
-                        if group["id"] in group_ids:
-                            selected_groups.append({
-                                "id": group["id"],
-                                "group_id": group["group_id"],
-                                "title": group["title"],
-                                "username": group["username"],
-                                "invite_link": group["invite_link"],
-                                "status": group["status"]
-                            })
-                    
-                    bulk_groups[index]["groups"] = selected_groups
-                updated = True
+                if bulk_group is not None:
+                    # Обновляем существующую запись
+                    if name is not None:
+                        bulk_group["name"] = name
+                    if group_ids is not None:
+                        bulk_group["group_ids"] = await JSONDatabase._existing_group_ids(group_ids)
+                        bulk_group.pop("groups", None)
                 
-                # Сохраняем обновленные данные
-                data["bulk_groups"] = bulk_groups
-                await Database._write_json(BULK_GROUPS_FILE, data)
-                return True
+                    # Сохраняем обновленные данные
+                    await JSONDatabase._write_json(BULK_GROUPS_FILE, data)
+                    return True
             
-            return False
+                return False
             
-        except Exception as e:
-            return False
+            except Exception as e:
+                return False
 
     @staticmethod
     async def delete_bulk_group(bulk_group_id: int) -> bool:
         """Удаление оптомгруппы"""
-        try:
-            data = await Database._read_json(BULK_GROUPS_FILE)
-            bulk_groups = data.get("bulk_groups", [])
-            initial_length = len(bulk_groups)
+        async with JSONDatabase._lock(BULK_GROUPS_FILE):
+            try:
+                data = await JSONDatabase._read_json(BULK_GROUPS_FILE)
+                index = await JSONDatabase._get_index(BULK_GROUPS_FILE, "bulk_groups")
+                bulk_group = index.get(bulk_group_id)
+                if bulk_group is None:
+                    return False
             
-            data["bulk_groups"] = [bg for bg in bulk_groups if bg["id"] != bulk_group_id]
-            await Database._write_json(BULK_GROUPS_FILE, data)
+                index.discard(bulk_group)
+                data["bulk_groups"] = [bg for bg in data.get("bulk_groups", []) if bg is not bulk_group]
+                await JSONDatabase._write_json(BULK_GROUPS_FILE, data)
             
-            return len(data["bulk_groups"]) < initial_length
-        except Exception as e:
-            return False 
\ No newline at end of file
+                return True
+            except Exception as e:
+                return False
+
+# Выбор хранилища данных по настройке DATABASE_BACKEND
+if DATABASE_BACKEND == "sqlite":
+    from database.sqlite_db import SQLiteDatabase as Database, init_sqlite_db as init_db
+else:
+    Database = JSONDatabase
+    init_db = init_json_db
+
+# Общий кэш в Redis имеет смысл только для базы, доступной нескольким процессам
+if REDIS_URL and REDIS_CACHE_TTL > 0 and DATABASE_BACKEND == "sqlite":
+    from database.redis_cache import with_redis_cache
+    Database = with_redis_cache(Database)
@@ -0,0 +1,149 @@
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+from config import REDIS_URL, REDIS_CACHE_TTL
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:
+    aioredis = None
+    RedisError = Exception
+
+# Ключи кэша в Redis (общие для всех процессов бота)
+KEY_PREFIX = "poster:cache:"
+GROUP_KEYS = ("groups", "active_groups")
+ACCOUNT_KEYS = ("accounts", "active_accounts")
+SETTINGS_KEYS = ("settings",)
+
+_client = None
+
+def set_redis_client(client):
+    """Подключение к Redis для кэша (например, fakeredis в тестах)"""
+    global _client
+    _client = client
+
+def _get_client():
+    global _client
+    if _client is None:
+        if aioredis is None:
+            raise ImportError("Для REDIS_URL установите пакет redis")
+        _client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+async def _cached(key: str, loader: Callable[[], Awaitable]):
+    """Значение из Redis или из базы (с сохранением в Redis на REDIS_CACHE_TTL секунд).
+
+    При недоступности Redis данные читаются напрямую из базы.
+    """
+    client = _get_client()
+    try:
+        raw = await client.get(KEY_PREFIX + key)
+        if raw is not None:
+            return json.loads(raw)
+    except RedisError as e:
+        logging.warning(f"Кэш Redis недоступен: {str(e)}")
+        return await loader()
+
+    value = await loader()
+    try:
+        await client.set(KEY_PREFIX + key, json.dumps(value, ensure_ascii=False), ex=REDIS_CACHE_TTL)
+    except RedisError as e:
+        logging.warning(f"Не удалось сохранить {key} в кэш Redis: {str(e)}")
+    return value
+
+async def _invalidate(keys: tuple):
+    """Сброс ключей кэша после изменения данных"""
+    try:
+        await _get_client().delete(*(KEY_PREFIX + key for key in keys))
+    except RedisError as e:
+        logging.warning(f"Не удалось сбросить кэш Redis {keys}: {str(e)}")
+
+async def close_redis_cache():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def with_redis_cache(backend):
+    """Хранилище, которое читает группы, аккаунты и настройки через кэш в Redis.
+
+    Кэш общий для всех процессов бота и сбрасывается при изменении
+    соответствующих данных через любой из них.
+    """
+
+    class RedisCachedDatabase(backend):
+        @staticmethod
+        async def get_groups():
+            return await _cached("groups", backend.get_groups)
+
+        @staticmethod
+        async def get_active_groups():
+            return await _cached("active_groups", backend.get_active_groups)
+
+        @staticmethod
+        async def get_accounts():
+            return await _cached("accounts", backend.get_accounts)
+
+        @staticmethod
+        async def get_active_accounts():
+            return await _cached("active_accounts", backend.get_active_accounts)
+
+        @staticmethod
+        async def get_all_settings() -> dict:
+            return await _cached("settings", backend.get_all_settings)
+
+        @staticmethod
+        async def get_setting(key: str) -> Optional[str]:
+            settings = await RedisCachedDatabase.get_all_settings()
+            return settings.get(key)
+
+        @staticmethod
+        async def add_group(*args, **kwargs):
+            result = await backend.add_group(*args, **kwargs)
+            await _invalidate(GROUP_KEYS)
+            return result
+
+        @staticmethod
+        async def delete_group(*args, **kwargs):
+            result = await backend.delete_group(*args, **kwargs)
+            await _invalidate(GROUP_KEYS)
+            return result
+
+        @staticmethod
+        async def update_group_status(*args, **kwargs):
+            result = await backend.update_group_status(*args, **kwargs)
+            await _invalidate(GROUP_KEYS)
+            return result
+
+        @staticmethod
+        async def add_account(*args, **kwargs):
+            result = await backend.add_account(*args, **kwargs)
+            await _invalidate(ACCOUNT_KEYS)
+            return result
+
+        @staticmethod
+        async def update_account_status(*args, **kwargs):
+            result = await backend.update_account_status(*args, **kwargs)
+            await _invalidate(ACCOUNT_KEYS)
+            return result
+
+        @staticmethod
+        async def delete_account(*args, **kwargs):
+            result = await backend.delete_account(*args, **kwargs)
+            await _invalidate(ACCOUNT_KEYS)
+            return result
+
+        @staticmethod
+        async def update_setting(*args, **kwargs):
+            result = await backend.update_setting(*args, **kwargs)
+            await _invalidate(SETTINGS_KEYS)
+            return result
+
+        @staticmethod
+        async def close():
+            await backend.close()
+            await close_redis_cache()
+
+    RedisCachedDatabase.__name__ = f"RedisCached{backend.__name__}"
+    return RedisCachedDatabase
@@ -0,0 +1,127 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import DB_SERIALIZER
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class Serializer:
+    """Формат файлов базы данных"""
+
+    name = ""
+    suffix = ".json"
+    binary = False
+
+    def dumps(self, data: dict):
+        raise NotImplementedError
+
+    def loads(self, content) -> dict:
+        raise NotImplementedError
+
+class JSONSerializer(Serializer):
+    """JSON с отступами - удобно читать и править вручную"""
+
+    name = "json"
+
+    def dumps(self, data: dict) -> str:
+        return json.dumps(data, ensure_ascii=False, indent=4)
+
+    def loads(self, content) -> dict:
+        return json.loads(content)
+
+class CompactJSONSerializer(Serializer):
+    """JSON без отступов; через orjson, если он установлен"""
+
+    name = "compact"
+    binary = orjson is not None
+
+    def dumps(self, data: dict):
+        if orjson is not None:
+            return orjson.dumps(data)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    def loads(self, content) -> dict:
+        if orjson is not None:
+            return orjson.loads(content)
+        return json.loads(content)
+
+class MsgpackSerializer(Serializer):
+    """Двоичный формат MessagePack (нужен пакет msgpack)"""
+
+    name = "msgpack"
+    suffix = ".msgpack"
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("Для DB_SERIALIZER = \"msgpack\" установите пакет msgpack")
+
+    def dumps(self, data: dict) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, content) -> dict:
+        return msgpack.unpackb(content, raw=False, strict_map_key=False)
+
+SERIALIZERS = {
+    JSONSerializer.name: JSONSerializer,
+    CompactJSONSerializer.name: CompactJSONSerializer,
+    MsgpackSerializer.name: MsgpackSerializer
+}
+
+def get_serializer(name: str) -> Serializer:
+    """Сериализатор по имени из настройки DB_SERIALIZER"""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Неизвестный формат базы данных: {name} (доступны: {', '.join(SERIALIZERS)})")
+    return SERIALIZERS[name]()
+
+def available_serializers() -> List[Serializer]:
+    """Сериализаторы, для которых установлены зависимости"""
+    serializers = []
+    for serializer_class in SERIALIZERS.values():
+        try:
+            serializers.append(serializer_class())
+        except ImportError:
+            continue
+    return serializers
+
+SERIALIZER = get_serializer(DB_SERIALIZER)
+
+def storage_path(path: Path) -> Path:
+    """Путь к файлу на диске в текущем формате"""
+    return path.with_suffix(SERIALIZER.suffix)
+
+def stale_paths(path: Path) -> List[Path]:
+    """Копии файла в других форматах (остаются после смены DB_SERIALIZER)"""
+    suffixes = {serializer_class.suffix for serializer_class in SERIALIZERS.values()}
+    suffixes.discard(SERIALIZER.suffix)
+    return [path.with_suffix(suffix) for suffix in sorted(suffixes)]
+
+def find_file(path: Path) -> Optional[Tuple[Path, Serializer]]:
+    """Поиск файла на диске: сначала в текущем формате, затем в остальных"""
+    current = storage_path(path)
+    if current.exists():
+        return current, SERIALIZER
+    readers: Dict[str, type] = {".json": JSONSerializer, ".msgpack": MsgpackSerializer}
+    for candidate in stale_paths(path):
+        if candidate.exists():
+            return candidate, readers[candidate.suffix]()
+    return None
+
+def load_file(path: Path) -> Optional[dict]:
+    """Синхронное чтение файла базы в любом из форматов (для утилит)"""
+    found = find_file(path)
+    if found is None:
+        return None
+    file_path, serializer = found
+    mode = "rb" if serializer.binary else "r"
+    encoding = None if serializer.binary else "utf-8"
+    with open(file_path, mode, encoding=encoding) as f:
+        return serializer.loads(f.read())
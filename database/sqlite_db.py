@@ -0,0 +1,1007 @@
+import json
+import asyncio
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+import aiosqlite
+from config import (
+    DATABASE_PATH, DB_FSYNC_POLICY, DEFAULT_DELAY, MAX_THREADS, MAX_RETRIES,
+    SEND_JOB_LEASE, SEND_JOB_MAX_ATTEMPTS
+)
+from database.indexes import minute_of_day
+
+# Схема SQLite базы данных
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phone TEXT NOT NULL,
+    session_file TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    last_used INTEGER,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_phone ON accounts (phone);
+CREATE INDEX IF NOT EXISTS idx_accounts_status ON accounts (status);
+
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    username TEXT,
+    invite_link TEXT,
+    status TEXT NOT NULL DEFAULT 'active',
+    last_post INTEGER,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_groups_status_title ON groups (status, title);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content TEXT,
+    message TEXT,
+    groups TEXT,
+    accounts TEXT,
+    schedule_time INTEGER,
+    status TEXT,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_status_time ON posts (status, schedule_time);
+
+CREATE TABLE IF NOT EXISTS posts_archive (
+    id INTEGER PRIMARY KEY,
+    content TEXT,
+    message TEXT,
+    groups TEXT,
+    accounts TEXT,
+    schedule_time INTEGER,
+    status TEXT,
+    created_at INTEGER NOT NULL,
+    archived_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_archive_time ON posts_archive (schedule_time);
+
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER NOT NULL,
+    kind TEXT,
+    post_id INTEGER,
+    run INTEGER,
+    group_id TEXT,
+    account_id INTEGER,
+    phone TEXT,
+    outcome TEXT NOT NULL,
+    error TEXT,
+    message_id INTEGER,
+    attempts INTEGER,
+    stages TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_ts ON deliveries (ts);
+CREATE INDEX IF NOT EXISTS idx_deliveries_post ON deliveries (post_id, run);
+
+CREATE TABLE IF NOT EXISTS send_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    run INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    account_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until INTEGER,
+    error TEXT,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    UNIQUE (kind, post_id, run, group_id)
+);
+CREATE INDEX IF NOT EXISTS idx_send_jobs_status ON send_jobs (status, lease_until);
+
+CREATE TABLE IF NOT EXISTS automated_posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message TEXT NOT NULL,
+    groups TEXT NOT NULL,
+    accounts TEXT NOT NULL,
+    times TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    created_at INTEGER NOT NULL,
+    last_fire INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_automated_posts_status ON automated_posts (status);
+
+CREATE TABLE IF NOT EXISTS automated_post_times (
+    minute INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    PRIMARY KEY (minute, post_id)
+);
+CREATE INDEX IF NOT EXISTS idx_automated_post_times_post ON automated_post_times (post_id);
+
+CREATE TABLE IF NOT EXISTS bulk_groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bulk_group_members (
+    bulk_group_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    PRIMARY KEY (bulk_group_id, group_id)
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Поля, хранящиеся в виде JSON
+JSON_FIELDS = ("message", "groups", "accounts", "times", "stages")
+
+# Статусы завершённых постов, которые переносятся в архив
+ARCHIVED_POST_STATUSES = ("sent", "cancelled")
+
+# Настройки по умолчанию
+DEFAULT_SETTINGS = {
+    "default_delay": str(DEFAULT_DELAY),
+    "max_threads": str(MAX_THREADS),
+    "max_retries": str(MAX_RETRIES)
+}
+
+# Режим PRAGMA synchronous по политике fsync (DB_FSYNC_POLICY)
+SYNCHRONOUS_MODES = {"never": "OFF", "snapshot": "NORMAL", "always": "FULL"}
+
+_connection: Optional[aiosqlite.Connection] = None
+_connection_lock = asyncio.Lock()
+_write_lock = asyncio.Lock()
+
+async def _get_connection() -> aiosqlite.Connection:
+    """Возвращает общее подключение к базе, открывая его при первом обращении"""
+    global _connection
+    if _connection is None:
+        async with _connection_lock:
+            if _connection is None:
+                connection = await aiosqlite.connect(DATABASE_PATH)
+                connection.row_factory = aiosqlite.Row
+                await connection.execute("PRAGMA journal_mode=WAL")
+                await connection.execute(
+                    f"PRAGMA synchronous={SYNCHRONOUS_MODES.get(DB_FSYNC_POLICY, 'NORMAL')}"
+                )
+                _connection = connection
+    return _connection
+
+async def init_sqlite_db():
+    """Инициализация SQLite базы данных"""
+    db = await _get_connection()
+    async with _write_lock:
+        await db.executescript(SCHEMA)
+        await _upgrade_bulk_groups(db)
+        await _upgrade_automated_posts(db)
+        # Членство групп, удалённых до того, как delete_group стал чистить оптомгруппы
+        await db.execute("DELETE FROM bulk_group_members WHERE group_id NOT IN (SELECT id FROM groups)")
+        await db.executemany(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+            DEFAULT_SETTINGS.items()
+        )
+        await db.commit()
+
+async def _upgrade_bulk_groups(db: aiosqlite.Connection):
+    """Перенос копий групп из старой колонки bulk_groups.groups в bulk_group_members"""
+    async with db.execute("PRAGMA table_info(bulk_groups)") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if "groups" not in columns:
+        return
+    async with db.execute("SELECT id, groups FROM bulk_groups") as cursor:
+        rows = await cursor.fetchall()
+    await db.executemany(
+        "INSERT OR IGNORE INTO bulk_group_members (bulk_group_id, group_id) VALUES (?, ?)",
+        [
+            (bulk_group_id, group["id"])
+            for bulk_group_id, groups in rows
+            for group in json.loads(groups or "[]")
+        ]
+    )
+
+    # DROP COLUMN есть только в SQLite 3.35+, поэтому таблица пересоздаётся без колонки
+    async with db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'bulk_groups'") as cursor:
+        row = await cursor.fetchone()
+    await db.execute(
+        "CREATE TABLE bulk_groups_new ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, created_at INTEGER NOT NULL)"
+    )
+    await db.execute(
+        "INSERT INTO bulk_groups_new (id, name, created_at) SELECT id, name, created_at FROM bulk_groups"
+    )
+    await db.execute("DROP TABLE bulk_groups")
+    await db.execute("ALTER TABLE bulk_groups_new RENAME TO bulk_groups")
+    if row:
+        # Счётчик ID не должен откатиться к максимальному оставшемуся ID
+        cursor = await db.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'bulk_groups'", (row[0],))
+        if cursor.rowcount == 0:
+            await db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('bulk_groups', ?)", (row[0],))
+
+async def _upgrade_automated_posts(db: aiosqlite.Connection):
+    """Добавление колонки last_fire в базы, созданные до её появления"""
+    async with db.execute("PRAGMA table_info(automated_posts)") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if "last_fire" not in columns:
+        await db.execute("ALTER TABLE automated_posts ADD COLUMN last_fire INTEGER")
+
+    # Индекс минут суток заполняется по расписаниям постов, созданных до его появления
+    async with db.execute("SELECT 1 FROM automated_post_times LIMIT 1") as cursor:
+        if await cursor.fetchone() is not None:
+            return
+    async with db.execute("SELECT id, times FROM automated_posts") as cursor:
+        rows = await cursor.fetchall()
+    for post_id, times in rows:
+        await SQLiteDatabase._set_automated_post_times(db, post_id, json.loads(times))
+
+def _row_to_dict(row: aiosqlite.Row, drop_empty: bool = False) -> dict:
+    """Преобразование строки в словарь с разбором JSON полей"""
+    record = {}
+    for key in row.keys():
+        value = row[key]
+        if value is None and drop_empty:
+            continue
+        if key in JSON_FIELDS and value is not None:
+            value = json.loads(value)
+        record[key] = value
+    return record
+
+def _to_int(value) -> Optional[int]:
+    """Приведение ID к числу (ID в callback'ах приходят строками)"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class SQLiteDatabase:
+    @staticmethod
+    async def _fetch_all(query: str, params: tuple = (), drop_empty: bool = False) -> List[dict]:
+        """Выполнение запроса и получение всех строк"""
+        db = await _get_connection()
+        async with db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+        return [_row_to_dict(row, drop_empty) for row in rows]
+
+    @staticmethod
+    async def _fetch_one(query: str, params: tuple = (), drop_empty: bool = False) -> Optional[dict]:
+        """Выполнение запроса и получение одной строки"""
+        db = await _get_connection()
+        async with db.execute(query, params) as cursor:
+            row = await cursor.fetchone()
+        return _row_to_dict(row, drop_empty) if row else None
+
+    @staticmethod
+    async def _execute(query: str, params: tuple = ()) -> aiosqlite.Cursor:
+        """Выполнение изменяющего запроса в отдельной транзакции"""
+        db = await _get_connection()
+        async with _write_lock:
+            cursor = await db.execute(query, params)
+            await db.commit()
+        return cursor
+
+    @staticmethod
+    async def _fetch_by_ids(table: str, ids: List[int]) -> Tuple[List[dict], List[int]]:
+        """Поиск записей по списку ID одним запросом с сохранением порядка"""
+        keys = [key for key in {_to_int(record_id) for record_id in ids} if key is not None]
+        records = {}
+        if keys:
+            placeholders = ", ".join("?" for _ in keys)
+            rows = await SQLiteDatabase._fetch_all(
+                f"SELECT * FROM {table} WHERE id IN ({placeholders})",
+                tuple(keys)
+            )
+            records = {row["id"]: row for row in rows}
+
+        found = []
+        missing = []
+        for record_id in ids:
+            record = records.get(_to_int(record_id))
+            if record is None:
+                missing.append(record_id)
+            else:
+                found.append(record)
+        return found, missing
+
+    @staticmethod
+    async def flush():
+        """Сохранение изменений на диск (каждая запись уже зафиксирована)"""
+        if _connection is not None:
+            await _connection.commit()
+
+    @staticmethod
+    async def close():
+        """Закрытие подключения к базе"""
+        global _connection
+        if _connection is not None:
+            await _connection.close()
+            _connection = None
+
+    @staticmethod
+    async def add_account(phone: str, session_file: str):
+        """Добавление нового аккаунта"""
+        await SQLiteDatabase._execute(
+            "INSERT INTO accounts (phone, session_file, status, last_used, created_at) "
+            "VALUES (?, ?, 'active', NULL, ?)",
+            (phone, f"{phone}.session", int(time.time()))
+        )
+
+    @staticmethod
+    async def get_active_accounts():
+        """Получение активных аккаунтов"""
+        return await SQLiteDatabase._fetch_all(
+            "SELECT * FROM accounts WHERE status = 'active' ORDER BY id"
+        )
+
+    @staticmethod
+    async def update_account_status(account_id: int, status: str):
+        """Обновление статуса аккаунта"""
+        await SQLiteDatabase._execute(
+            "UPDATE accounts SET status = ?, last_used = ? WHERE id = ?",
+            (status, int(time.time()), _to_int(account_id))
+        )
+
+    @staticmethod
+    async def get_account_by_id(account_id: int):
+        """Получение аккаунта по ID"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM accounts WHERE id = ?",
+            (_to_int(account_id),)
+        )
+
+    @staticmethod
+    async def get_accounts_by_ids(account_ids: List[int]) -> Tuple[List[dict], List[int]]:
+        """Получение аккаунтов по списку ID: (найденные в порядке запроса, ненайденные ID)"""
+        return await SQLiteDatabase._fetch_by_ids("accounts", account_ids)
+
+    @staticmethod
+    async def get_account_by_phone(phone: str):
+        """Получение аккаунта по номеру телефона"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM accounts WHERE phone = ? ORDER BY id LIMIT 1",
+            (phone,)
+        )
+
+    @staticmethod
+    async def delete_account(account_id: int):
+        """Удаление аккаунта"""
+        await SQLiteDatabase._execute(
+            "DELETE FROM accounts WHERE id = ?",
+            (_to_int(account_id),)
+        )
+
+    @staticmethod
+    async def add_group(group_id: str, title: str, username: str = None, invite_link: str = None):
+        """Добавление новой группы (существующая группа с тем же group_id обновляется)"""
+        await SQLiteDatabase._execute(
+            "INSERT INTO groups (group_id, title, username, invite_link, status, last_post, created_at) "
+            "VALUES (?, ?, ?, ?, 'active', NULL, ?) "
+            "ON CONFLICT (group_id) DO UPDATE SET "
+            "title = excluded.title, username = excluded.username, "
+            "invite_link = excluded.invite_link, status = 'active', "
+            "last_post = NULL, created_at = excluded.created_at",
+            (str(group_id), title, username, invite_link, int(time.time()))
+        )
+
+    @staticmethod
+    async def get_active_groups():
+        """Получение активных групп"""
+        return await SQLiteDatabase._fetch_all(
+            "SELECT * FROM groups WHERE status = 'active' ORDER BY title"
+        )
+
+    @staticmethod
+    async def delete_group(group_id: int):
+        """Удаление группы вместе с её членством в оптомгруппах"""
+        db = await _get_connection()
+        key = _to_int(group_id)
+        async with _write_lock:
+            try:
+                await db.execute("DELETE FROM bulk_group_members WHERE group_id = ?", (key,))
+                await db.execute("DELETE FROM groups WHERE id = ?", (key,))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+    @staticmethod
+    async def get_group_by_group_id(group_id: str):
+        """Получение группы по group_id"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM groups WHERE group_id = ?",
+            (str(group_id),)
+        )
+
+    @staticmethod
+    async def update_group_status(group_id: str, status: str):
+        """Обновление статуса группы"""
+        await SQLiteDatabase._execute(
+            "UPDATE groups SET status = ? WHERE group_id = ?",
+            (status, str(group_id))
+        )
+
+    @staticmethod
+    async def add_post(content: str) -> int:
+        """Добавление нового поста"""
+        cursor = await SQLiteDatabase._execute(
+            "INSERT INTO posts (content, created_at) VALUES (?, ?)",
+            (content, int(time.time()))
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    async def get_setting(key: str) -> str:
+        """Получение значения настройки"""
+        row = await SQLiteDatabase._fetch_one(
+            "SELECT value FROM settings WHERE key = ?",
+            (key,)
+        )
+        return row["value"] if row else None
+
+    @staticmethod
+    async def update_setting(key: str, value: str):
+        """Обновление настройки"""
+        await SQLiteDatabase._execute(
+            "INSERT INTO settings (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    @staticmethod
+    async def get_all_settings() -> dict:
+        """Получение всех настроек"""
+        rows = await SQLiteDatabase._fetch_all("SELECT key, value FROM settings")
+        return {row["key"]: row["value"] for row in rows}
+
+    @staticmethod
+    async def add_scheduled_post(
+        message_data: dict,
+        groups: List[int],
+        accounts: List[int],
+        schedule_time: int
+    ) -> int:
+        """Добавление отложенного поста"""
+        cursor = await SQLiteDatabase._execute(
+            "INSERT INTO posts (message, groups, accounts, schedule_time, status, created_at) "
+            "VALUES (?, ?, ?, ?, 'pending', ?)",
+            (
+                json.dumps(message_data, ensure_ascii=False),
+                json.dumps(groups),
+                json.dumps(accounts),
+                schedule_time,
+                int(time.time())
+            )
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    async def get_pending_posts() -> List[dict]:
+        """Получение всех отложенных постов со статусом pending"""
+        return await SQLiteDatabase._fetch_all(
+            "SELECT * FROM posts WHERE status = 'pending' ORDER BY schedule_time",
+            drop_empty=True
+        )
+
+    @staticmethod
+    async def get_post_by_id(post_id: int) -> Optional[dict]:
+        """Получение поста по ID"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM posts WHERE id = ?",
+            (_to_int(post_id),),
+            drop_empty=True
+        )
+
+    @staticmethod
+    async def update_post_status(post_id: int, status: str):
+        """Обновление статуса поста"""
+        await SQLiteDatabase._execute(
+            "UPDATE posts SET status = ? WHERE id = ?",
+            (status, _to_int(post_id))
+        )
+
+    @staticmethod
+    async def delete_post(post_id: int):
+        """Удаление поста"""
+        await SQLiteDatabase._execute(
+            "DELETE FROM posts WHERE id = ?",
+            (_to_int(post_id),)
+        )
+
+    @staticmethod
+    async def archive_finished_posts() -> int:
+        """Перенос отправленных и отменённых постов в архив"""
+        db = await _get_connection()
+        placeholders = ", ".join("?" for _ in ARCHIVED_POST_STATUSES)
+        async with _write_lock:
+            await db.execute(
+                "INSERT OR REPLACE INTO posts_archive "
+                "(id, content, message, groups, accounts, schedule_time, status, created_at, archived_at) "
+                "SELECT id, content, message, groups, accounts, schedule_time, status, created_at, ? "
+                f"FROM posts WHERE status IN ({placeholders})",
+                (int(time.time()), *ARCHIVED_POST_STATUSES)
+            )
+            cursor = await db.execute(
+                f"DELETE FROM posts WHERE status IN ({placeholders})",
+                ARCHIVED_POST_STATUSES
+            )
+            await db.commit()
+        return cursor.rowcount
+
+    @staticmethod
+    async def get_archived_posts(start_time: int = None, end_time: int = None, status: str = None) -> List[dict]:
+        """Получение постов из архива за период (по времени отправки)"""
+        conditions = []
+        params = []
+        if start_time:
+            conditions.append("COALESCE(schedule_time, created_at) >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("COALESCE(schedule_time, created_at) <= ?")
+            params.append(end_time)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await SQLiteDatabase._fetch_all(
+            f"SELECT * FROM posts_archive {where} ORDER BY COALESCE(schedule_time, created_at)",
+            tuple(params),
+            drop_empty=True
+        )
+
+    @staticmethod
+    async def get_archived_post(post_id: int) -> Optional[dict]:
+        """Получение поста из архива по ID"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM posts_archive WHERE id = ?",
+            (_to_int(post_id),),
+            drop_empty=True
+        )
+
+    @staticmethod
+    async def record_delivery(record: dict):
+        """Запись результата попытки отправки в журнал доставки"""
+        await SQLiteDatabase._execute(
+            "INSERT INTO deliveries (ts, kind, post_id, run, group_id, account_id, phone, "
+            "outcome, error, message_id, attempts, stages) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record["ts"], record.get("kind"), record.get("post_id"), record.get("run"),
+                record.get("group_id"), record.get("account_id"), record.get("phone"),
+                record["outcome"], record.get("error"), record.get("message_id"),
+                record.get("attempts"), json.dumps(record.get("stages", {}))
+            )
+        )
+
+    @staticmethod
+    async def get_deliveries(
+        start_time: int = None,
+        end_time: int = None,
+        post_id: int = None,
+        run: int = None,
+        outcome: str = None
+    ) -> List[dict]:
+        """Результаты отправки за период с фильтрами по посту, запуску и результату"""
+        conditions = []
+        params = []
+        if start_time:
+            conditions.append("ts >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("ts <= ?")
+            params.append(end_time)
+        if post_id is not None:
+            conditions.append("post_id = ?")
+            params.append(_to_int(post_id))
+        if run is not None:
+            conditions.append("run = ?")
+            params.append(run)
+        if outcome:
+            conditions.append("outcome = ?")
+            params.append(outcome)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await SQLiteDatabase._fetch_all(
+            f"SELECT * FROM deliveries {where} ORDER BY id",
+            tuple(params),
+            drop_empty=True
+        )
+
+    @staticmethod
+    async def get_failed_deliveries(post_id: int, run: int = None) -> List[dict]:
+        """Последние неудачные попытки по группам поста (для повторной отправки)"""
+        conditions = ["post_id = ?"]
+        params = [_to_int(post_id)]
+        if run is not None:
+            conditions.append("run = ?")
+            params.append(run)
+        where = " AND ".join(conditions)
+        return await SQLiteDatabase._fetch_all(
+            f"SELECT * FROM deliveries WHERE id IN ("
+            f"SELECT MAX(id) FROM deliveries WHERE {where} GROUP BY group_id"
+            ") AND outcome != 'sent' ORDER BY id",
+            tuple(params),
+            drop_empty=True
+        )
+
+    @staticmethod
+    async def enqueue_send_jobs(kind: str, post_id: int, run: int, assignments: List[Tuple[int, int]]) -> int:
+        """Постановка заданий (группа, аккаунт) запуска поста в очередь; уже поставленные группы пропускаются"""
+        now = int(time.time())
+        db = await _get_connection()
+        async with _write_lock:
+            before = db.total_changes
+            await db.executemany(
+                "INSERT OR IGNORE INTO send_jobs (kind, post_id, run, group_id, account_id, status, attempts, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?)",
+                [
+                    (kind, _to_int(post_id), run, _to_int(group_id), _to_int(account_id), now, now)
+                    for group_id, account_id in assignments
+                ]
+            )
+            await db.commit()
+            return db.total_changes - before
+
+    @staticmethod
+    async def claim_send_jobs(kind: str, post_id: int, run: int, limit: int = None) -> List[dict]:
+        """Захват заданий запуска на SEND_JOB_LEASE секунд (свободных и с истёкшей арендой)"""
+        now = int(time.time())
+        key = (kind, _to_int(post_id), run)
+        db = await _get_connection()
+        async with _write_lock:
+            try:
+                # Задания, которые уже брали максимальное число раз и не завершили
+                await db.execute(
+                    "UPDATE send_jobs SET status = 'dead', updated_at = ?, "
+                    "error = COALESCE(error, 'Аренда истекла без подтверждения') "
+                    "WHERE kind = ? AND post_id = ? AND run = ? AND status = 'claimed' "
+                    "AND lease_until <= ? AND attempts >= ?",
+                    (now, *key, now, SEND_JOB_MAX_ATTEMPTS)
+                )
+                async with db.execute(
+                    "SELECT id FROM send_jobs WHERE kind = ? AND post_id = ? AND run = ? "
+                    "AND (status = 'pending' OR (status = 'claimed' AND lease_until <= ?)) "
+                    "ORDER BY id LIMIT ?",
+                    (*key, now, -1 if limit is None else limit)
+                ) as cursor:
+                    ids = [row[0] for row in await cursor.fetchall()]
+                if ids:
+                    placeholders = ", ".join("?" for _ in ids)
+                    await db.execute(
+                        "UPDATE send_jobs SET status = 'claimed', attempts = attempts + 1, "
+                        f"lease_until = ?, updated_at = ? WHERE id IN ({placeholders})",
+                        (now + SEND_JOB_LEASE, now, *ids)
+                    )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        if not ids:
+            return []
+        return await SQLiteDatabase._fetch_all(
+            f"SELECT * FROM send_jobs WHERE id IN ({placeholders}) ORDER BY id",
+            tuple(ids)
+        )
+
+    @staticmethod
+    async def renew_send_job(job_id: int, attempts: int) -> bool:
+        """Продление аренды задания перед отправкой; False - аренду уже перехватил другой захват"""
+        now = int(time.time())
+        cursor = await SQLiteDatabase._execute(
+            "UPDATE send_jobs SET lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'claimed' AND attempts = ?",
+            (now + SEND_JOB_LEASE, now, _to_int(job_id), attempts)
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    async def ack_send_job(job_id: int):
+        """Подтверждение выполненного задания"""
+        await SQLiteDatabase._execute(
+            "UPDATE send_jobs SET status = 'done', lease_until = NULL, updated_at = ? WHERE id = ?",
+            (int(time.time()), _to_int(job_id))
+        )
+
+    @staticmethod
+    async def fail_send_job(job_id: int, error: str, retry: bool = False):
+        """Неудачное задание: возврат в очередь (retry) или в dead-letter"""
+        await SQLiteDatabase._execute(
+            "UPDATE send_jobs SET status = CASE WHEN ? AND attempts < ? THEN 'pending' ELSE 'dead' END, "
+            "lease_until = NULL, error = ?, updated_at = ? WHERE id = ?",
+            (retry, SEND_JOB_MAX_ATTEMPTS, error, int(time.time()), _to_int(job_id))
+        )
+
+    @staticmethod
+    async def defer_send_job(job_id: int, error: str, account_id: int = None):
+        """Возврат задания в очередь без траты попытки (FloodWait), опционально на другой аккаунт"""
+        await SQLiteDatabase._execute(
+            "UPDATE send_jobs SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_until = NULL, "
+            "error = ?, account_id = COALESCE(?, account_id), updated_at = ? WHERE id = ?",
+            (error, _to_int(account_id) if account_id is not None else None, int(time.time()), _to_int(job_id))
+        )
+
+    @staticmethod
+    async def get_send_jobs(kind: str, post_id: int, run: int, status: str = None) -> List[dict]:
+        """Задания запуска поста, опционально с фильтром по статусу"""
+        query = "SELECT * FROM send_jobs WHERE kind = ? AND post_id = ? AND run = ?"
+        params = [kind, _to_int(post_id), run]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        return await SQLiteDatabase._fetch_all(query + " ORDER BY id", tuple(params))
+
+    @staticmethod
+    async def get_dead_send_jobs() -> List[dict]:
+        """Задания в dead-letter"""
+        return await SQLiteDatabase._fetch_all("SELECT * FROM send_jobs WHERE status = 'dead' ORDER BY id")
+
+    @staticmethod
+    async def finish_send_jobs(kind: str, post_id: int, run: int) -> Dict[str, int]:
+        """Удаление выполненных заданий завершённого запуска; задания в dead-letter остаются"""
+        key = (kind, _to_int(post_id), run)
+        db = await _get_connection()
+        async with _write_lock:
+            async with db.execute(
+                "SELECT status, COUNT(*) FROM send_jobs WHERE kind = ? AND post_id = ? AND run = ? "
+                "AND status IN ('done', 'dead') GROUP BY status",
+                key
+            ) as cursor:
+                counts = {"done": 0, "dead": 0, **{row[0]: row[1] for row in await cursor.fetchall()}}
+            await db.execute(
+                "DELETE FROM send_jobs WHERE kind = ? AND post_id = ? AND run = ? AND status = 'done'",
+                key
+            )
+            await db.commit()
+        return counts
+
+    @staticmethod
+    async def get_groups() -> List[dict]:
+        """Получение всех групп"""
+        return await SQLiteDatabase._fetch_all("SELECT * FROM groups ORDER BY id")
+
+    @staticmethod
+    async def get_accounts() -> List[dict]:
+        """Получение всех аккаунтов"""
+        return await SQLiteDatabase._fetch_all("SELECT * FROM accounts ORDER BY id")
+
+    @staticmethod
+    async def get_group_by_id(group_id: str):
+        """Получение группы по внутреннему id"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM groups WHERE id = ?",
+            (_to_int(group_id),)
+        )
+
+    @staticmethod
+    async def get_groups_by_ids(group_ids: List[int]) -> Tuple[List[dict], List[int]]:
+        """Получение групп по списку внутренних ID: (найденные в порядке запроса, ненайденные ID)"""
+        return await SQLiteDatabase._fetch_by_ids("groups", group_ids)
+
+    @staticmethod
+    async def add_automated_post(
+        message_data: dict,
+        groups: List[int],
+        accounts: List[int],
+        times: List[str]
+    ) -> int:
+        """Добавление нового автоматизированного поста"""
+        db = await _get_connection()
+        async with _write_lock:
+            try:
+                cursor = await db.execute(
+                    "INSERT INTO automated_posts (message, groups, accounts, times, status, created_at) "
+                    "VALUES (?, ?, ?, ?, 'active', ?)",
+                    (
+                        json.dumps(message_data, ensure_ascii=False),
+                        json.dumps(groups),
+                        json.dumps(accounts),
+                        json.dumps(times),
+                        int(time.time())
+                    )
+                )
+                await SQLiteDatabase._set_automated_post_times(db, cursor.lastrowid, times)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        return cursor.lastrowid
+
+    @staticmethod
+    async def get_automated_posts() -> List[dict]:
+        """Получение всех автоматизированных постов"""
+        return await SQLiteDatabase._fetch_all("SELECT * FROM automated_posts ORDER BY id")
+
+    @staticmethod
+    async def get_automated_post_by_id(post_id: int) -> Optional[dict]:
+        """Получение автоматизированного поста по ID"""
+        return await SQLiteDatabase._fetch_one(
+            "SELECT * FROM automated_posts WHERE id = ?",
+            (_to_int(post_id),)
+        )
+
+    @staticmethod
+    async def get_automated_posts_at(minute: int) -> List[dict]:
+        """Активные автоматизированные посты, запланированные на минуту суток (0-1439)"""
+        return await SQLiteDatabase._fetch_all(
+            "SELECT automated_posts.* FROM automated_post_times "
+            "JOIN automated_posts ON automated_posts.id = automated_post_times.post_id "
+            "WHERE automated_post_times.minute = ? AND automated_posts.status = 'active' "
+            "ORDER BY automated_posts.id",
+            (minute,)
+        )
+
+    @staticmethod
+    async def get_automated_minutes() -> List[int]:
+        """Минуты суток, на которые запланирован хотя бы один активный автоматизированный пост"""
+        db = await _get_connection()
+        async with db.execute(
+            "SELECT DISTINCT automated_post_times.minute FROM automated_post_times "
+            "JOIN automated_posts ON automated_posts.id = automated_post_times.post_id "
+            "WHERE automated_posts.status = 'active' ORDER BY automated_post_times.minute"
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    @staticmethod
+    async def _set_automated_post_times(db: aiosqlite.Connection, post_id: int, times: List[str]):
+        """Замена минут суток поста в индексе расписания"""
+        await db.execute("DELETE FROM automated_post_times WHERE post_id = ?", (post_id,))
+        minutes = {minute for minute in (minute_of_day(t) for t in times) if minute is not None}
+        await db.executemany(
+            "INSERT INTO automated_post_times (minute, post_id) VALUES (?, ?)",
+            [(minute, post_id) for minute in minutes]
+        )
+
+    @staticmethod
+    async def update_automated_post(
+        post_id: int,
+        groups: List[int] = None,
+        accounts: List[int] = None,
+        times: List[str] = None,
+        status: str = None,
+        message_data: dict = None,
+        last_fire: int = None
+    ):
+        """Обновление автоматизированного поста"""
+        fields = {}
+        if groups is not None:
+            fields["groups"] = json.dumps(sorted(list(set(groups))))  # Убираем дубликаты и сортируем
+        if accounts is not None:
+            fields["accounts"] = json.dumps(sorted(list(set(accounts))))  # Убираем дубликаты и сортируем
+        if times is not None:
+            fields["times"] = json.dumps(sorted(list(set(times))))  # Убираем дубликаты и сортируем
+        if status is not None:
+            fields["status"] = status
+        if message_data is not None:
+            fields["message"] = json.dumps(message_data, ensure_ascii=False)
+        if last_fire is not None:
+            fields["last_fire"] = last_fire  # Последний отработанный слот расписания
+
+        if not fields:
+            return await SQLiteDatabase.get_automated_post_by_id(post_id) is not None
+
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        key = _to_int(post_id)
+        db = await _get_connection()
+        async with _write_lock:
+            try:
+                cursor = await db.execute(
+                    f"UPDATE automated_posts SET {assignments} WHERE id = ?",
+                    (*fields.values(), key)
+                )
+                if cursor.rowcount and times is not None:
+                    await SQLiteDatabase._set_automated_post_times(db, key, times)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        if cursor.rowcount == 0:
+            logging.error(f"Пост с ID {post_id} не найден при обновлении")
+            return False
+        return True
+
+    @staticmethod
+    async def delete_automated_post(post_id: int):
+        """Удаление автоматизированного поста"""
+        db = await _get_connection()
+        key = _to_int(post_id)
+        async with _write_lock:
+            await db.execute("DELETE FROM automated_post_times WHERE post_id = ?", (key,))
+            await db.execute("DELETE FROM automated_posts WHERE id = ?", (key,))
+            await db.commit()
+
+    @staticmethod
+    async def _join_bulk_groups(bulk_groups: List[dict]) -> List[dict]:
+        """Подстановка актуальных данных групп в оптомгруппы одним запросом"""
+        if not bulk_groups:
+            return bulk_groups
+        members = {bg["id"]: [] for bg in bulk_groups}
+        placeholders = ", ".join("?" for _ in members)
+        rows = await SQLiteDatabase._fetch_all(
+            "SELECT bulk_group_members.bulk_group_id AS bulk_group_id, groups.* "
+            "FROM bulk_group_members JOIN groups ON groups.id = bulk_group_members.group_id "
+            f"WHERE bulk_group_members.bulk_group_id IN ({placeholders}) ORDER BY groups.id",
+            tuple(members)
+        )
+        for row in rows:
+            members[row.pop("bulk_group_id")].append(row)
+        for bg in bulk_groups:
+            bg["groups"] = members[bg["id"]]
+            bg["group_ids"] = frozenset(group["id"] for group in bg["groups"])
+        return bulk_groups
+
+    @staticmethod
+    async def _set_bulk_group_members(db: aiosqlite.Connection, bulk_group_id: int, group_ids: List[int]):
+        """Замена состава оптомгруппы (сохраняются только существующие группы)"""
+        await db.execute("DELETE FROM bulk_group_members WHERE bulk_group_id = ?", (bulk_group_id,))
+        ids = {gid for gid in (_to_int(g) for g in group_ids) if gid is not None}
+        await db.executemany(
+            "INSERT INTO bulk_group_members (bulk_group_id, group_id) SELECT ?, id FROM groups WHERE id = ?",
+            [(bulk_group_id, gid) for gid in ids]
+        )
+
+    @staticmethod
+    async def add_bulk_group(name: str, group_ids: List[int]) -> int:
+        """Добавление новой оптомгруппы"""
+        db = await _get_connection()
+        async with _write_lock:
+            try:
+                cursor = await db.execute(
+                    "INSERT INTO bulk_groups (name, created_at) VALUES (?, ?)",
+                    (name, int(time.time()))
+                )
+                await SQLiteDatabase._set_bulk_group_members(db, cursor.lastrowid, group_ids)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        return cursor.lastrowid
+
+    @staticmethod
+    async def get_bulk_groups() -> List[dict]:
+        """Получение всех оптомгрупп"""
+        bulk_groups = await SQLiteDatabase._fetch_all("SELECT * FROM bulk_groups ORDER BY id")
+        return await SQLiteDatabase._join_bulk_groups(bulk_groups)
+
+    @staticmethod
+    async def get_bulk_group_by_id(bulk_group_id: int) -> Optional[dict]:
+        """Получение оптомгруппы по ID"""
+        bulk_group = await SQLiteDatabase._fetch_one(
+            "SELECT * FROM bulk_groups WHERE id = ?",
+            (_to_int(bulk_group_id),)
+        )
+        if bulk_group is None:
+            return None
+        return (await SQLiteDatabase._join_bulk_groups([bulk_group]))[0]
+
+    @staticmethod
+    async def update_bulk_group(bulk_group_id: int, name: str = None, group_ids: List[int] = None) -> bool:
+        """Обновление оптомгруппы"""
+        try:
+            db = await _get_connection()
+            key = _to_int(bulk_group_id)
+            async with _write_lock:
+                async with db.execute("SELECT 1 FROM bulk_groups WHERE id = ?", (key,)) as cursor:
+                    if await cursor.fetchone() is None:
+                        return False
+                try:
+                    if name is not None:
+                        await db.execute("UPDATE bulk_groups SET name = ? WHERE id = ?", (name, key))
+                    if group_ids is not None:
+                        await SQLiteDatabase._set_bulk_group_members(db, key, group_ids)
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+            return True
+
+        except Exception as e:
+            return False
+
+    @staticmethod
+    async def delete_bulk_group(bulk_group_id: int) -> bool:
+        """Удаление оптомгруппы"""
+        try:
+            db = await _get_connection()
+            key = _to_int(bulk_group_id)
+            async with _write_lock:
+                await db.execute("DELETE FROM bulk_group_members WHERE bulk_group_id = ?", (key,))
+                cursor = await db.execute("DELETE FROM bulk_groups WHERE id = ?", (key,))
+                await db.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            return False
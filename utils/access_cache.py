@@ -0,0 +1,43 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+from config import ACCESS_CACHE_TTL, ACCESS_CACHE_NEGATIVE_TTL
+
+class AccessCache:
+    """Кэш результатов check_group_access по парам (аккаунт, группа).
+
+    Права в группе меняются редко, поэтому результат проверки хранится ttl
+    секунд, а отказ (нет прав на отправку, группа приватная) - negative_ttl
+    секунд. Запись удаляется при любой ошибке отправки в группу, и
+    следующая проверка снова спрашивает Telegram.
+    """
+
+    def __init__(self, ttl: int = ACCESS_CACHE_TTL, negative_ttl: int = ACCESS_CACHE_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._results: Dict[Tuple[Any, str], Tuple[bool, str, float]] = {}
+
+    def get(self, account_key, group_id) -> Optional[Tuple[bool, str]]:
+        """Сохранённый результат проверки (None, если его нет или он устарел)"""
+        key = (account_key, str(group_id))
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        can_post, reason, expires = entry
+        if expires <= time.monotonic():
+            del self._results[key]
+            return None
+        return can_post, reason
+
+    def put(self, account_key, group_id, can_post: bool, reason: str) -> Tuple[bool, str]:
+        """Сохранение результата проверки; возвращает его же для return"""
+        ttl = self.ttl if can_post else self.negative_ttl
+        if ttl > 0:
+            self._results[(account_key, str(group_id))] = (can_post, reason, time.monotonic() + ttl)
+        return can_post, reason
+
+    def invalidate(self, account_key, group_id):
+        """Удаление результата проверки после ошибки отправки"""
+        self._results.pop((account_key, str(group_id)), None)
+
+# Общий кэш проверок доступа процесса
+access_cache = AccessCache()
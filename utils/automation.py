@@ -0,0 +1,196 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional, Set
+from loguru import logger
+from config import AUTOMATED_CATCH_UP, AUTOMATED_CATCH_UP_WINDOW
+from database.indexes import minute_of_day
+from utils.scheduler import PostScheduler
+
+def _minutes_of_day(times: Iterable[str]) -> List[int]:
+    """Времена "ЧЧ:ММ" в минутах от начала суток (некорректные пропускаются)"""
+    minutes = set()
+    for value in times:
+        minute = minute_of_day(value)
+        if minute is None:
+            logger.warning(f"Некорректное время автопоста: {value}")
+            continue
+        minutes.add(minute)
+    return sorted(minutes)
+
+def iter_slots(minutes: Iterable[int], after: int) -> Iterator[int]:
+    """Слоты ежедневного расписания (локальное время) строго после after, по возрастанию"""
+    minutes = sorted(set(minutes))
+    if not minutes:
+        return
+    day = datetime.fromtimestamp(after).replace(hour=0, minute=0, second=0, microsecond=0)
+    while True:
+        for minute in minutes:
+            slot = int((day + timedelta(minutes=minute)).timestamp())
+            if slot > after:
+                yield slot
+        day += timedelta(days=1)
+
+def fire_slots(times: Iterable[str], start: int, end: int) -> List[int]:
+    """Слоты расписания в интервале (start, end]"""
+    slots = []
+    for slot in iter_slots(_minutes_of_day(times), start):
+        if slot > end:
+            break
+        slots.append(slot)
+    return slots
+
+def next_fire(times: Iterable[str], after: int) -> Optional[int]:
+    """Ближайший слот расписания после after (None, если времён нет)"""
+    return next(iter_slots(_minutes_of_day(times), after), None)
+
+class AutomationEngine:
+    """Запуск автоматизированных постов по индексу минут суток.
+
+    В таймере стоит по одной записи на минуту суток, в которую запланирован
+    хотя бы один активный пост. Когда минута наступает, её посты берутся из
+    индекса базы (get_automated_posts_at) без перебора всех постов.
+    Отправки слота сначала ставятся в очередь заданий (enqueue), затем слот
+    записывается в last_fire поста и задания выполняются (fire). Поэтому
+    слот не ставится в очередь повторно, а задания слота, прерванного сбоем,
+    дорабатываются после перезапуска. Слоты, пропущенные пока бот был
+    выключен или пока пост ещё отправлялся, обрабатываются по политике
+    catch_up: "skip" - пропустить, "last" - отправить последний, "all" - все
+    по очереди (не старше window секунд).
+    """
+
+    def __init__(
+        self,
+        database,
+        enqueue: Callable[[dict, int], Awaitable],
+        fire: Callable[[dict, int], Awaitable],
+        catch_up: str = AUTOMATED_CATCH_UP,
+        window: int = AUTOMATED_CATCH_UP_WINDOW
+    ):
+        self._db = database
+        self._enqueue = enqueue
+        self._fire = fire
+        self.catch_up = catch_up
+        self.window = window
+        self._scheduler = PostScheduler(self._dispatch)
+        self._in_flight: Set[int] = set()  # ID постов, которые сейчас отправляются
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending_count(self) -> int:
+        """Количество минут суток на таймере"""
+        return self._scheduler.pending_count
+
+    def _arm(self, minute: int, after: int = None):
+        """Постановка минуты суток на таймер до её ближайшего наступления"""
+        after = int(time.time()) if after is None else after
+        self._scheduler.schedule(minute, next(iter_slots([minute], after)))
+
+    def _missed_slot(self, post: dict) -> Optional[int]:
+        """Пропущенный слот поста, который нужно отправить по политике догона"""
+        if self.catch_up not in ("last", "all"):
+            return None
+        now = int(time.time())
+        since = max(post.get('last_fire') or 0, post.get('created_at') or 0)
+        missed = fire_slots(post['times'], max(since, now - self.window), now)
+        if not missed:
+            return None
+        return missed[0] if self.catch_up == "all" else missed[-1]
+
+    async def _unfinished_slot(self, post: dict) -> Optional[int]:
+        """Слот из last_fire, задания которого не доработаны до перезапуска"""
+        slot = post.get('last_fire')
+        if not slot:
+            return None
+        jobs = await self._db.get_send_jobs("automated", post['id'], slot)
+        # Выполненные задания удаляются в конце запуска, в dead-letter - остаются
+        if any(job['status'] != 'dead' for job in jobs):
+            return slot
+        return None
+
+    async def refresh(self, post_id: int):
+        """Постановка на таймер минут поста после создания или изменения расписания"""
+        post = await self._db.get_automated_post_by_id(post_id)
+        if not post or post['status'] != 'active':
+            # Минуты без активных постов снимаются с таймера при наступлении
+            return
+        for minute in _minutes_of_day(post['times']):
+            if self._scheduler.deadline(minute) is None:
+                self._arm(minute)
+
+    async def _dispatch(self, minute: int, slot: int):
+        """Наступила минута суток: отправка всех её постов"""
+        try:
+            posts = await self._db.get_automated_posts_at(minute)
+        except Exception:
+            # Сбой чтения не снимает минуту с таймера, иначе её посты перестанут отправляться
+            self._arm(minute, after=slot)
+            raise
+        if not posts:
+            # Активных постов в эту минуту больше нет - минута снимается с таймера
+            return
+        self._arm(minute, after=slot)
+        await asyncio.gather(*(self._fire_post(post['id'], slot) for post in posts))
+
+    async def _fire_post(self, post_id: int, slot: int, resume: bool = False):
+        """Отправка слота поста и догон слотов, наступивших за время отправки"""
+        if post_id in self._in_flight:
+            if self.catch_up in ("last", "all"):
+                logger.warning(f"Пост #{post_id} ещё отправляется, слот {datetime.fromtimestamp(slot):%H:%M} будет догнан после")
+            else:
+                logger.warning(f"Пост #{post_id} ещё отправляется, слот {datetime.fromtimestamp(slot):%H:%M} пропущен")
+            return
+        self._in_flight.add(post_id)
+        try:
+            while slot is not None:
+                # Пост перечитывается: пока шла отправка, его могли изменить
+                post = await self._db.get_automated_post_by_id(post_id)
+                if not post or post['status'] != 'active':
+                    return
+                if resume:
+                    # Задания слота уже в очереди - только дорабатываем их
+                    logger.info(f"Продолжение отправки слота {datetime.fromtimestamp(slot):%d.%m %H:%M} поста #{post_id}")
+                    resume = False
+                elif (post.get('last_fire') or 0) >= slot:
+                    logger.info(f"Слот {datetime.fromtimestamp(slot):%d.%m %H:%M} поста #{post_id} уже отправлен")
+                    return
+                else:
+                    # Задания ставятся в очередь до записи last_fire: сбой между ними
+                    # не теряет слот, а повторная постановка пропускает уже поставленные группы
+                    await self._enqueue(post, slot)
+                    if not await self._db.update_automated_post(post_id, last_fire=slot):
+                        return
+                    post['last_fire'] = slot
+                try:
+                    await self._fire(post, slot)
+                except Exception as e:
+                    logger.exception(f"Ошибка при отправке автоматизированного поста #{post_id}: {str(e)}")
+                slot = self._missed_slot(post)
+        finally:
+            self._in_flight.discard(post_id)
+
+    def _start(self, post_id: int, slot: int, resume: bool = False):
+        """Отправка слота в фоне (догон при запуске)"""
+        task = asyncio.create_task(self._fire_post(post_id, slot, resume))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self):
+        """Догон пропущенных слотов, загрузка минут расписания и основной цикл таймера"""
+        try:
+            for post in await self._db.get_automated_posts():
+                if post['status'] != 'active':
+                    continue
+                slot = await self._unfinished_slot(post)
+                if slot is not None:
+                    self._start(post['id'], slot, resume=True)
+                    continue
+                slot = self._missed_slot(post)
+                if slot is not None:
+                    self._start(post['id'], slot)
+            for minute in await self._db.get_automated_minutes():
+                self._arm(minute)
+            logger.info(f"В планировщик загружено минут расписания автопостов: {self.pending_count}")
+        except Exception as e:
+            logger.exception(f"Ошибка при загрузке автоматизированных постов: {str(e)}")
+        await self._scheduler.run()
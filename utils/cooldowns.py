@@ -0,0 +1,103 @@
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from config import COOLDOWNS_FILE
+from utils.persistent_state import PersistentState
+
+CooldownKey = Tuple[Any, Optional[str], Optional[str]]  # (аккаунт, группа, действие)
+
+class CooldownRegistry(PersistentState):
+    """Общий реестр пауз аккаунтов для всех рассылок процесса.
+
+    Пауза ставится на весь аккаунт (FloodWait), на одно действие аккаунта
+    (подписки) или на пару аккаунт-группа (медленный режим группы). Ручная
+    рассылка, отложенные и автоматизированные посты и проверка групп перед
+    использованием клиента спрашивают реестр, поэтому FloodWait, полученный
+    в одном потоке, сразу видят остальные. Сроки хранятся во времени эпохи и
+    сохраняются в path, чтобы перезапуск не вызывал повторный FloodWait.
+    """
+
+    def __init__(self, path: Optional[Path] = COOLDOWNS_FILE):
+        super().__init__(path)
+        self._until: Dict[CooldownKey, float] = {}
+        self._reasons: Dict[CooldownKey, str] = {}
+
+    @staticmethod
+    def _key(account_key, group_id=None, action: str = None) -> CooldownKey:
+        return (account_key, None if group_id is None else str(group_id), action)
+
+    def block(self, account_key, seconds: float, group_id=None, action: str = None, reason: str = "FloodWait"):
+        """Пауза аккаунта, его действия или пары аккаунт-группа на seconds секунд"""
+        key = self._key(account_key, group_id, action)
+        until = time.time() + seconds
+        if until <= self._until.get(key, 0):
+            return
+        self._until[key] = until
+        self._reasons[key] = reason
+        target = "все действия" if group_id is None and action is None else (action or f"группа {group_id}")
+        logger.warning(f"Аккаунт {account_key}: {reason}, {target} на паузе {seconds:.0f} сек")
+        self._schedule_save()
+
+    def clear(self, account_key, group_id=None, action: str = None):
+        """Снятие паузы"""
+        key = self._key(account_key, group_id, action)
+        if self._until.pop(key, None) is not None:
+            self._reasons.pop(key, None)
+            self._schedule_save()
+
+    def remaining(self, account_key, group_id=None, action: str = None) -> float:
+        """Сколько секунд ещё действует пауза аккаунта с учётом группы и действия"""
+        keys = [self._key(account_key)]
+        if group_id is not None:
+            keys.append(self._key(account_key, group_id))
+        if action is not None:
+            keys.append(self._key(account_key, action=action))
+        now = time.time()
+        remaining = 0.0
+        for key in keys:
+            until = self._until.get(key)
+            if until is None:
+                continue
+            if until <= now:
+                del self._until[key]
+                self._reasons.pop(key, None)
+                continue
+            remaining = max(remaining, until - now)
+        return remaining
+
+    def available(self, accounts: List[dict]) -> List[dict]:
+        """Аккаунты без паузы; если на паузе все - все, они дождутся её конца в очереди"""
+        ready = [account for account in accounts if self.remaining(account['id']) == 0]
+        return ready or accounts
+
+    def active(self) -> List[dict]:
+        """Действующие паузы (для отчётов)"""
+        now = time.time()
+        return [
+            {
+                "account": account_key,
+                "group_id": group_id,
+                "action": action,
+                "until": until,
+                "reason": self._reasons.get((account_key, group_id, action))
+            }
+            for (account_key, group_id, action), until in self._until.items()
+            if until > now
+        ]
+
+    def _dump(self) -> List[dict]:
+        return self.active()
+
+    def _restore(self, entries: List[dict]):
+        now = time.time()
+        for entry in entries:
+            if entry["until"] > now:
+                key = self._key(entry["account"], entry.get("group_id"), entry.get("action"))
+                self._until[key] = entry["until"]
+                self._reasons[key] = entry.get("reason") or "FloodWait"
+        if self._until:
+            logger.info(f"Загружено действующих пауз аккаунтов: {len(self._until)}")
+
+# Общий реестр пауз процесса
+cooldowns = CooldownRegistry()
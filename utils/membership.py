@@ -0,0 +1,121 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Channel
+from loguru import logger
+from config import MEMBERSHIP_FILE, MEMBERSHIP_RESYNC, MEMBERSHIP_RETRY
+from utils.persistent_state import PersistentState
+
+def channel_id(group_id) -> int:
+    """ID канала без префикса -100"""
+    value = str(group_id)
+    if value.startswith('-100'):
+        value = value[4:]
+    return int(value)
+
+class MembershipIndex(PersistentState):
+    """Индекс групп, в которых состоит каждый аккаунт.
+
+    Индекс аккаунта заполняется один раз из его диалогов (iter_dialogs) и
+    дальше поддерживается по результатам отправок: успешная подписка
+    добавляет группу, UserNotParticipant, бан или закрытие группы - убирают.
+    По индексу send_post не подписывается на группы, где аккаунт уже
+    состоит. Индекс пересобирается из диалогов раз в resync секунд. После
+    неудачной загрузки диалогов следующая попытка - не раньше чем через
+    retry секунд, а до неё подписки аккаунта считаются неизвестными.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = MEMBERSHIP_FILE,
+        resync: int = MEMBERSHIP_RESYNC,
+        retry: int = MEMBERSHIP_RETRY
+    ):
+        super().__init__(path)
+        self.resync = resync
+        self.retry = retry
+        self._groups: Dict[Any, Set[int]] = {}
+        self._synced_at: Dict[Any, float] = {}
+        self._failed_at: Dict[Any, float] = {}  # Время последней неудачной загрузки диалогов
+        self._sync_locks: Dict[Any, asyncio.Lock] = {}
+
+    def is_synced(self, account_key) -> bool:
+        synced_at = self._synced_at.get(account_key)
+        if synced_at is None:
+            return False
+        return not self.resync or time.time() - synced_at < self.resync
+
+    def is_member(self, account_key, group_id) -> Optional[bool]:
+        """Состоит ли аккаунт в группе (None - диалоги аккаунта ещё не загружены)"""
+        if not self.is_synced(account_key):
+            return None
+        return channel_id(group_id) in self._groups.get(account_key, ())
+
+    def add(self, account_key, group_id):
+        """Аккаунт вступил в группу"""
+        groups = self._groups.setdefault(account_key, set())
+        cid = channel_id(group_id)
+        if cid not in groups:
+            groups.add(cid)
+            self._schedule_save()
+
+    def discard(self, account_key, group_id):
+        """Аккаунт больше не состоит в группе (вышел, исключён или группа закрыта)"""
+        groups = self._groups.get(account_key)
+        cid = channel_id(group_id)
+        if groups and cid in groups:
+            groups.discard(cid)
+            logger.info(f"Группа {group_id} убрана из подписок аккаунта {account_key}")
+            self._schedule_save()
+
+    def _backing_off(self, account_key) -> bool:
+        failed_at = self._failed_at.get(account_key)
+        return failed_at is not None and time.time() - failed_at < self.retry
+
+    async def ensure_synced(self, account_key, client):
+        """Загрузка групп аккаунта из его диалогов, если индекс аккаунта пуст или устарел"""
+        if self.is_synced(account_key) or self._backing_off(account_key):
+            return
+        async with self._sync_locks.setdefault(account_key, asyncio.Lock()):
+            if self.is_synced(account_key) or self._backing_off(account_key):
+                return
+            try:
+                groups = set()
+                async for dialog in client.iter_dialogs():
+                    if isinstance(dialog.entity, Channel) and not dialog.entity.left:
+                        groups.add(dialog.entity.id)
+            except FloodWaitError:
+                self._failed_at[account_key] = time.time()
+                raise
+            except Exception as e:
+                self._failed_at[account_key] = time.time()
+                logger.error(f"Не удалось загрузить диалоги аккаунта {account_key}, повтор через {self.retry} сек: {str(e)}")
+                return
+            self._failed_at.pop(account_key, None)
+            self._groups[account_key] = groups
+            self._synced_at[account_key] = time.time()
+            logger.info(f"Аккаунт {account_key} состоит в {len(groups)} группах и каналах")
+            self._schedule_save()
+
+    def _dump(self) -> List[dict]:
+        return [
+            {
+                "account": account_key,
+                "synced_at": self._synced_at.get(account_key),
+                "groups": sorted(groups)
+            }
+            for account_key, groups in self._groups.items()
+        ]
+
+    def _restore(self, entries: List[dict]):
+        for entry in entries:
+            self._groups[entry["account"]] = set(entry["groups"])
+            if entry.get("synced_at"):
+                self._synced_at[entry["account"]] = entry["synced_at"]
+        if self._groups:
+            logger.info(f"Загружены подписки аккаунтов: {len(self._groups)}")
+
+# Общий индекс подписок процесса
+membership = MembershipIndex()
@@ -0,0 +1,73 @@
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from telethon.tl.types import InputPeerChannel
+from loguru import logger
+from config import PEER_CACHE_FILE, PEER_CACHE_TTL
+from utils.persistent_state import PersistentState
+
+class PeerCache(PersistentState):
+    """Кэш сущностей групп по аккаунтам: group_id -> InputPeerChannel.
+
+    access_hash канала у каждого аккаунта свой, поэтому ключ - пара
+    (аккаунт, группа). С сохранённым access_hash запросы к группе идут без
+    get_entity и ResolveUsername, в том числе после переподключения клиента
+    и перезапуска бота. Запись живёт ttl секунд и удаляется при
+    ChannelPrivateError и других ошибках доступа к каналу.
+    """
+
+    def __init__(self, path: Optional[Path] = PEER_CACHE_FILE, ttl: int = PEER_CACHE_TTL):
+        super().__init__(path)
+        self.ttl = ttl
+        self._peers: Dict[Tuple[Any, str], dict] = {}
+
+    def get(self, account_key, group_id) -> Optional[InputPeerChannel]:
+        """Сущность группы для аккаунта (None, если её нет в кэше или она устарела)"""
+        entry = self._peers.get((account_key, str(group_id)))
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry["cached_at"] > self.ttl:
+            self.invalidate(account_key, group_id)
+            return None
+        return InputPeerChannel(entry["channel_id"], entry["access_hash"])
+
+    def put(self, account_key, group_id, entity):
+        """Запоминание сущности канала, полученной через get_entity"""
+        access_hash = getattr(entity, "access_hash", None)
+        channel_id = getattr(entity, "channel_id", None) or getattr(entity, "id", None)
+        if access_hash is None or channel_id is None:
+            return
+        self._peers[(account_key, str(group_id))] = {
+            "channel_id": channel_id,
+            "access_hash": access_hash,
+            "cached_at": int(time.time())
+        }
+        self._schedule_save()
+
+    def invalidate(self, account_key, group_id):
+        """Удаление сущности группы аккаунта из кэша"""
+        if self._peers.pop((account_key, str(group_id)), None) is not None:
+            logger.info(f"Сущность группы {group_id} аккаунта {account_key} удалена из кэша")
+            self._schedule_save()
+
+    def _dump(self) -> List[dict]:
+        return [
+            {"account": account_key, "group_id": group_id, **entry}
+            for (account_key, group_id), entry in self._peers.items()
+        ]
+
+    def _restore(self, entries: List[dict]):
+        now = time.time()
+        for entry in entries:
+            if self.ttl and now - entry["cached_at"] > self.ttl:
+                continue
+            self._peers[(entry["account"], entry["group_id"])] = {
+                "channel_id": entry["channel_id"],
+                "access_hash": entry["access_hash"],
+                "cached_at": entry["cached_at"]
+            }
+        if self._peers:
+            logger.info(f"Загружено сущностей групп в кэш: {len(self._peers)}")
+
+# Общий кэш сущностей групп процесса
+peer_cache = PeerCache()
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Optional
+from loguru import logger
+from config import DB_FLUSH_DELAY
+from database.fileio import atomic_write
+
+class PersistentState:
+    """Состояние процесса в памяти, которое сохраняется в JSON файл в фоне.
+
+    Изменение только помечает состояние грязным; запись идёт отдельной
+    задачей через save_delay секунд, так что серия изменений даёт одну
+    запись. path=None - состояние живёт только в памяти процесса.
+    """
+
+    save_delay = DB_FLUSH_DELAY
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self._save_lock = asyncio.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def _dump(self) -> Any:
+        """Данные для записи в файл"""
+        raise NotImplementedError
+
+    def _restore(self, data: Any):
+        """Восстановление состояния из прочитанного файла"""
+        raise NotImplementedError
+
+    async def load(self):
+        """Загрузка состояния, сохранённого до перезапуска"""
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Не удалось прочитать {self.path}: {str(e)}")
+            return
+        self._restore(data)
+
+    def _schedule_save(self):
+        if self.path is None:
+            return
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_pending())
+
+    async def _save_pending(self):
+        # Изменения, сделанные во время записи, записываются следующим проходом
+        while self._dirty:
+            await asyncio.sleep(self.save_delay)
+            self._dirty = False
+            await self.save()
+
+    async def save(self):
+        """Запись состояния на диск"""
+        if self.path is None:
+            return
+        async with self._save_lock:
+            content = json.dumps(self._dump(), ensure_ascii=False, indent=2)
+            try:
+                await atomic_write(self.path, content)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить {self.path}: {str(e)}")
@@ -1,7 +1,10 @@
 from telethon import TelegramClient
 from telethon.errors import (
     ChatWriteForbiddenError,
+    ChannelInvalidError,
     ChannelPrivateError,
+    FloodWaitError,
+    SlowModeWaitError,
     UserBannedInChannelError,
     MediaInvalidError,
     PhotoInvalidDimensionsError,
@@ -12,24 +15,100 @@ from telethon.tl.functions.channels import JoinChannelRequest
 from telethon.tl.types import InputPeerChannel, InputFile, Message, PeerChannel
 import asyncio
 import os
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Union, Optional
-from config import DEFAULT_DELAY, MAX_RETRIES
+from typing import Awaitable, Callable, List, Dict, Any, Set, Union, Optional, Tuple
+from config import DEFAULT_DELAY, MAX_RETRIES, SEND_PER_ACCOUNT
 from database.models import Database
+from utils.rate_limiter import RateLimiter, rate_limiter
+from utils.peer_cache import PeerCache, peer_cache
+from utils.membership import MembershipIndex, membership as membership_index
+from utils.access_cache import AccessCache, access_cache
 import aiofiles
 import aiohttp
 from loguru import logger
 from aiogram import Bot
 import hashlib
 
+# Ошибки, после которых сохранённый access_hash группы больше не годится
+STALE_PEER_ERRORS = (ChannelPrivateError, ChannelInvalidError)
+# Ошибки, после которых членство аккаунта в группе нужно проверить заново
+# (ChatWriteForbidden Telegram возвращает и после исключения из группы)
+NOT_MEMBER_ERRORS = (UserNotParticipantError, UserBannedInChannelError, ChannelPrivateError, ChatWriteForbiddenError)
+
+class DeliveryTrace:
+    """Длительность этапов и результат отправки одного поста в группу"""
+
+    def __init__(self):
+        self.stages: Dict[str, int] = {}  # Этап -> миллисекунды (с учётом повторов)
+        self.error: Optional[str] = None
+        self.message_id: Optional[int] = None
+        self.attempts = 0
+        self.skipped = False
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        """Завершение этапа: время с предыдущей отметки добавляется к этапу"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0) + int((now - self._last) * 1000)
+        self._last = now
+
 class PostingManager:
-    def __init__(self, client: TelegramClient, db: Database, bot: Bot):
+    def __init__(
+        self,
+        client: TelegramClient,
+        db: Database,
+        bot: Bot,
+        account_id: int,
+        limiter: Optional[RateLimiter] = None,
+        peers: Optional[PeerCache] = None,
+        membership: Optional[MembershipIndex] = None,
+        access: Optional[AccessCache] = None
+    ):
         self.client = client
         self.db = db
         self.bot = bot
+        self.limiter = limiter or rate_limiter
+        self.peers = peers or peer_cache
+        self.membership = membership or membership_index
+        self.access = access or access_cache
+        self.account_id = account_id
+        self.phone: Optional[str] = None  # Номер аккаунта, заполняется check_account_status
+    
+    @property
+    def account_key(self):
+        """Ключ аккаунта в ограничителе частоты, пуле отправок, паузах и кэшах"""
+        return self.account_id
+    
+    async def resolve_group(self, group_data: dict):
+        """Сущность группы для запросов: из кэша аккаунта, иначе по ID или username"""
+        peer = self.peers.get(self.account_key, group_data['group_id'])
+        if peer is not None:
+            return peer
+        
+        channel_id = group_data['group_id']
+        if not str(channel_id).startswith('-100'):
+            channel_id = f"-100{channel_id}"
+        try:
+            entity = await self.client.get_entity(PeerChannel(int(channel_id.replace('-100', ''))))
+        except FloodWaitError:
+            raise
+        except Exception:
+            # По ID сущность известна только после встречи с группой - пробуем username
+            username = group_data.get('username')
+            if not username:
+                raise
+            entity = await self.client.get_entity(f"@{username}")
+        self.peers.put(self.account_key, group_data['group_id'], entity)
+        return entity
         
     async def join_group(self, group_id: str) -> bool:
         try:
+            if not self.limiter.try_acquire(self.account_key, "join"):
+                wait = self.limiter.ready_in(self.account_key, "join")
+                logger.warning(f"Лимит подписок аккаунта {self.account_key} исчерпан, подписка на {group_id} пропущена (ещё {wait:.0f} сек)")
+                return False
+            
             # Получаем информацию о группе из базы данных
             group_data = await self.db.get_group_by_group_id(str(group_id))
             if not group_data:
@@ -41,15 +120,36 @@ class PostingManager:
             if not str(channel_id).startswith('-100'):
                 channel_id = f"-100{channel_id}"
             
+            # Пробуем подписаться по сохранённому access_hash без поиска группы
+            peer = self.peers.get(self.account_key, group_data['group_id'])
+            if peer is not None:
+                try:
+                    await self.client(JoinChannelRequest(peer))
+                    self.membership.add(self.account_key, group_data['group_id'])
+                    logger.info(f"✅ Успешно подписались на группу {group_data.get('title', group_id)}")
+                    return True
+                except FloodWaitError as e:
+                    self.limiter.block(self.account_key, e.seconds, "join")
+                    return False
+                except Exception as e:
+                    if isinstance(e, STALE_PEER_ERRORS):
+                        self.peers.invalidate(self.account_key, group_data['group_id'])
+                    logger.error(f"Не удалось подписаться по сохранённой сущности группы {group_id}: {str(e)}")
+            
             # Пробуем получить username группы
             username = group_data.get('username')
             if username:
                 try:
                     # Пробуем подписаться по username
                     entity = await self.client.get_entity(f"@{username}")
+                    self.peers.put(self.account_key, group_data['group_id'], entity)
                     await self.client(JoinChannelRequest(entity))
+                    self.membership.add(self.account_key, group_data['group_id'])
                     logger.info(f"✅ Успешно подписались на группу @{username}")
                     return True
+                except FloodWaitError as e:
+                    self.limiter.block(self.account_key, e.seconds, "join")
+                    return False
                 except Exception as e:
                     logger.error(f"Не удалось подписаться по username @{username}: {str(e)}")
                     # Продолжаем, попробуем другие методы
@@ -60,8 +160,12 @@ class PostingManager:
                 try:
                     # Пробуем подписаться по invite link
                     await self.client(JoinChannelRequest(invite_link))
+                    self.membership.add(self.account_key, group_data['group_id'])
                     logger.info(f"✅ Успешно подписались на группу по invite link")
                     return True
+                except FloodWaitError as e:
+                    self.limiter.block(self.account_key, e.seconds, "join")
+                    return False
                 except Exception as e:
                     logger.error(f"Не удалось подписаться по invite link: {str(e)}")
                     # Продолжаем, попробуем через ID
@@ -69,9 +173,14 @@ class PostingManager:
             # Если не удалось по username и invite link, пробуем через ID
             try:
                 entity = await self.client.get_entity(PeerChannel(int(channel_id.replace('-100', ''))))
+                self.peers.put(self.account_key, group_data['group_id'], entity)
                 await self.client(JoinChannelRequest(entity))
+                self.membership.add(self.account_key, group_data['group_id'])
                 logger.info(f"✅ Успешно подписались на группу по ID {channel_id}")
                 return True
+            except FloodWaitError as e:
+                self.limiter.block(self.account_key, e.seconds, "join")
+                return False
             except Exception as e:
                 logger.error(f"Не удалось подписаться по ID {channel_id}: {str(e)}")
                 return False
@@ -82,6 +191,10 @@ class PostingManager:
     
     async def check_group_access(self, group_id: str) -> tuple[bool, str]:
         try:
+            # Недавний результат проверки - без запросов к Telegram
+            cached = self.access.get(self.account_key, group_id)
+            if cached is not None:
+                return cached
             logger.info(f"Проверяем доступ к группе {group_id}")
             
             # Получаем информацию о группе из базы данных
@@ -90,28 +203,17 @@ class PostingManager:
                 logger.error(f"Группа с ID {group_id} не найдена в базе данных")
                 return False, "Группа не найдена в базе данных"
             
-            # Форматируем ID группы
-            channel_id = group_data['group_id']
-            if not str(channel_id).startswith('-100'):
-                channel_id = f"-100{channel_id}"
-            
+            title = group_data.get('title', group_id)
             try:
-                # Пробуем получить сущность по ID
-                entity = await self.client.get_entity(PeerChannel(int(channel_id.replace('-100', ''))))
-                logger.info(f"Успешно получили группу: {entity.title}")
+                # Сущность группы из кэша аккаунта, по ID или по username
+                entity = await self.resolve_group(group_data)
+                logger.info(f"Успешно получили группу: {title}")
+            except FloodWaitError as e:
+                self.limiter.block(self.account_key, e.seconds)
+                return False, f"FLOOD_WAIT_{e.seconds}"
             except Exception as e:
-                # Если не получилось по ID, пробуем через username
-                username = group_data.get('username')
-                if username:
-                    try:
-                        entity = await self.client.get_entity(f"@{username}")
-                        logger.info(f"Успешно получили группу по username: {entity.title}")
-                    except Exception as e:
-                        logger.error(f"Не удалось получить группу по username @{username}: {str(e)}")
-                        return False, "Не удалось получить доступ к группе"
-                else:
-                    logger.error(f"Не удалось получить группу по ID {channel_id}: {str(e)}")
-                    return False, "Не удалось получить доступ к группе"
+                logger.error(f"Не удалось получить группу {group_id}: {str(e)}")
+                return False, "Не удалось получить доступ к группе"
             
             try:
                 # Пробуем получить права
@@ -119,36 +221,44 @@ class PostingManager:
                 
                 if not permissions:
                     logger.error(f"Не удалось получить права для группы {group_id}")
-                    return False, "Нет доступа к группе"
+                    return self.access.put(self.account_key, group_id, False, "Нет доступа к группе")
                     
-                logger.info(f"Успешно получили права для группы {entity.title}")
-                return True, "OK"
+                logger.info(f"Успешно получили права для группы {title}")
+                return self.access.put(self.account_key, group_id, True, "OK")
                 
             except UserNotParticipantError:
                 # Если не участник - пробуем подписаться
-                logger.info(f"Аккаунт не подписан на группу {entity.title}, пробуем подписаться")
+                self.membership.discard(self.account_key, group_data['group_id'])
+                logger.info(f"Аккаунт не подписан на группу {title}, пробуем подписаться")
                 try:
                     await self.join_group(group_id)
-                    logger.info(f"Успешно подписались на группу {entity.title}")
+                    logger.info(f"Успешно подписались на группу {title}")
                     
                     # Проверяем права после подписки
                     permissions = await self.client.get_permissions(entity)
                     if permissions:
-                        return True, "Подписались и получили доступ"
+                        return self.access.put(self.account_key, group_id, True, "Подписались и получили доступ")
                     else:
-                        return False, "Подписались, но нет прав на отправку"
+                        return self.access.put(self.account_key, group_id, False, "Подписались, но нет прав на отправку")
                         
                 except Exception as e:
-                    logger.error(f"Не удалось подписаться на группу {entity.title}: {str(e)}")
+                    logger.error(f"Не удалось подписаться на группу {title}: {str(e)}")
                     return False, f"Не удалось подписаться: {str(e)}"
                 
+            except FloodWaitError as e:
+                self.limiter.block(self.account_key, e.seconds)
+                return False, f"FLOOD_WAIT_{e.seconds}"
             except ChatWriteForbiddenError:
                 logger.error(f"Нет прав на отправку сообщений в группу {group_id}")
-                return False, "Нет прав на отправку сообщений"
+                return self.access.put(self.account_key, group_id, False, "Нет прав на отправку сообщений")
             except ChannelPrivateError:
                 logger.warning(f"Группа {group_id} является приватной")
-                return False, "Группа является приватной"
+                self.peers.invalidate(self.account_key, group_data['group_id'])
+                self.membership.discard(self.account_key, group_data['group_id'])
+                return self.access.put(self.account_key, group_id, False, "Группа является приватной")
             except Exception as e:
+                if isinstance(e, STALE_PEER_ERRORS):
+                    self.peers.invalidate(self.account_key, group_data['group_id'])
                 logger.error(f"Ошибка при проверке доступа к группе {group_id}: {str(e)}")
                 return False, "Нет доступа к группе"
                 
@@ -206,23 +316,16 @@ class PostingManager:
     async def check_account_status(self) -> tuple[bool, str]:
         """Проверяет, не заморожен ли аккаунт"""
         try:
-            # Получаем телефон из сессии
-            me = await self.client.get_me()
-            phone = me.phone
-            
-            # Ищем аккаунт по номеру телефона
-            data = await self.db._read_json('database/accounts.json')
-            accounts = data.get('accounts', [])
-            
-            for account in accounts:
-                if account['phone'] == f"+{phone}":
-                    if account['status'] == 'frozen':
-                        logger.warning(f"Аккаунт {account['phone']} заморожен")
-                        return False, account['phone']
-                    return True, account['phone']
+            account = await self.db.get_account_by_id(self.account_id)
+            if account:
+                self.phone = account['phone']
+                if account['status'] == 'frozen':
+                    logger.warning(f"Аккаунт {account['phone']} заморожен")
+                    return False, account['phone']
+                return True, account['phone']
                     
-            logger.warning(f"Аккаунт с номером +{phone} не найден в базе")
-            return True, f"+{phone}"  # Разрешаем отправку если аккаунт не найден
+            logger.warning(f"Аккаунт {self.account_id} не найден в базе")
+            return True, str(self.account_id)  # Разрешаем отправку если аккаунт не найден
             
         except Exception as e:
             logger.error(f"Ошибка при проверке статуса аккаунта: {str(e)}")
@@ -260,13 +363,80 @@ class PostingManager:
         self,
         group_id: str,
         message_data: dict,
+        post_id: Optional[int] = None,
+        kind: str = "instant",
+        run: Optional[int] = None
+    ) -> tuple[bool, str]:
+        """Отправка поста в группу с записью результата в журнал доставки.
+
+        kind - тип рассылки (instant, scheduled, automated), run - метка
+        запуска рассылки, по которой попытки одного запуска отбираются из журнала.
+        """
+        trace = DeliveryTrace()
+        success, message = await self._send_post(group_id, message_data, trace)
+        await self._record_delivery(group_id, success, message, trace, post_id, kind, run)
+        return success, message
+
+    async def _record_delivery(
+        self,
+        group_id: str,
+        success: bool,
+        message: str,
+        trace: DeliveryTrace,
+        post_id: Optional[int],
+        kind: str,
+        run: Optional[int]
+    ):
+        if trace.skipped:
+            outcome = "skipped"
+        else:
+            outcome = "sent" if success else "failed"
+        try:
+            await self.db.record_delivery({
+                "ts": int(time.time()),
+                "kind": kind,
+                "post_id": post_id,
+                "run": run,
+                "group_id": str(group_id),
+                "account_id": self.account_id,
+                "phone": self.phone,
+                "outcome": outcome,
+                "error": None if success else (trace.error or message),
+                "message_id": trace.message_id,
+                "attempts": trace.attempts,
+                "stages": trace.stages
+            })
+        except Exception as e:
+            logger.error(f"Не удалось записать результат отправки в журнал доставки: {str(e)}")
+
+    def _flood_wait(self, e: FloodWaitError, trace: DeliveryTrace) -> tuple[bool, str]:
+        """Блокировка аккаунта до срока FloodWait без повтора: ждать будут задачи вне пула"""
+        trace.error = type(e).__name__
+        self.limiter.block(self.account_key, e.seconds)
+        logger.warning(f"[FloodWait] ⏳ Аккаунт {self.phone} заблокирован Telegram на {e.seconds} сек")
+        return False, f"FLOOD_WAIT_{e.seconds}"
+
+    async def _send_post(
+        self,
+        group_id: str,
+        message_data: dict,
+        trace: DeliveryTrace,
         retry_count: int = 0
     ) -> tuple[bool, str]:
+        trace.attempts += 1
         # Проверяем статус аккаунта перед отправкой
         can_send, phone = await self.check_account_status()
         if not can_send:
             logger.warning(f"Аккаунт {phone} заморожен, пропускаем отправку")
+            trace.skipped = True
             return False, "ACCOUNT_FROZEN"
+        
+        # Пауза аккаунта или медленный режим группы, полученные любой рассылкой
+        cooldown = self.limiter.cooldowns.remaining(self.account_key, group_id)
+        if cooldown > 0:
+            logger.warning(f"Аккаунт {phone} на паузе для группы {group_id} ещё {cooldown:.0f} сек, пропускаем отправку")
+            trace.skipped = True
+            return False, f"COOLDOWN_{int(cooldown)}"
             
         try:
             logger.info(f"[Этап 1/5] Начинаем отправку поста через аккаунт {phone} в группу {group_id}")
@@ -274,6 +444,7 @@ class PostingManager:
             
             # Получаем информацию о группе из базы данных
             group_data = await self.db.get_group_by_group_id(str(group_id))
+            trace.mark("lookup")
             if not group_data:
                 logger.error(f"[Этап 1/5] ❌ Группа с ID {group_id} не найдена в базе данных")
                 return False, "Группа не найдена в базе данных"
@@ -283,31 +454,44 @@ class PostingManager:
             if not str(channel_id).startswith('-100'):
                 channel_id = f"-100{channel_id}"
 
-            # Сначала пробуем подписаться на группу
-            logger.info(f"[Этап 2/5] Попытка подписаться на группу {channel_id}")
-            if not await self.join_group(group_id):
+            # Подписываемся, только если аккаунт ещё не состоит в группе
+            await self.membership.ensure_synced(self.account_key, self.client)
+            if self.membership.is_member(self.account_key, group_data['group_id']):
+                logger.info(f"[Этап 2/5] ✅ Аккаунт уже состоит в группе {channel_id}, подписка не нужна")
+            elif not await self.join_group(group_id):
                 logger.warning(f"[Этап 2/5] ⚠️ Не удалось подписаться на группу {channel_id}, но продолжаем...")
             else:
                 logger.info(f"[Этап 2/5] ✅ Успешно подписались на группу")
                 await asyncio.sleep(2)  # Небольшая задержка после подписки
+            trace.mark("join")
             
+            title = group_data.get('title', group_id)
             try:
-                # Теперь пытаемся получить сущность группы
-                entity = await self.client.get_entity(PeerChannel(int(channel_id.replace('-100', ''))))
-                logger.info(f"[Этап 2/5] ✅ Успешно получили группу: {entity.title}")
+                # Теперь получаем сущность группы (из кэша аккаунта без запроса к Telegram)
+                entity = await self.resolve_group(group_data)
+                logger.info(f"[Этап 2/5] ✅ Успешно получили группу: {title}")
+            except FloodWaitError as e:
+                return self._flood_wait(e, trace)
             except Exception as e:
                 logger.error(f"[Этап 2/5] ❌ Не удалось получить группу: {str(e)}")
+                trace.error = type(e).__name__
                 return False, f"Ошибка при получении группы: {str(e)}"
+            trace.mark("resolve")
             
             # Проверяем права доступа
             can_post, reason = await self.check_group_access(group_id)
+            trace.mark("access")
             if not can_post:
-                logger.error(f"[Этап 2/5] ❌ Нет доступа к группе {entity.title}: {reason}")
+                logger.error(f"[Этап 2/5] ❌ Нет доступа к группе {title}: {reason}")
                 return False, reason
             
-            logger.info(f"[Этап 2/5] ✅ Права доступа подтверждены для {entity.title}")
+            logger.info(f"[Этап 2/5] ✅ Права доступа подтверждены для {title}")
             
             try:
+                # Ждём токен отправки аккаунта
+                await self.limiter.acquire(self.account_key, "send")
+                trace.mark("rate_wait")
+                
                 # Подготавливаем сообщение
                 logger.info("[Этап 3/5] Подготовка сообщения к отправке")
                 
@@ -334,6 +518,7 @@ class PostingManager:
                             # Удаляем временный файл
                             os.remove(temp_path)
                         
+                        trace.mark("prepare")
                         # Отправляем сообщение с фото
                         result = await self.client.send_file(
                             entity,
@@ -362,6 +547,7 @@ class PostingManager:
                             # Удаляем временный файл
                             os.remove(temp_path)
                         
+                        trace.mark("prepare")
                         # Отправляем сообщение с видео
                         result = await self.client.send_file(
                             entity,
@@ -393,6 +579,7 @@ class PostingManager:
                             # Удаляем временный файл
                             os.remove(temp_path)
                         
+                        trace.mark("prepare")
                         # Отправляем сообщение с документом
                         result = await self.client.send_file(
                             entity,
@@ -411,69 +598,266 @@ class PostingManager:
                         text
                     )
                 
+                trace.mark("send")
                 if result:
+                    trace.message_id = getattr(result, 'id', None)
                     end_time = datetime.now()
                     duration = (end_time - start_time).total_seconds()
-                    logger.info(f"[Этап 5/5] ✅ Сообщение успешно отправлено в группу {entity.title}")
+                    logger.info(f"[Этап 5/5] ✅ Сообщение успешно отправлено в группу {title}")
                     logger.info(f"[Статистика] Время выполнения: {duration:.2f} секунд")
                     return True, "OK"
                 else:
                     logger.error("[Этап 4/5] ❌ Сообщение не было отправлено (пустой результат)")
                     return False, "Сообщение не было отправлено"
                     
+            except FloodWaitError as e:
+                trace.mark("send")
+                return self._flood_wait(e, trace)
+            except SlowModeWaitError as e:
+                # Медленный режим действует только на эту группу - остальные отправки аккаунта идут дальше
+                trace.mark("send")
+                trace.error = type(e).__name__
+                self.limiter.cooldowns.block(self.account_key, e.seconds, group_id=group_id, reason="SlowMode")
+                return False, f"SLOW_MODE_WAIT_{e.seconds}"
             except Exception as e:
                 logger.error(f"[Этап 4/5] ❌ Ошибка при отправке сообщения: {str(e)}")
+                trace.mark("send")
+                trace.error = type(e).__name__
+                # Права могли измениться - повтор проверит доступ заново
+                self.access.invalidate(self.account_key, group_id)
+                if isinstance(e, STALE_PEER_ERRORS):
+                    # Повтор получит сущность группы заново
+                    self.peers.invalidate(self.account_key, group_data['group_id'])
+                if isinstance(e, NOT_MEMBER_ERRORS):
+                    # Повтор снова подпишется на группу
+                    self.membership.discard(self.account_key, group_data['group_id'])
                 if retry_count < MAX_RETRIES:
                     retry_delay = DEFAULT_DELAY * (retry_count + 1)
                     logger.info(f"[Повтор] Пробуем отправить снова через {retry_delay} сек (попытка {retry_count + 1}/{MAX_RETRIES})")
                     await asyncio.sleep(retry_delay)
-                    return await self.send_post(group_id, message_data, retry_count + 1)
+                    trace.mark("retry_wait")
+                    return await self._send_post(group_id, message_data, trace, retry_count + 1)
                 return False, str(e)
                 
+        except FloodWaitError as e:
+            return self._flood_wait(e, trace)
         except Exception as e:
             logger.error(f"[Критическая ошибка] ❌ Ошибка при отправке поста: {str(e)}")
+            trace.error = type(e).__name__
             if retry_count < MAX_RETRIES:
                 retry_delay = DEFAULT_DELAY * (retry_count + 1)
                 logger.info(f"[Повтор] Пробуем отправить снова через {retry_delay} сек (попытка {retry_count + 1}/{MAX_RETRIES})")
                 await asyncio.sleep(retry_delay)
-                return await self.send_post(group_id, message_data, retry_count + 1)
+                trace.mark("retry_wait")
+                return await self._send_post(group_id, message_data, trace, retry_count + 1)
             return False, str(e)
 
 class PostingPool:
-    def __init__(self, max_threads: int = 5):
-        self.max_threads = max_threads
-        self.active_tasks: List[asyncio.Task] = []
-    
+    """Ограниченный исполнитель отправок: не больше max_threads одновременно
+    и не больше per_account на один аккаунт.
+
+    Задача ставится в очередь сразу и ждёт свободного места на условии, без
+    опроса по таймеру. Пока аккаунт занят, ограничен по частоте или
+    заблокирован FloodWait, его задачи ждут вне слотов, а задачи других
+    аккаунтов выполняются. Лимит потоков можно менять на лету (resize).
+    """
+
+    def __init__(self, max_threads: int = 5, per_account: int = SEND_PER_ACCOUNT, limiter: Optional[RateLimiter] = None):
+        self.max_threads = max(1, max_threads)
+        self.per_account = max(1, per_account)
+        self.limiter = limiter or rate_limiter
+        self.active_tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._account_in_flight: Dict[Any, int] = {}
+        self._waiting = 0
+        self._changed: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    @property
+    def queue_depth(self) -> int:
+        """Задачи, ожидающие свободного места"""
+        return self._waiting
+
+    @property
+    def in_flight(self) -> int:
+        """Задачи, выполняющиеся сейчас"""
+        return self._in_flight
+
+    def account_in_flight(self, account_key) -> int:
+        """Задачи аккаунта, выполняющиеся сейчас"""
+        return self._account_in_flight.get(account_key, 0)
+
+    async def resize(self, max_threads: int):
+        """Изменение лимита потоков; ожидающие задачи сразу занимают новые места"""
+        condition = self._condition()
+        async with condition:
+            self.max_threads = max(1, max_threads)
+            condition.notify_all()
+
+    def _has_room(self, account_key) -> bool:
+        return (
+            self._in_flight < self.max_threads
+            and self._account_in_flight.get(account_key, 0) < self.per_account
+        )
+
+    async def _run(self, account_key, coro: Awaitable):
+        condition = self._condition()
+        self._waiting += 1
+        try:
+            while True:
+                # Токен и конец блокировки ждём до входа в слот
+                await self.limiter.wait_ready(account_key)
+                async with condition:
+                    await condition.wait_for(lambda: self._has_room(account_key))
+                    if self.limiter.ready_in(account_key) > 0:
+                        continue  # Пока ждали слот, аккаунт получил FloodWait
+                    self._in_flight += 1
+                    self._account_in_flight[account_key] = self._account_in_flight.get(account_key, 0) + 1
+                    break
+        except BaseException:
+            coro.close()
+            raise
+        finally:
+            self._waiting -= 1
+
+        try:
+            return await coro
+        finally:
+            async with condition:
+                self._in_flight -= 1
+                self._account_in_flight[account_key] -= 1
+                if not self._account_in_flight[account_key]:
+                    del self._account_in_flight[account_key]
+                condition.notify_all()
+
+    def submit(self, account_key, coro: Awaitable) -> asyncio.Task:
+        """Постановка корутины в очередь, задача возвращается сразу"""
+        task = asyncio.create_task(self._run(account_key, coro))
+        self.active_tasks.add(task)
+        task.add_done_callback(self.active_tasks.discard)
+        return task
+
     async def add_posting_task(
         self,
         posting_manager: PostingManager,
         group_id: str,
-        message_data: dict
+        message_data: dict,
+        post_id: Optional[int] = None,
+        kind: str = "instant",
+        run: Optional[int] = None
     ):
-        # Очищаем завершенные задачи
-        self.active_tasks = [task for task in self.active_tasks if not task.done()]
-        
         # Проверяем статус аккаунта
         can_send, phone = await posting_manager.check_account_status()
         if not can_send:
             logger.warning(f"Аккаунт {phone} заморожен, пропускаем отправку")
             return None
-            
-        # Если достигнут лимит потоков, ждем освобождения
-        while len(self.active_tasks) >= self.max_threads:
-            await asyncio.sleep(1)
-            self.active_tasks = [task for task in self.active_tasks if not task.done()]
-        
-        # Создаем новую задачу
-        task = asyncio.create_task(
-            posting_manager.send_post(group_id, message_data)
+
+        return self.submit(
+            posting_manager.account_key,
+            posting_manager.send_post(group_id, message_data, post_id, kind, run)
         )
-        self.active_tasks.append(task)
-        
-        return task
-    
+
     async def wait_all(self):
         """Ожидание завершения всех активных задач"""
         if self.active_tasks:
-            await asyncio.gather(*self.active_tasks)
-            self.active_tasks.clear() 
\ No newline at end of file
+            await asyncio.gather(*self.active_tasks, return_exceptions=True)
+
+class FanOut:
+    """Рассылка сообщения по группам параллельно по аккаунтам.
+
+    Группы распределяются между аккаунтами по кругу. Каждый аккаунт
+    берёт клиента из пула один раз на всю рассылку; отправки идут через
+    общий PostingPool, который ограничивает их число всего и на аккаунт.
+    Аккаунты работают параллельно, поэтому время рассылки растёт как
+    групп/аккаунтов, а не как число групп. Группа, отправка в которую
+    упёрлась в FloodWait, передаётся другому аккаунту рассылки.
+    """
+
+    def __init__(self, session_manager, db: Database, bot: Bot, pool: PostingPool):
+        self.session_manager = session_manager
+        self.db = db
+        self.bot = bot
+        self.pool = pool
+
+    @staticmethod
+    def distribute(accounts: List[dict], groups: List[dict]) -> List[Tuple[dict, List[dict]]]:
+        """Распределение групп между аккаунтами по кругу"""
+        batches = [(account, []) for account in accounts]
+        for i, group in enumerate(groups):
+            batches[i % len(batches)][1].append(group)
+        return [(account, batch) for account, batch in batches if batch]
+
+    async def run(
+        self,
+        accounts: List[dict],
+        groups: List[dict],
+        message_data: dict,
+        post_id: Optional[int] = None,
+        kind: str = "instant",
+        run: Optional[int] = None,
+        on_result: Optional[Callable[[dict, dict, bool, str], Awaitable]] = None
+    ) -> Tuple[int, int]:
+        """Отправка во все группы, возвращает (успешно, ошибок)"""
+        counts = {"success": 0, "error": 0}
+        # Аккаунты на паузе после FloodWait в других рассылках не получают групп
+        accounts = self.pool.limiter.cooldowns.available(accounts)
+
+        async def report(account: dict, group: dict, success: bool, message: str):
+            counts["success" if success else "error"] += 1
+            if on_result is not None:
+                await on_result(account, group, success, message)
+
+        active: Dict[Any, dict] = {}  # Аккаунты, которые сейчас держат клиента из пула
+
+        async def send(account: dict, posting_manager: PostingManager, group: dict, tried: Set[Any]):
+            try:
+                success, message = await self.pool.submit(
+                    account['id'],
+                    posting_manager.send_post(str(group['group_id']), message_data, post_id, kind, run)
+                )
+            except Exception as e:
+                success, message = False, str(e)
+
+            if not success and self.pool.limiter.blocked_for(account['id']) > 0:
+                tried = tried | {account['id']}
+                spare = next((
+                    other for other in active.values()
+                    if other['id'] not in tried and self.pool.limiter.blocked_for(other['id']) == 0
+                ), None)
+                if spare is not None:
+                    logger.info(f"Аккаунт {account['phone']} в FloodWait, группа {group['group_id']} передана аккаунту {spare['phone']}")
+                    try:
+                        client = await self.session_manager.acquire(spare['session_file'])
+                    except Exception as e:
+                        logger.error(f"Не удалось получить клиента {spare['phone']}: {str(e)}")
+                    else:
+                        try:
+                            return await send(spare, PostingManager(client, self.db, self.bot, spare['id']), group, tried)
+                        finally:
+                            await self.session_manager.release(spare['session_file'])
+            await report(account, group, success, message)
+
+        async def send_batch(account: dict, batch: List[dict]):
+            try:
+                client = await self.session_manager.acquire(account['session_file'])
+            except Exception as e:
+                for group in batch:
+                    await report(account, group, False, str(e))
+                return
+
+            posting_manager = PostingManager(client, self.db, self.bot, account['id'])
+            active[account['id']] = account
+            try:
+                await asyncio.gather(*(send(account, posting_manager, group, set()) for group in batch))
+            finally:
+                active.pop(account['id'], None)
+                await self.session_manager.release(account['session_file'])
+
+        await asyncio.gather(*(
+            send_batch(account, batch) for account, batch in self.distribute(accounts, groups)
+        ))
+        return counts["success"], counts["error"]
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+from config import SEND_RATE_PER_MINUTE, JOIN_RATE_PER_HOUR
+from utils.cooldowns import CooldownRegistry, cooldowns
+
+class TokenBucket:
+    """Ведро токенов: capacity действий за period секунд с равномерным пополнением"""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period  # Токенов в секунду
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Через сколько секунд будет доступен токен (0 - доступен сейчас)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> bool:
+        """Забрать токен, если он доступен"""
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+class RateLimiter:
+    """Ограничение частоты действий аккаунтов: отправок в минуту и подписок в час.
+
+    У каждого аккаунта своё ведро токенов на каждое действие. После
+    FloodWaitError аккаунт (или только его подписки) ставится на паузу в
+    общем реестре CooldownRegistry до срока, который назвал сервер.
+    Ожидание токена или конца паузы идёт вне слота PostingPool, поэтому
+    пока аккаунт ждёт, слоты занимают другие.
+    Лимит 0 отключает ограничение действия.
+    """
+
+    def __init__(
+        self,
+        sends_per_minute: int = SEND_RATE_PER_MINUTE,
+        joins_per_hour: int = JOIN_RATE_PER_HOUR,
+        registry: Optional[CooldownRegistry] = None
+    ):
+        self.limits: Dict[str, Tuple[int, float]] = {
+            "send": (sends_per_minute, 60),
+            "join": (joins_per_hour, 3600)
+        }
+        self.cooldowns = registry or cooldowns
+        self._buckets: Dict[Tuple[Any, str], TokenBucket] = {}
+
+    def _bucket(self, account_key, action: str) -> Optional[TokenBucket]:
+        capacity, period = self.limits.get(action, (0, 0))
+        if capacity <= 0:
+            return None
+        bucket = self._buckets.get((account_key, action))
+        if bucket is None:
+            bucket = self._buckets[(account_key, action)] = TokenBucket(capacity, period)
+        return bucket
+
+    def block(self, account_key, seconds: float, action: str = None):
+        """Блокировка аккаунта (или одного его действия) на seconds секунд после FloodWaitError"""
+        self.cooldowns.block(account_key, seconds, action=action)
+
+    def blocked_for(self, account_key, action: str = None) -> float:
+        """Сколько секунд ещё действует блокировка аккаунта (с учётом блокировки действия)"""
+        return self.cooldowns.remaining(account_key, action=action)
+
+    def ready_in(self, account_key, action: str = "send") -> float:
+        """Через сколько секунд аккаунт сможет выполнить действие (0 - сейчас)"""
+        bucket = self._bucket(account_key, action)
+        return max(self.blocked_for(account_key, action), bucket.delay() if bucket else 0.0)
+
+    def try_acquire(self, account_key, action: str) -> bool:
+        """Забрать токен действия без ожидания"""
+        if self.blocked_for(account_key, action) > 0:
+            return False
+        bucket = self._bucket(account_key, action)
+        return bucket is None or bucket.take()
+
+    async def wait_ready(self, account_key, action: str = "send"):
+        """Ожидание, пока аккаунт сможет выполнить действие (токен не забирается)"""
+        while True:
+            delay = self.ready_in(account_key, action)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def acquire(self, account_key, action: str = "send"):
+        """Ожидание и получение токена действия"""
+        while not self.try_acquire(account_key, action):
+            await self.wait_ready(account_key, action)
+
+# Общий ограничитель для всех отправок процесса
+rate_limiter = RateLimiter()
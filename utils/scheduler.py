@@ -0,0 +1,80 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+from loguru import logger
+
+class PostScheduler:
+    """Таймер отложенных постов на min-heap по времени отправки.
+
+    Цикл спит до ближайшего schedule_time и просыпается раньше, если пост
+    добавлен или отменён. Наступившие посты отправляются параллельно, каждый
+    в своей задаче. Отменённые посты удаляются из кучи лениво: запись в куче
+    считается актуальной, только если совпадает с _deadlines.
+    """
+
+    def __init__(self, dispatch: Callable[[int, int], Awaitable]):
+        self._dispatch = dispatch
+        self._heap: List[Tuple[int, int]] = []  # (schedule_time, post_id)
+        self._deadlines: Dict[int, int] = {}    # post_id -> актуальное schedule_time
+        self._running: Dict[int, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, post_id: int, schedule_time: int):
+        """Добавление или перенос поста; будит цикл, если пост стал ближайшим"""
+        self._deadlines[post_id] = schedule_time
+        heapq.heappush(self._heap, (schedule_time, post_id))
+        if self._heap[0] == (schedule_time, post_id):
+            self._wakeup.set()
+
+    def cancel(self, post_id: int):
+        """Снятие поста с таймера"""
+        if self._deadlines.pop(post_id, None) is not None:
+            self._wakeup.set()
+
+    def deadline(self, post_id: int):
+        """Запланированное время поста (None, если поста нет на таймере)"""
+        return self._deadlines.get(post_id)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._deadlines)
+
+    def _next_deadline(self):
+        """Ближайшее актуальное время отправки (устаревшие записи выбрасываются)"""
+        while self._heap:
+            schedule_time, post_id = self._heap[0]
+            if self._deadlines.get(post_id) == schedule_time:
+                return schedule_time
+            heapq.heappop(self._heap)
+        return None
+
+    async def run(self):
+        """Основной цикл: ожидание ближайшего поста и запуск отправки"""
+        while True:
+            deadline = self._next_deadline()
+            timeout = None if deadline is None else deadline - time.time()
+            if timeout is None or timeout > 0:
+                # Ничего не наступило - спим до дедлайна или до изменения расписания
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            schedule_time, post_id = heapq.heappop(self._heap)
+            del self._deadlines[post_id]
+            if post_id in self._running:
+                logger.warning(f"Пост #{post_id} уже отправляется, повторный запуск пропущен")
+                continue
+            task = asyncio.create_task(self._run_dispatch(post_id, schedule_time))
+            self._running[post_id] = task
+
+    async def _run_dispatch(self, post_id: int, schedule_time: int):
+        try:
+            await self._dispatch(post_id, schedule_time)
+        except Exception as e:
+            logger.exception(f"Ошибка при отправке отложенного поста #{post_id}: {str(e)}")
+        finally:
+            self._running.pop(post_id, None)
@@ -1,5 +1,6 @@
 from telethon.sync import TelegramClient
 from telethon.sessions import StringSession
+from telethon.tl.functions import PingRequest
 from telethon.errors import (
     PhoneNumberInvalidError,
     PhoneCodeInvalidError,
@@ -9,11 +10,25 @@ from telethon.errors import (
     PhoneCodeExpiredError
 )
 from cryptography.fernet import Fernet
+import asyncio
 import json
 import os
+import random
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
 from loguru import logger
-from config import SESSIONS_DIR, API_ID, API_HASH
+from config import SESSIONS_DIR, API_ID, API_HASH, CLIENT_POOL_MAX, CLIENT_IDLE_TIMEOUT, CLIENT_HEALTH_CHECK
+
+class PooledClient:
+    """Подключённый клиент аккаунта в пуле SessionManager"""
+
+    def __init__(self, client: TelegramClient):
+        self.client = client
+        self.refs = 0  # Сколько вызывающих сейчас используют клиента
+        self.last_used = time.monotonic()
+        self.checked_at = time.monotonic()
 
 class SessionManager:
     def __init__(self):
@@ -22,6 +37,12 @@ class SessionManager:
         self.fernet = Fernet(self.key)
         self.temp_clients = {}  # Временное хранилище клиентов
         self.session_counter = self._get_last_session_number()
+        # Пул долгоживущих подключений: файл сессии -> клиент
+        self._pool: Dict[str, PooledClient] = {}
+        self._pool_locks: Dict[str, asyncio.Lock] = {}
+        self._pool_changed: Optional[asyncio.Condition] = None
+        self._opening = 0  # Подключения, которые сейчас устанавливаются
+        self._sweeper: Optional[asyncio.Task] = None
     
     def _get_or_create_key(self):
         key_file = SESSIONS_DIR / "key.key"
@@ -182,7 +203,118 @@ class SessionManager:
                 pass
             del self.temp_clients[phone]
     
-    async def get_client(self, session_file: str) -> TelegramClient:
+    def _condition(self) -> asyncio.Condition:
+        if self._pool_changed is None:
+            self._pool_changed = asyncio.Condition()
+        return self._pool_changed
+
+    @asynccontextmanager
+    async def client(self, session_file: str) -> AsyncIterator[TelegramClient]:
+        """Клиент аккаунта из пула на время блока with"""
+        client = await self.acquire(session_file)
+        try:
+            yield client
+        finally:
+            await self.release(session_file)
+
+    async def acquire(self, session_file: str) -> TelegramClient:
+        """Выдача подключённого клиента аккаунта из пула; после использования нужен release"""
+        async with self._pool_locks.setdefault(session_file, asyncio.Lock()):
+            entry = self._pool.get(session_file)
+            if entry is not None and not await self._is_healthy(entry):
+                logger.warning(f"Подключение {session_file} не отвечает, переподключаемся")
+                await self._evict(session_file)
+            if self._pool.get(session_file) is not entry:
+                # Пока шла проверка, подключение могли закрыть ради другого аккаунта
+                entry = None
+
+            if entry is None:
+                await self._reserve_slot()
+                try:
+                    client = await self._create_client(session_file)
+                finally:
+                    self._opening -= 1
+                entry = self._pool[session_file] = PooledClient(client)
+                self._start_sweeper()
+
+            entry.refs += 1
+            entry.last_used = time.monotonic()
+            return entry.client
+
+    async def release(self, session_file: str):
+        """Возврат клиента в пул (подключение остаётся открытым)"""
+        entry = self._pool.get(session_file)
+        if entry is None:
+            return
+        entry.refs = max(0, entry.refs - 1)
+        entry.last_used = time.monotonic()
+        if entry.refs == 0:
+            async with self._condition():
+                self._condition().notify_all()
+
+    async def _is_healthy(self, entry: PooledClient) -> bool:
+        """Проверка подключения перед выдачей: переподключение и пинг после простоя"""
+        try:
+            if not entry.client.is_connected():
+                await entry.client.connect()
+            if entry.refs == 0 and time.monotonic() - entry.checked_at >= CLIENT_HEALTH_CHECK:
+                await asyncio.wait_for(entry.client(PingRequest(ping_id=random.getrandbits(63))), 10)
+                entry.checked_at = time.monotonic()
+            return True
+        except Exception as e:
+            logger.debug(f"Проверка подключения не пройдена: {str(e)}")
+            # Клиент, который сейчас используется, не закрываем
+            return entry.refs > 0
+
+    async def _reserve_slot(self):
+        """Ожидание места в пуле: освобождается самое давнее неиспользуемое подключение"""
+        condition = self._condition()
+        async with condition:
+            while len(self._pool) + self._opening >= CLIENT_POOL_MAX:
+                idle = [(entry.last_used, key) for key, entry in self._pool.items() if entry.refs == 0]
+                if idle:
+                    await self._evict(min(idle)[1])
+                    continue
+                logger.info(f"Все {CLIENT_POOL_MAX} подключений заняты, ожидание освобождения")
+                await condition.wait()
+            self._opening += 1
+
+    async def _evict(self, session_file: str):
+        """Закрытие подключения и удаление его из пула"""
+        entry = self._pool.pop(session_file, None)
+        if entry is None:
+            return
+        try:
+            await entry.client.disconnect()
+        except Exception as e:
+            logger.debug(f"Ошибка при отключении {session_file}: {str(e)}")
+
+    def _start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_idle())
+
+    async def _sweep_idle(self):
+        """Закрытие подключений, не использовавшихся дольше CLIENT_IDLE_TIMEOUT"""
+        while self._pool:
+            await asyncio.sleep(min(CLIENT_IDLE_TIMEOUT, 60))
+            now = time.monotonic()
+            for key, entry in list(self._pool.items()):
+                if entry.refs == 0 and now - entry.last_used >= CLIENT_IDLE_TIMEOUT:
+                    logger.info(f"Закрываем неиспользуемое подключение {key}")
+                    await self._evict(key)
+
+    async def close_all(self):
+        """Закрытие всех подключений пула (при остановке бота)"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for key in list(self._pool):
+            await self._evict(key)
+
+    @property
+    def open_count(self) -> int:
+        return len(self._pool)
+
+    async def _create_client(self, session_file: str) -> TelegramClient:
         logger.info(f"Получение клиента для сессии {session_file}")
         try:
             with open(SESSIONS_DIR / session_file, 'r') as f:
@@ -192,6 +324,8 @@ class SessionManager:
             session_str = self.fernet.decrypt(encrypted_session).decode()
             
             client = TelegramClient(StringSession(session_str), API_ID, API_HASH)
+            # FloodWait не пересыпается внутри Telethon, а доходит до ограничителя частоты
+            client.flood_sleep_threshold = 0
             await client.connect()
             
             if not await client.is_user_authorized():